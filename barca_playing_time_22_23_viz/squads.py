@@ -0,0 +1,181 @@
+# IMPORTS
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import time
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import fetcher
+from shared import fragments
+from shared import instrumentation
+
+# CONSTANTS
+SQUADS_PATH = "barca_playing_time_22_23_viz/squads/"
+PAGES_PATH = SQUADS_PATH + "pages/"
+STORE_FILE_PATH = SQUADS_PATH + "squads.npz"
+
+SEASON = 2022
+
+# Transfermarkt URL names and ids of the 2022/23 LaLiga clubs
+CLUBS = {
+    "Barcelona": ("fc-barcelona", 131),
+    "Real Madrid": ("real-madrid", 418),
+    "Atlético Madrid": ("atletico-madrid", 13),
+    "Real Sociedad": ("real-sociedad-san-sebastian", 681),
+    "Villarreal": ("fc-villarreal", 1050),
+    "Betis": ("real-betis-sevilla", 150),
+    "Osasuna": ("ca-osasuna", 331),
+    "Athletic Club": ("athletic-bilbao", 621),
+    "Mallorca": ("rcd-mallorca", 237),
+    "Girona": ("fc-girona", 12321),
+    "Rayo Vallecano": ("rayo-vallecano", 367),
+    "Sevilla": ("fc-sevilla", 368),
+    "Celta Vigo": ("celta-vigo", 940),
+    "Cádiz": ("fc-cadiz", 2687),
+    "Getafe": ("fc-getafe", 3709),
+    "Valencia": ("fc-valencia", 1049),
+    "Almería": ("ud-almeria", 3302),
+    "Valladolid": ("real-valladolid", 366),
+    "Espanyol": ("espanyol-barcelona", 714),
+    "Elche": ("fc-elche", 1531),
+}
+
+# One typed record per squad player
+SquadPlayer = namedtuple("SquadPlayer", ["club", "season", "number", "name", "position", "age", "minutes"])
+
+# FUNCTIONS
+def get_page_url(club, season = SEASON):
+    slug, club_id = CLUBS[club]
+
+    return "https://www.transfermarkt.com/" + slug + "/leistungsdaten/verein/" + str(club_id) + "/reldata/%26" + str(season) + "/plus/1"
+
+def get_page_path(club, season = SEASON):
+    return PAGES_PATH + CLUBS[club][0] + "-" + str(season) + ".html"
+
+def to_int(text, default = -1):
+    text = text.strip().replace("'", "").replace(".", "")
+
+    return int(text) if text.isdigit() else default
+
+def iter_players(html, club = None, season = SEASON):
+    from bs4 import BeautifulSoup
+
+    if (isinstance(html, bytes)):
+        html = html.decode("utf-8")
+
+    # Every player row nests an inline table, so the squad table is cut at its body instead of its first closing table tag
+    table_fragment = fragments.slice_fragment(html, 'class="items"', "</tbody>")
+    if (table_fragment is None):
+        raise ValueError("Squad table not found" + ("" if club is None else " for " + club))
+
+    table_body = BeautifulSoup(table_fragment, "html.parser").find("tbody")
+
+    # Going over the player rows once, every value is read from its own row so nothing relies on lists lining up
+    for row in table_body.find_all("tr", recursive = False):
+        cells = row.find_all("td", recursive = False)
+
+        name = row.find("span", {"class": "hide-for-small"})
+        if (name is None or name.find("a") is None):
+            continue
+
+        number = row.find("div", {"class": "rn_nummer"})
+        position = row.select_one("table.inline-table tr:nth-of-type(2) td")
+        age = next((cell for cell in cells if cell.get("class") == ["zentriert"] and not cell.has_attr("title")), None)
+
+        minutes = 0
+        for cell in cells:
+            # Players who were not used have a single cell spanning every stat
+            if (cell.get("colspan") == "10"):
+                break
+            if (cell.get("class") == ["rechts"]):
+                minutes = to_int(cell.text, 0)
+
+        yield SquadPlayer(club, season, to_int(number.text) if number is not None else -1, name.find("a").text.strip(), position.text.strip() if position is not None else "", to_int(age.text) if age is not None else -1, minutes)
+
+def parse_squad(html, club = None, season = SEASON):
+    return list(iter_players(html, club, season))
+
+def read_store(store_path = STORE_FILE_PATH):
+    if (not os.path.exists(store_path)):
+        return []
+
+    # Decoding the columns back into player records
+    with np.load(store_path) as store:
+        columns = {name: store[name + "_names"][store[name]].tolist() for name in ["club", "name", "position"]}
+        for name in ["season", "number", "age", "minutes"]:
+            columns[name] = store[name].tolist()
+
+    return [SquadPlayer(*values) for values in zip(*[columns[field] for field in SquadPlayer._fields])]
+
+def write_store(players, store_path = STORE_FILE_PATH):
+    # The strings dictionary encoded and the numbers as small integers, the whole league is one compact file
+    arrays = {}
+    for name in ["club", "name", "position"]:
+        names, codes = np.unique(np.array([getattr(player, name) for player in players], dtype = str), return_inverse = True)
+        arrays[name] = codes.astype(np.int32)
+        arrays[name + "_names"] = names
+
+    arrays["season"] = np.array([player.season for player in players], dtype = np.int16)
+    arrays["number"] = np.array([player.number for player in players], dtype = np.int16)
+    arrays["age"] = np.array([player.age for player in players], dtype = np.int16)
+    arrays["minutes"] = np.array([player.minutes for player in players], dtype = np.int32)
+
+    os.makedirs(os.path.dirname(store_path), exist_ok = True)
+
+    with open(store_path + ".tmp", "wb") as file:
+        np.savez_compressed(file, **arrays)
+    os.replace(store_path + ".tmp", store_path)
+
+@instrumentation.phase("fetch")
+def fetch_squads(club_seasons, refresh = False):
+    # Only the squads missing from the storage get fetched, unless they are all revalidated on refresh
+    os.makedirs(PAGES_PATH, exist_ok = True)
+
+    missing = [(club, season) for club, season in club_seasons if refresh or not os.path.exists(get_page_path(club, season))]
+    instrumentation.count("cache_hits", len(club_seasons) - len(missing))
+
+    return fetcher.get_fetcher().fetch_all([get_page_url(club, season) for club, season in missing], [get_page_path(club, season) for club, season in missing])
+
+def parse_stored_squad(club, season):
+    with open(get_page_path(club, season), "rb") as file:
+        return parse_squad(file.read(), club, season)
+
+def ingest(club_seasons, refresh = False, workers = 4):
+    fetch_squads(club_seasons, refresh)
+
+    with instrumentation.phase("parse"):
+        with ThreadPoolExecutor(max_workers = max(1, min(workers, len(club_seasons)))) as executor:
+            squads = list(executor.map(lambda club_season: parse_stored_squad(*club_season), club_seasons))
+
+    # Replacing the stored squads of the ingested clubs and seasons
+    with instrumentation.phase("save"):
+        ingested = set(club_seasons)
+        players = [player for player in read_store() if (player.club, player.season) not in ingested] + [player for squad in squads for player in squad]
+        write_store(players)
+
+    return players
+
+def get_squad(players, club, season = SEASON):
+    return [player for player in players if player.club == club and player.season == season]
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Fetch and extract the squads of every LaLiga club into " + STORE_FILE_PATH)
+    parser.add_argument("--club", action = "append", choices = list(CLUBS.keys()), help = "all 20 clubs by default")
+    parser.add_argument("--season", type = int, default = SEASON, help = "starting year of the season")
+    parser.add_argument("--refresh", action = "store_true", help = "revalidate the stored squad pages")
+    args = parser.parse_args()
+
+    clubs = args.club or list(CLUBS.keys())
+
+    start = time.perf_counter()
+    players = ingest([(club, args.season) for club in clubs], args.refresh)
+    print("Stored {} players of {} squads in {:.2f}s".format(len(players), len(set((player.club, player.season) for player in players)), time.perf_counter() - start))
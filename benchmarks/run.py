@@ -0,0 +1,435 @@
+# IMPORTS
+from datetime import date
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Rendering off-screen, the benchmark never opens a window
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+sys.path.append(os.path.join(parent_dir, "busquets_replacements_comparision"))
+sys.path.append(os.path.join(parent_dir, "messi_busquets_laliga_passes_viz"))
+sys.path.append(os.path.join(parent_dir, "laliga_teams_22_23_gf_ga_viz"))
+sys.path.append(os.path.join(parent_dir, "barca_playing_time_22_23_viz"))
+
+import numpy as np
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from shared import fetcher
+from shared import replay
+
+import report_cache
+import range_store
+import viz_template
+
+import animate
+import density
+import ingest
+import pass_store
+import renderer
+
+# CONSTANTS
+BASELINE_FILE_PATH = "benchmarks/baseline.json"
+RESULTS_FILE_PATH = "benchmarks/results.json"
+
+PASSES_FILE_PATH = "messi_busquets_laliga_passes_viz/passes.csv"
+
+# Player compared against Busquets in the comparision benchmark, every page is answered by the replay server
+COMPARED_PLAYER_SLUG = "Rodri"
+COMPARED_PLAYER_PAGE = "https://fbref.com/en/players/6434f10d/Rodri"
+
+# Nothing gets throttled by the client in the stage benchmarks
+UNLIMITED = {host: (1000, 1000) for host in fetcher.HOST_LIMITS}
+
+# Fetch layer scenarios replayed over every page the vizzes fetch, as (server faults, server host limits, fetcher host limits), the seed makes the injected failures the same on every run
+MANIFEST_FILE_PATH = "busquets_replacements_comparision/manifest.json"
+REPLAY_LIMITS = {"fbref.com": (20, 2), "www.transfermarkt.com": (20, 2)}
+REPLAY_SCENARIOS = {
+    "throughput": ({"latency": 0.05, "jitter": 0.02, "bandwidth": 5e6}, None, UNLIMITED),
+    "retries": ({"failure_rate": 0.3, "drop_rate": 0.1, "retry_after": 0}, None, UNLIMITED),
+    "rate_limit": (None, REPLAY_LIMITS, REPLAY_LIMITS),
+}
+REPLAY_SEED = 1
+REPLAY_BACKOFF_FACTOR = 0.01
+
+# What the replay server saw during the last run of every scenario
+replay_metrics = {}
+
+REPEAT = 5
+
+# Entry scripts whose start-up is measured, on the cache-hit path none of them should need the fetch and parse stack
+IMPORT_SCRIPTS = {
+    "comparision": "busquets_replacements_comparision/viz_template.py",
+    "gfga": "laliga_teams_22_23_gf_ga_viz/viz.py",
+    "playing_time": "barca_playing_time_22_23_viz/viz.py",
+    "passes": "messi_busquets_laliga_passes_viz/viz.py",
+}
+FETCH_MODULES = ["requests", "bs4", "statsbombpy", "textalloc"]
+
+# Top level imports listed per script in the report
+SLOWEST_IMPORTS = 5
+
+# A stage is flagged once it gets this much slower or hungrier than the baseline
+THRESHOLD = 0.25
+
+# Stages faster than this are dominated by noise, their time is never flagged
+MINIMUM_TIME = 0.005
+
+# HELPING FUNCTIONS
+def load_module(name, path):
+    # The GF/GA and playing time scripts are both called viz.py, so they get loaded under their own names
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+gfga_viz = load_module("gfga_viz", "laliga_teams_22_23_gf_ga_viz/viz.py")
+playing_time_viz = load_module("playing_time_viz", "barca_playing_time_22_23_viz/viz.py")
+
+def write_ranges_snapshot(report):
+    # The replay server has no distribution pages, so the snapshot holds every stat's committed min and max, all the radar reads from it
+    min_values, max_values = range_store.load_legacy_ranges()
+    stats = [report.stats[i] for i in range(len(report.stats)) if report.endpoints[i] != ""]
+
+    snapshot_path = range_store.get_snapshot_path(report.table_id, date.today())
+    os.makedirs(os.path.dirname(snapshot_path), exist_ok = True)
+    np.savez_compressed(snapshot_path, stats = np.array(stats), values = np.array([value for pair in zip(min_values, max_values) for value in pair], dtype = np.float32), offsets = np.arange(0, 2 * len(stats) + 1, 2, dtype = np.int64))
+
+def draw(fig):
+    # Rasterizing the figure, so the render stages include the actual drawing and not only the artist setup
+    fig.canvas.draw()
+    plt.close(fig)
+
+def get_import_times(script):
+    # Executing the script's module level code, not its main, in a fresh interpreter, -X importtime writes one line per imported module to stderr
+    code = "import runpy, sys; sys.path.insert(0, {!r}); runpy.run_path({!r}, run_name = 'benchmark')".format(os.path.dirname(script), script)
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output = True, text = True, env = dict(os.environ, MPLBACKEND = "Agg"))
+    if (process.returncode != 0):
+        raise RuntimeError("Could not import " + script + ": " + process.stderr.strip().splitlines()[-1])
+
+    # import time: self [us] | cumulative | imported package, nested imports are indented below the import which triggered them
+    imports = []
+    for line in process.stderr.splitlines():
+        if (not line.startswith("import time:") or "imported package" in line):
+            continue
+
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((name[1:], int(cumulative) / 1e6))
+
+    return imports
+
+# STAGES
+# Every stage takes the state of the previous stages of its viz and stores its own output in it
+def get_comparision_stages(output_path):
+    pages = [viz_template.BUSQUETS_DATA_PAGE, COMPARED_PLAYER_PAGE]
+    slugs = ["Sergio-Busquets", COMPARED_PLAYER_SLUG]
+
+    def fetch(state):
+        state["html"] = [result.content for result in fetcher.get_fetcher().fetch_all(pages)]
+
+    def parse(state):
+        state["reports"] = [report_cache.parse_report(html.decode("utf-8"), slug, report_cache.get_content_hash(html)) for html, slug in zip(state["html"], slugs)]
+
+    def load(state):
+        # The cached path the vizzes take on every run after the first one
+        state["players"] = [viz_template.load_player("https://fbref.com/en/players/x/" + slug) for slug in slugs]
+
+    def ranges(state):
+        # The snapshot gets written during the warm-up, the timed runs take the path of a stored snapshot
+        report = state["players"][0].report
+        if (len(range_store.list_snapshots(report.table_id)) == 0):
+            write_ranges_snapshot(report)
+
+        state["ranges"] = viz_template.load_ranges(report)
+
+    def render(state):
+        # The comparision saves itself, which already rasterizes it
+        plt.close(viz_template.render_comparision(state["players"][0], state["players"][1], *state["ranges"], output_path))
+
+    return [("fetch", fetch), ("parse", parse), ("load", load), ("ranges", ranges), ("render", render)]
+
+def get_gfga_stages():
+    def fetch(state):
+        state["html"] = gfga_viz.fetch_page()
+
+    def parse(state):
+        state["clubs"] = gfga_viz.parse_clubs(state["html"])
+
+    def render(state):
+        draw(gfga_viz.render(*state["clubs"]))
+
+    return [("fetch", fetch), ("parse", parse), ("render", render)]
+
+def get_playing_time_stages():
+    def fetch(state):
+        state["html"] = playing_time_viz.fetch_page()
+
+    def parse(state):
+        state["players"] = playing_time_viz.parse_players(state["html"])
+
+    def render(state):
+        draw(playing_time_viz.render(*state["players"]))
+
+    return [("fetch", fetch), ("parse", parse), ("render", render)]
+
+def get_passes_stages(store_path):
+    def load_csv(state):
+        state["passes"] = pd.read_csv(PASSES_FILE_PATH)
+
+    def filter(state):
+        state["passes"] = ingest.filter_passes(state["passes"])
+
+    def write_store(state):
+        pass_store.write_store(state["passes"], store_path)
+
+    def load_store(state):
+        state["store"] = pass_store.load_store(store_path)
+
+    def render(state):
+        fig, ax = renderer.create_pass_map("BUSQUETS' PASSES TO MESSI", "LaLiga")
+        renderer.draw_passes(ax, *pass_store.get_coordinates(state["store"]))
+        renderer.add_pass_totals(ax, state["store"]["rows"], int(pass_store.get_incomplete(state["store"]).sum()))
+        draw(fig)
+
+    def heatmap(state):
+        x, y, end_x, end_y, incomplete = pass_store.get_coordinates(state["store"])
+        state["density"] = density.get_density(x, y)
+        state["zones"] = density.get_zones(x, y, end_x, end_y, incomplete)
+
+    def animation(state):
+        fig, stats = animate.animate(state["store"], "BUSQUETS' PASSES TO MESSI", "LaLiga", store_path + "animation.gif")
+        plt.close(fig)
+
+    return [("load_csv", load_csv), ("filter", filter), ("write_store", write_store), ("load_store", load_store), ("render", render), ("heatmap", heatmap), ("animation", animation)]
+
+def get_replay_stages(server):
+    with open(MANIFEST_FILE_PATH, "r", encoding = "utf-8") as file:
+        pages = [viz_template.BUSQUETS_DATA_PAGE] + [comparision["page"] for comparision in json.load(file)["comparisions"]] + list(replay.FIXTURES.keys())
+
+    def get_stage(name, faults, host_limits, client_limits):
+        # Every scenario fetches all the pages through a fresh fetcher, so no token or session carries over
+        def stage(state):
+            server.configure(faults, host_limits, REPLAY_SEED)
+            results = fetcher.Fetcher(host_limits = client_limits, validators_path = None, backoff_factor = REPLAY_BACKOFF_FACTOR, replay_url = server.get_url()).fetch_all(pages)
+
+            replay_metrics[name] = {"pages": len(results), "retries": sum(result.attempts - 1 for result in results), "hosts": server.get_metrics()}
+
+        return stage
+
+    return [(name, get_stage(name, *scenario)) for name, scenario in REPLAY_SCENARIOS.items()]
+
+# FUNCTIONS
+def run_stages(stages, repeat):
+    times = {name: [] for name, stage in stages}
+
+    # One untimed warm-up pass, so lazy imports, font lookups and the first connection do not end up in the timings
+    state = {}
+    for name, stage in stages:
+        stage(state)
+
+    for i in range(repeat):
+        state = {}
+        for name, stage in stages:
+            start = time.perf_counter()
+            stage(state)
+            times[name].append(time.perf_counter() - start)
+
+    # Measuring the peak memory in a separate pass, tracemalloc slows the stages down
+    peak_memory = {}
+    state = {}
+    for name, stage in stages:
+        tracemalloc.start()
+        stage(state)
+        peak_memory[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {name: {"time": statistics.median(times[name]), "min_time": min(times[name]), "peak_memory": peak_memory[name]} for name, stage in stages}
+
+def run_imports(repeat, vizzes = None):
+    results = {}
+
+    for viz, script in IMPORT_SCRIPTS.items():
+        if (vizzes is not None and viz not in vizzes):
+            continue
+
+        runs = [get_import_times(script) for i in range(repeat)]
+
+        # Only the top level imports add up to the start-up time, the nested ones are part of their cumulative time
+        totals = [sum(cumulative for name, cumulative in imports if not name.startswith(" ")) for imports in runs]
+        names = set(name.strip() for name, cumulative in runs[0])
+        top_level = sorted([(name, cumulative) for name, cumulative in runs[0] if not name.startswith(" ")], key = lambda imported: imported[1], reverse = True)
+
+        results[viz] = {
+            "time": statistics.median(totals),
+            "min_time": min(totals),
+            "modules": len(names),
+            "fetch_modules": [module for module in FETCH_MODULES if module in names],
+            "slowest": top_level[:SLOWEST_IMPORTS],
+        }
+
+    return results
+
+def run(repeat = REPEAT, vizzes = None):
+    server = replay.start(port = 0)
+
+    # Every page comes from the replay server, nothing gets throttled or remembered between the runs
+    fetcher.default_fetcher = fetcher.Fetcher(host_limits = UNLIMITED, validators_path = None, replay_url = server.get_url())
+
+    # Keeping every written file out of the repo
+    temp_dir = tempfile.mkdtemp(prefix = "benchmarks_")
+    report_cache.REPORTS_PATH = os.path.join(temp_dir, "reports") + "/"
+    range_store.RANGES_PATH = os.path.join(temp_dir, "ranges") + "/"
+
+    output_path = os.path.join(temp_dir, "comparision")
+    os.makedirs(output_path)
+
+    suites = {
+        "comparision": get_comparision_stages(output_path),
+        "gfga": get_gfga_stages(),
+        "playing_time": get_playing_time_stages(),
+        "passes": get_passes_stages(os.path.join(temp_dir, "passes") + "/"),
+        "replay": get_replay_stages(server),
+    }
+
+    results = {}
+    try:
+        for viz, stages in suites.items():
+            if (vizzes is not None and viz not in vizzes):
+                continue
+
+            for name, result in run_stages(stages, repeat).items():
+                results[viz + "." + name] = result
+    finally:
+        server.shutdown()
+        shutil.rmtree(temp_dir, ignore_errors = True)
+
+    return {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()},
+        "repeat": repeat,
+        "stages": results,
+        "imports": run_imports(repeat, vizzes),
+        "replay": dict(replay_metrics),
+    }
+
+def get_regressions(results, baseline, threshold = THRESHOLD):
+    regressions = []
+
+    for name, result in results["stages"].items():
+        if (name not in baseline["stages"]):
+            continue
+
+        expected = baseline["stages"][name]
+
+        if (result["time"] >= MINIMUM_TIME and result["time"] > expected["time"] * (1 + threshold)):
+            regressions.append((name, "time", expected["time"], result["time"]))
+
+        if (result["peak_memory"] > expected["peak_memory"] * (1 + threshold)):
+            regressions.append((name, "peak_memory", expected["peak_memory"], result["peak_memory"]))
+
+    # Start-up regresses when it gets slower, or when a fetch or parse module creeps back into a script's imports
+    for viz, result in results.get("imports", {}).items():
+        if (viz not in baseline.get("imports", {})):
+            continue
+
+        expected = baseline["imports"][viz]
+
+        if (result["time"] > expected["time"] * (1 + threshold)):
+            regressions.append(("imports." + viz, "time", expected["time"], result["time"]))
+
+        if (len(set(result["fetch_modules"]) - set(expected["fetch_modules"])) > 0):
+            regressions.append(("imports." + viz, "fetch_modules", len(expected["fetch_modules"]), len(result["fetch_modules"])))
+
+    # A fetcher keeping the limits of a host is never throttled by it, whatever the baseline says
+    for name, result in results.get("replay", {}).items():
+        throttled = sum(host["throttled"] for host in result["hosts"].values())
+        if (REPLAY_SCENARIOS[name][1] is not None and throttled > 0):
+            regressions.append(("replay." + name, "throttled", 0, throttled))
+
+    return regressions
+
+def print_results(results, baseline = None):
+    print("{:<30} {:>10} {:>10} {:>12} {:>10}".format("stage", "time", "min", "peak memory", "vs base"))
+
+    for name, result in results["stages"].items():
+        change = ""
+        if (baseline is not None and name in baseline["stages"] and baseline["stages"][name]["time"] > 0):
+            change = "{:+.0%}".format(result["time"] / baseline["stages"][name]["time"] - 1)
+
+        print("{:<30} {:>9.3f}s {:>9.3f}s {:>9.2f} MB {:>10}".format(name, result["time"], result["min_time"], result["peak_memory"] / 1e6, change))
+
+    if (len(results.get("replay", {})) > 0):
+        print()
+        print("{:<30} {:>8} {:>8} {:>10} {:>10} {:>8} {:>8} {:>12}".format("replay", "pages", "requests", "retries", "throttled", "failed", "dropped", "rate (req/s)"))
+
+        for name, result in results["replay"].items():
+            hosts = result["hosts"].values()
+            print("{:<30} {:>8} {:>8} {:>10} {:>10} {:>8} {:>8} {:>12.2f}".format(name, result["pages"], sum(host["requests"] for host in hosts), result["retries"], sum(host["throttled"] for host in hosts), sum(host["failures"] for host in hosts), sum(host["drops"] for host in hosts), max([host["request_rate"] for host in hosts], default = 0)))
+
+    if (len(results.get("imports", {})) == 0):
+        return
+
+    print()
+    print("{:<30} {:>10} {:>10} {:>8} {:>10}  {}".format("imports", "time", "min", "modules", "vs base", "fetch and parse modules"))
+
+    for viz, result in results["imports"].items():
+        change = ""
+        if (baseline is not None and viz in baseline.get("imports", {}) and baseline["imports"][viz]["time"] > 0):
+            change = "{:+.0%}".format(result["time"] / baseline["imports"][viz]["time"] - 1)
+
+        print("{:<30} {:>9.3f}s {:>9.3f}s {:>8} {:>10}  {}".format(viz, result["time"], result["min_time"], result["modules"], change, ", ".join(result["fetch_modules"]) or "-"))
+        for name, cumulative in result["slowest"]:
+            print("    {:<26} {:>9.3f}s".format(name, cumulative))
+
+def save_results(results, path):
+    with open(path, "w", encoding = "utf-8") as file:
+        json.dump(results, file, indent = 4)
+
+# RUN
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the fetch, parse, transform and render stages of every viz offline")
+    parser.add_argument("--repeat", type = int, default = REPEAT)
+    parser.add_argument("--viz", action = "append", choices = ["comparision", "gfga", "playing_time", "passes", "replay"], help = "only benchmark these vizzes, replay runs the fetch layer scenarios")
+    parser.add_argument("--baseline", default = BASELINE_FILE_PATH)
+    parser.add_argument("--output", default = RESULTS_FILE_PATH)
+    parser.add_argument("--threshold", type = float, default = THRESHOLD, help = "relative slowdown or memory growth flagged as a regression")
+    parser.add_argument("--save-baseline", action = "store_true", help = "store this run as the new baseline")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.viz)
+
+    baseline = None
+    if (os.path.exists(args.baseline)):
+        with open(args.baseline, "r", encoding = "utf-8") as file:
+            baseline = json.load(file)
+
+    print_results(results, baseline)
+    save_results(results, args.output)
+
+    if (args.save_baseline):
+        save_results(results, args.baseline)
+        print("Stored the baseline in " + args.baseline)
+        sys.exit(0)
+
+    if (baseline is None):
+        print("No baseline in " + args.baseline + ", run with --save-baseline to create one")
+        sys.exit(0)
+
+    regressions = get_regressions(results, baseline, args.threshold)
+    for name, metric, expected, actual in regressions:
+        print("REGRESSION {} {}: {:.4g} -> {:.4g}".format(name, metric, expected, actual))
+
+    sys.exit(1 if len(regressions) > 0 else 0)
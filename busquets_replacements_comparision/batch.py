@@ -0,0 +1,94 @@
+# IMPORTS
+import os
+import sys
+
+# Rendering without a window, every output only gets saved
+os.environ["MPLBACKEND"] = "Agg"
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib.pyplot as plt
+
+import viz_template
+from shared import fetcher
+from shared import instrumentation
+
+# CONSTANTS
+MANIFEST_FILE_PATH = "busquets_replacements_comparision/manifest.json"
+
+# Inputs shared by every comparision, loaded once per worker process
+shared_inputs = {}
+
+# FUNCTIONS
+def load_manifest(manifest_path):
+    with open(manifest_path, "r", encoding = "utf-8") as file:
+        return json.load(file)["comparisions"]
+
+def init_worker(first_player, min_values, max_values, tracing = False):
+    # Tracing the workers whenever the batch itself is traced, their phases get sent back with every job
+    if (tracing and not instrumentation.is_enabled()):
+        instrumentation.enable()
+    instrumentation.collect()
+
+    shared_inputs["first_player"] = first_player
+    shared_inputs["min_values"] = min_values
+    shared_inputs["max_values"] = max_values
+
+def render_job(comparision):
+    start = time.perf_counter()
+
+    second_player = viz_template.load_player(comparision["page"])
+    fig = viz_template.render_comparision(shared_inputs["first_player"], second_player, shared_inputs["min_values"], shared_inputs["max_values"], comparision["save_path"])
+    plt.close(fig)
+
+    return viz_template.get_save_file(comparision["save_path"]), time.perf_counter() - start, instrumentation.collect()
+
+def run_batch(comparisions, workers = None, refresh = False):
+    # Fetching every missing page up front, so the workers only ever read from the storage
+    start = time.perf_counter()
+    fetch_results = viz_template.fetch_pages([viz_template.BUSQUETS_DATA_PAGE] + [comparision["page"] for comparision in comparisions], refresh)
+
+    if (len(fetch_results) > 0):
+        fetcher.print_report(fetcher.get_report(fetch_results, time.perf_counter() - start))
+
+    # Loading the shared inputs once
+    first_player = viz_template.load_player(viz_template.BUSQUETS_DATA_PAGE)
+    min_values, max_values = viz_template.load_ranges(first_player.report, refresh)
+
+    # Building the asset atlas up front, the workers only memory-map it
+    viz_template.load_logo()
+
+    if (workers is None):
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(comparisions)))
+
+    results = []
+    with ProcessPoolExecutor(max_workers = workers, initializer = init_worker, initargs = (first_player, min_values, max_values, instrumentation.is_enabled())) as executor:
+        futures = [executor.submit(render_job, comparision) for comparision in comparisions]
+        for future in as_completed(futures):
+            save_file, duration, trace = future.result()
+            instrumentation.merge(trace)
+            results.append((save_file, duration))
+
+    return results
+
+# RUN
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Render every Busquets' replacement comparision listed in a manifest")
+    parser.add_argument("--manifest", default = MANIFEST_FILE_PATH)
+    parser.add_argument("--workers", type = int, default = None)
+    parser.add_argument("--refresh", action = "store_true", help = "revalidate every page and rebuild the radar ranges before rendering")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_batch(load_manifest(args.manifest), args.workers, args.refresh)
+
+    for save_file, duration in sorted(results):
+        print("{:<75} {:.2f}s".format(save_file, duration))
+    print("Rendered {} comparisions in {:.2f}s".format(len(results), time.perf_counter() - start))
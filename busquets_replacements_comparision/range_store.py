@@ -0,0 +1,190 @@
+# IMPORTS
+from datetime import date, datetime
+import csv
+import os
+import sys
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import fetcher
+
+# CONSTANTS
+RANGES_PATH = "busquets_replacements_comparision/assets/ranges/"
+LEGACY_RANGES_FILE_PATH = "busquets_replacements_comparision/assets/data.csv"
+
+BUSQUETS_DATA_PAGE = "https://fbref.com/en/players/5ab0ea87/Sergio-Busquets"
+
+# FBref recomputes the percentiles over the last 365 days, so a snapshot older than this no longer matches the reports
+MAX_AGE_DAYS = 30
+
+SNAPSHOT_DATE_FORMAT = "%Y-%m-%d"
+
+# FUNCTIONS
+def get_snapshot_path(table_id, snapshot_date):
+    return RANGES_PATH + table_id + "/" + snapshot_date.strftime(SNAPSHOT_DATE_FORMAT) + ".npz"
+
+def list_snapshots(table_id):
+    # Returning the snapshot dates of a position table, newest first
+    table_path = RANGES_PATH + table_id
+    if (not os.path.exists(table_path)):
+        return []
+
+    snapshot_dates = [datetime.strptime(name[:-4], SNAPSHOT_DATE_FORMAT).date() for name in os.listdir(table_path) if name.endswith(".npz")]
+
+    return sorted(snapshot_dates, reverse = True)
+
+def to_int(text):
+    # FBref writes ages as years-days and minutes with thousands separators
+    text = text.strip().split("-")[0].replace(",", "")
+
+    return int(text) if text.isdigit() else -1
+
+def parse_rows(html):
+    from bs4 import BeautifulSoup
+
+    # Every player of the pool is a row, his per 90 value is kept next to who he is
+    pageSoup = BeautifulSoup(html, "html.parser")
+
+    rows = {"players": [], "names": [], "ages": [], "minutes": [], "values": []}
+    for row in pageSoup.find("tbody").find_all("tr"):
+        value = row.find("td", {"data-stat": "per90"})
+        if (value is None or value.text == ""):
+            continue
+
+        player = row.find(["th", "td"], {"data-stat": "player"})
+        link = player.find("a") if player is not None else None
+        age = row.find("td", {"data-stat": "age"})
+        minutes = row.find("td", {"data-stat": "minutes"})
+
+        rows["players"].append(link["href"] if link is not None else "")
+        rows["names"].append(link.text.strip() if link is not None else "")
+        rows["ages"].append(to_int(age.text) if age is not None else -1)
+        rows["minutes"].append(to_int(minutes.text) if minutes is not None else -1)
+        rows["values"].append(float(value.text.replace("%", "")))
+
+    return rows
+
+def parse_distribution(html):
+    # The whole per 90 column of the pool is the distribution
+    return np.sort(np.array(parse_rows(html)["values"], dtype = np.float32))
+
+def build_snapshot(report, snapshot_date = None):
+    if (snapshot_date is None):
+        snapshot_date = date.today()
+
+    # Fetching every distribution page concurrently
+    indices = [i for i in range(len(report.stats)) if report.endpoints[i] != ""]
+    results = fetcher.get_fetcher().fetch_all(["https://fbref.com" + report.endpoints[i] for i in indices])
+
+    pages_rows = [parse_rows(result.content) for result in results]
+
+    # Every player of the pool gets one code, shared by all the stats he is listed in
+    players = [player for rows in pages_rows for player in rows["players"]]
+    player_keys, first_rows, player_codes = np.unique(np.array(players, dtype = str), return_index = True, return_inverse = True)
+    player_codes = player_codes.astype(np.int32)
+    player_codes[np.array(players, dtype = str) == ""] = -1
+
+    names = np.array([name for rows in pages_rows for name in rows["names"]], dtype = str)
+    ages = np.array([age for rows in pages_rows for age in rows["ages"]], dtype = np.int16)
+    minutes = np.array([value for rows in pages_rows for value in rows["minutes"]], dtype = np.int32)
+
+    # Storing the ragged distributions as one flat array plus offsets, every stat sorted with its player codes alongside
+    offsets = np.cumsum([0] + [len(rows["values"]) for rows in pages_rows]).astype(np.int64)
+    values = np.array([value for rows in pages_rows for value in rows["values"]], dtype = np.float32)
+
+    for i in range(len(pages_rows)):
+        order = offsets[i] + np.argsort(values[offsets[i]:offsets[i + 1]], kind = "stable")
+        values[offsets[i]:offsets[i + 1]] = values[order]
+        player_codes[offsets[i]:offsets[i + 1]] = player_codes[order]
+
+    snapshot_path = get_snapshot_path(report.table_id, snapshot_date)
+    os.makedirs(os.path.dirname(snapshot_path), exist_ok = True)
+
+    # Writing through a temporary file per process, so neither an interrupted crawl nor two concurrent ones leave a truncated snapshot as the newest
+    tmp_path = snapshot_path + "." + str(os.getpid()) + ".tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez_compressed(file, stats = np.array([report.stats[i] for i in indices]), values = values, offsets = offsets, player_codes = player_codes, players = player_keys, player_names = names[first_rows], player_ages = ages[first_rows], player_minutes = minutes[first_rows])
+    os.replace(tmp_path, snapshot_path)
+
+    return load_snapshot(report.table_id, snapshot_date)
+
+def load_snapshot(table_id, snapshot_date):
+    with np.load(get_snapshot_path(table_id, snapshot_date)) as snapshot:
+        loaded = {
+            "table_id": table_id,
+            "date": snapshot_date,
+            "stats": list(snapshot["stats"]),
+            "values": snapshot["values"],
+            "offsets": snapshot["offsets"],
+        }
+
+        # Snapshots stored before the players were kept only hold the distributions
+        for name in ["player_codes", "players", "player_names", "player_ages", "player_minutes"]:
+            if (name in snapshot.files):
+                loaded[name] = snapshot[name]
+
+    return loaded
+
+def get_distribution(snapshot, stat_index):
+    return snapshot["values"][snapshot["offsets"][stat_index]:snapshot["offsets"][stat_index + 1]]
+
+def get_ranges(snapshot, lower_percentile = 0, upper_percentile = 100):
+    distributions = [get_distribution(snapshot, i) for i in range(len(snapshot["stats"]))]
+
+    # FBref lists the values with two decimals, rounding drops the float32 noise
+    min_values = [round(float(np.percentile(distribution, lower_percentile)), 2) for distribution in distributions]
+    max_values = [round(float(np.percentile(distribution, upper_percentile)), 2) for distribution in distributions]
+
+    return min_values, max_values
+
+def load_legacy_ranges():
+    with open(LEGACY_RANGES_FILE_PATH, "r") as file:
+        rows = [[float(element) for element in row] for row in csv.reader(file)]
+
+    return rows[0], rows[1]
+
+def is_fresh(snapshot_date, max_age_days = MAX_AGE_DAYS):
+    return (date.today() - snapshot_date).days <= max_age_days
+
+def load_latest_snapshot(report, max_age_days = MAX_AGE_DAYS, refresh = False):
+    # Reusing the newest snapshot which still matches the report, even an expired one, the crawl is only run on refresh so a render never waits on it
+    expected_stats = [report.stats[i] for i in range(len(report.stats)) if report.endpoints[i] != ""]
+    matching_dates = [snapshot_date for snapshot_date in list_snapshots(report.table_id) if load_snapshot(report.table_id, snapshot_date)["stats"] == expected_stats]
+
+    if (refresh):
+        try:
+            return build_snapshot(report)
+        except Exception as error:
+            print("Could not refresh the " + report.table_id + " ranges: " + str(error))
+
+    if (len(matching_dates) == 0):
+        return None
+
+    if (not is_fresh(matching_dates[0], max_age_days)):
+        print("Using the expired " + report.table_id + " ranges from " + matching_dates[0].strftime(SNAPSHOT_DATE_FORMAT) + ", refresh them to rescale the radar")
+
+    return load_snapshot(report.table_id, matching_dates[0])
+
+def load_ranges(report, max_age_days = MAX_AGE_DAYS, refresh = False):
+    snapshot = load_latest_snapshot(report, max_age_days, refresh)
+
+    if (snapshot is not None):
+        return get_ranges(snapshot)
+
+    # Until a snapshot gets built the ranges stored before the snapshots are used, they are not part of every checkout
+    if (os.path.exists(LEGACY_RANGES_FILE_PATH)):
+        return load_legacy_ranges()
+
+    raise ValueError("No " + report.table_id + " ranges are stored in " + RANGES_PATH + " yet, build them with --refresh or range_store.py")
+
+# RUN
+if __name__ == "__main__":
+    import report_cache
+
+    # Rebuilding today's snapshot of the ranges Busquets' report is compared against
+    snapshot = build_snapshot(report_cache.load_report(report_cache.get_slug(BUSQUETS_DATA_PAGE)))
+    print("Stored " + str(len(snapshot["values"])) + " per 90 values of " + str(len(snapshot["stats"])) + " stats into " + get_snapshot_path(snapshot["table_id"], snapshot["date"]))
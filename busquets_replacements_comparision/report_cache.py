@@ -0,0 +1,157 @@
+# IMPORTS
+from collections import namedtuple
+import hashlib
+import json
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import archive
+from shared import fragments
+from shared import instrumentation
+
+# CONSTANTS
+ASSETS_PATH = "busquets_replacements_comparision/assets/"
+REPORTS_PATH = ASSETS_PATH + "reports/"
+ARCHIVE_PATH = ASSETS_PATH + "archive/"
+
+REPORT_TABLE_ID = "scout_summary_MF"
+EXCLUDED_STATS = ["Shots Total", "Non-Penalty Goals", "Non-Penalty xG", "npxG + xAG", "Touches (Att Pen)"]
+
+# Bump whenever the parsing rules change so stale records get re-parsed
+CACHE_VERSION = 1
+
+# Compact record holding only what the comparision needs from a scouting page
+ScoutingReport = namedtuple("ScoutingReport", ["slug", "content_hash", "table_id", "player_name", "birthdate", "headers", "stats", "per90", "percentiles", "endpoints"])
+
+# FUNCTIONS
+def get_slug(player_data_page):
+    return player_data_page.rstrip("/").split("/")[-1]
+
+def get_html_path(slug):
+    return ASSETS_PATH + slug + ".html"
+
+def get_report_path(slug, table_id = REPORT_TABLE_ID):
+    return REPORTS_PATH + slug + "." + table_id + ".json"
+
+def get_content_hash(html):
+    return hashlib.sha1(html).hexdigest()
+
+def has_page(slug):
+    return os.path.exists(get_html_path(slug)) or archive.get_version(slug, ARCHIVE_PATH) is not None
+
+def get_page_hash(slug):
+    # A freshly fetched assets/<slug>.html comes first, otherwise the newest archived version answers without decompressing it
+    if (os.path.exists(get_html_path(slug))):
+        with open(get_html_path(slug), "rb") as file:
+            return get_content_hash(file.read())
+
+    version = archive.get_version(slug, ARCHIVE_PATH)
+    if (version is None):
+        raise FileNotFoundError("No " + slug + " page in " + ASSETS_PATH + " or its archive")
+
+    return version["content_hash"]
+
+def read_page(slug):
+    if (os.path.exists(get_html_path(slug))):
+        with open(get_html_path(slug), "rb") as file:
+            return file.read()
+
+    return archive.read_page(slug, ARCHIVE_PATH)
+
+def archive_pages(slugs, version_date = None):
+    # Keeping a dated, compressed version of every fetched page, unchanged pages add nothing
+    for slug in slugs:
+        if (os.path.exists(get_html_path(slug))):
+            with open(get_html_path(slug), "rb") as file:
+                archive.add_page(slug, file.read(), ARCHIVE_PATH, version_date)
+
+def parse_report(html, slug, content_hash, table_id = REPORT_TABLE_ID):
+    from bs4 import BeautifulSoup
+
+    table_fragment = fragments.slice_fragment(html, 'id="' + table_id + '"', "</table>")
+    meta_fragment = fragments.slice_fragment(html, 'id="meta"', "</span>", stop_marker = "data-birth")
+
+    if (table_fragment is None or meta_fragment is None):
+        raise ValueError("Scouting report " + table_id + " or player meta not found in " + slug)
+
+    # Processing table headers
+    player_report = BeautifulSoup(table_fragment, "html.parser").find("table")
+
+    header_row = player_report.find("thead").find("tr")
+    table_headers = [th.text for th in header_row.find_all("th")]
+
+    # Processing the table body - Filtering out the excluded and spacer rows
+    stats = []
+    per90 = []
+    percentiles = []
+    endpoints = []
+
+    for row in player_report.find("tbody").find_all("tr"):
+        cells = row.find_all(["th", "td"])
+        if (len(cells) < 3 or cells[0].text == "" or cells[0].text in EXCLUDED_STATS):
+            continue
+
+        endpoint_cell = row.find("td", {"data-endpoint": True})
+
+        stats.append(cells[0].text)
+        per90.append(float(cells[1].text.replace("%", "")))
+        percentiles.append(int(cells[2].text.strip()))
+        endpoints.append(endpoint_cell["data-endpoint"] if endpoint_cell is not None else "")
+
+    # Processing player name and birthdate
+    player_info = BeautifulSoup(meta_fragment, "html.parser")
+
+    player_name = player_info.find("span").text
+    birthdate = player_info.find("span", {"data-birth": True}).text.strip()
+
+    return ScoutingReport(slug, content_hash, table_id, player_name, birthdate, table_headers, stats, per90, percentiles, endpoints)
+
+def read_cached_report(slug, content_hash, table_id = REPORT_TABLE_ID):
+    report_path = get_report_path(slug, table_id)
+    if (not os.path.exists(report_path)):
+        return None
+
+    with open(report_path, "r", encoding = "utf-8") as file:
+        cached = json.load(file)
+
+    if (cached.get("version") != CACHE_VERSION or cached["report"]["content_hash"] != content_hash):
+        return None
+
+    return ScoutingReport(**cached["report"])
+
+def write_cached_report(report):
+    os.makedirs(REPORTS_PATH, exist_ok = True)
+
+    with open(get_report_path(report.slug, report.table_id), "w", encoding = "utf-8") as file:
+        json.dump({"version": CACHE_VERSION, "report": report._asdict()}, file, ensure_ascii = False)
+
+def load_report(slug, table_id = REPORT_TABLE_ID):
+    # Hashing the raw bytes is far cheaper than parsing them, so it decides whether the cached record is still valid
+    html = None
+    if (os.path.exists(get_html_path(slug))):
+        with open(get_html_path(slug), "rb") as file:
+            html = file.read()
+
+        content_hash = get_content_hash(html)
+    else:
+        # An archived page already knows its hash, it only gets decompressed when the report has to be parsed again
+        content_hash = get_page_hash(slug)
+
+    report = read_cached_report(slug, content_hash, table_id)
+    if (report is None):
+        instrumentation.count("cache_misses")
+
+        if (html is None):
+            html = archive.read_page(slug, ARCHIVE_PATH)
+
+        with instrumentation.phase("parse"):
+            report = parse_report(html.decode("utf-8"), slug, content_hash, table_id)
+        write_cached_report(report)
+    else:
+        instrumentation.count("cache_hits")
+
+    return report
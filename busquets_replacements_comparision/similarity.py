@@ -0,0 +1,146 @@
+# IMPORTS
+from collections import namedtuple
+import os
+import sys
+import time
+
+import numpy as np
+
+import range_store
+import report_cache
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import instrumentation
+
+# CONSTANTS
+SIMILAR_PATH = "busquets_replacements_comparision/similar/"
+
+BUSQUETS_DATA_PAGE = "https://fbref.com/en/players/5ab0ea87/Sergio-Busquets"
+
+TOP_K = 10
+
+# One ranked player of the pool
+SimilarPlayer = namedtuple("SimilarPlayer", ["page", "name", "age", "minutes", "distance", "similarity"])
+
+# FUNCTIONS
+def get_player_id(page):
+    # /en/players/5ab0ea87/Sergio-Busquets -> 5ab0ea87, the slug after it may differ between pages
+    parts = page.split("/players/")
+
+    return parts[1].split("/")[0] if len(parts) > 1 else ""
+
+def get_matrix(snapshot):
+    # Players x stats per 90 matrix, NaN where a player is missing from the pool of a stat
+    matrix = np.full((len(snapshot["players"]), len(snapshot["stats"])), np.nan, dtype = np.float32)
+
+    for i in range(len(snapshot["stats"])):
+        codes = snapshot["player_codes"][snapshot["offsets"][i]:snapshot["offsets"][i + 1]]
+        values = range_store.get_distribution(snapshot, i)
+
+        known = codes >= 0
+        matrix[codes[known], i] = values[known]
+
+    return matrix
+
+def normalize(values, min_values, max_values):
+    # Scaling every stat onto the radar's own axis, its min at 0 and its max at 1
+    min_values = np.asarray(min_values, dtype = np.float32)
+    spans = np.maximum(np.asarray(max_values, dtype = np.float32) - min_values, 1e-6)
+
+    return np.clip((values - min_values) / spans, 0, 1)
+
+def get_report_vector(report, snapshot):
+    # The report's per 90 values in the order of the snapshot stats
+    per90 = dict(zip(report.stats, report.per90))
+
+    return np.array([per90[stat] for stat in snapshot["stats"]], dtype = np.float32)
+
+def find_similar(snapshot, report, k = TOP_K, max_age = None, min_minutes = None, lower_percentile = 0, upper_percentile = 100):
+    if ("players" not in snapshot):
+        raise ValueError("The " + snapshot["table_id"] + " snapshot has no players, rebuild it with --refresh")
+
+    with instrumentation.phase("process"):
+        min_values, max_values = range_store.get_ranges(snapshot, lower_percentile, upper_percentile)
+
+        matrix = normalize(get_matrix(snapshot), min_values, max_values)
+        target = normalize(get_report_vector(report, snapshot), min_values, max_values)
+
+        # Filtering as one mask, players missing from any stat pool can not be compared
+        mask = ~np.isnan(matrix).any(axis = 1)
+        mask &= np.array([get_player_id(player) != get_player_id(BUSQUETS_DATA_PAGE) for player in snapshot["players"]])
+        if (max_age is not None):
+            mask &= (snapshot["player_ages"] >= 0) & (snapshot["player_ages"] <= max_age)
+        if (min_minutes is not None):
+            mask &= snapshot["player_minutes"] >= min_minutes
+
+        # One distance computation over the whole pool
+        distances = np.sqrt(np.nansum((matrix - target) ** 2, axis = 1))
+        distances[~mask] = np.inf
+
+        k = min(k, int(mask.sum()))
+        if (k == 0):
+            return []
+
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest], kind = "stable")]
+
+    # The similarity is 1 for a perfect match and 0 for the furthest possible player
+    maximum_distance = np.sqrt(len(snapshot["stats"]))
+
+    return [SimilarPlayer("https://fbref.com" + snapshot["players"][i], str(snapshot["player_names"][i]), int(snapshot["player_ages"][i]), int(snapshot["player_minutes"][i]), float(distances[i]), 1 - float(distances[i]) / maximum_distance) for i in nearest]
+
+def get_comparisions(similar_players):
+    # The winners in the same shape as the manifest, so the batch renders their radars
+    comparisions = []
+    for player in similar_players:
+        save_path = SIMILAR_PATH + report_cache.get_slug(player.page)
+        os.makedirs(save_path, exist_ok = True)
+
+        comparisions.append({"page": player.page, "save_path": save_path})
+
+    return comparisions
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Rank the midfielders of the newest ranges snapshot by their distance to Busquets and render the closest ones")
+    parser.add_argument("--top", type = int, default = TOP_K)
+    parser.add_argument("--max-age", type = int, default = None)
+    parser.add_argument("--min-minutes", type = int, default = None)
+    parser.add_argument("--lower-percentile", type = float, default = 0, help = "scale every stat from this percentile of the pool, the radar uses 0")
+    parser.add_argument("--upper-percentile", type = float, default = 100, help = "scale every stat up to this percentile of the pool, the radar uses 100")
+    parser.add_argument("--render", action = "store_true", help = "render a comparision radar for every ranked player into " + SIMILAR_PATH)
+    parser.add_argument("--refresh", action = "store_true", help = "rebuild the ranges snapshot even when it is still fresh")
+    parser.add_argument("--workers", type = int, default = None)
+    args = parser.parse_args()
+
+    import batch
+    import viz_template
+
+    start = time.perf_counter()
+
+    viz_template.fetch_pages([BUSQUETS_DATA_PAGE])
+    report = report_cache.load_report(report_cache.get_slug(BUSQUETS_DATA_PAGE))
+
+    # The ranking needs the players of a snapshot, so a first query builds one instead of falling back to the legacy ranges
+    snapshot = range_store.load_latest_snapshot(report, refresh = args.refresh)
+    if (snapshot is None and not args.refresh):
+        print("No ranges snapshot of " + report.table_id + " yet, building one")
+        snapshot = range_store.load_latest_snapshot(report, refresh = True)
+    if (snapshot is None):
+        sys.exit("No ranges snapshot of " + report.table_id + " could be built")
+
+    similar_players = find_similar(snapshot, report, args.top, args.max_age, args.min_minutes, args.lower_percentile, args.upper_percentile)
+
+    print("{:<4} {:<30} {:>4} {:>7} {:>11}".format("", "player", "age", "minutes", "similarity"))
+    for rank, player in enumerate(similar_players):
+        print("{:<4} {:<30} {:>4} {:>7} {:>10.1f}%".format(rank + 1, player.name, player.age, player.minutes, player.similarity * 100))
+    print("Ranked {} players in {:.2f}s".format(len(snapshot["players"]), time.perf_counter() - start))
+
+    if (args.render and len(similar_players) > 0):
+        results = batch.run_batch(get_comparisions(similar_players), args.workers)
+        print("Rendered {} comparisions in {:.2f}s".format(len(results), time.perf_counter() - start))
@@ -1,16 +1,23 @@
 # IMPORTS
 import pandas as pd
 import matplotlib.pyplot as plt
-from PIL import Image
 from mplsoccer import Radar
-from bs4 import BeautifulSoup
-import requests
 from matplotlib.transforms import Bbox
-import numpy as np
 import os
-import time
-import csv
+import sys
 from datetime import datetime
+from collections import namedtuple
+
+import report_cache
+import range_store
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import fetcher
+from shared import instrumentation
+from shared import templates
 
 # CONSTANTS
 BACKGROUND_COLOR = "#15141b"
@@ -18,6 +25,11 @@ PRIMARY_COLOR = "#ffffff"
 
 FONT_FAMILY = "sans-serif"
 
+BUSQUETS_DATA_PAGE = "https://fbref.com/en/players/5ab0ea87/Sergio-Busquets"
+
+# Everything the viz needs about a single player
+PlayerData = namedtuple("PlayerData", ["name", "age", "frame", "report"])
+
 # FUNCTIONS
 def get_years(birthdate):
     current_date = datetime.now()
@@ -41,116 +53,63 @@ def set_cell_design(table, frame):
     for table_cell in table_cells:
         table_cell.set_fontweight("bold")
 
-def create_comparision(player_data_page, save_path):
-    # DATA FETCHING PART
-    # Initializing HTTP headers and data_sources
-    headers = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/47.0.2526.106 Safari/537.36"}
-    data_pages = ["https://fbref.com/en/players/5ab0ea87/Sergio-Busquets", player_data_page]
-    
-    # Initializing variables for later processment
-    data_frames = []
-
-    min_values = []
-    max_values = []
-
-    first_player_name = ""
-    first_player_age = 0
-
-    second_player_name = ""
-    second_player_age = 0
-
-    for i in range(len(data_pages)):
-        # Fetching the actual data from the storage/web
-        file_path = "busquets_replacements_comparision/assets/" + data_pages[i].split("/")[-1] + ".html"
-
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as file:
-                html = file.read()
-        else:
-            time.sleep(3)
-            html = requests.get(data_pages[i], headers = headers).content
-            with open(file_path, 'wb') as file:
-                file.write(html)
-
-        pageSoup = BeautifulSoup(html, "html.parser")
-
-        # DATA PROCESSING PART
-        player_report = pageSoup.find("table", {"id": "scout_summary_MF"})
-
-        # Processing table headers
-        header_row = player_report.find("thead").find("tr")
-        table_headers = np.array([th.text for th in header_row.find_all("th")])
-
-        # Processing the table body - Filtering out the rows
-        body_rows = player_report.find("tbody").find_all("tr")
-
-        excluded_stats = ["Shots Total", "Non-Penalty Goals", "Non-Penalty xG", "npxG + xAG", "Touches (Att Pen)"]
-        filtered_rows = [row for row in body_rows if not any(row_item.text in excluded_stats for row_item in row)]
-
-        # Processing the table body - Creating a DataFrame
-        data = np.array([[target.text for target in row.find_all(lambda tag: tag.name == "td" or tag.name == "th")] for row in filtered_rows])
-        data = data[data[:, 0] != ""]
-        data = [[stat[0], float(stat[1].replace("%", "")), int(stat[2].strip())] for stat in data]
-
-        df = pd.DataFrame(data, columns = table_headers)
-
-        # Processing player names and ages
-        player_info = pageSoup.find("div", {"id": "meta"})
-
-        if (i == 0):
-            first_player_name = player_info.find("span").text
-            first_player_age = get_years(player_info.find("span", {"data-birth": True}).text.strip())
-        if (i == 1):
-            second_player_name = player_info.find("span").text
-            second_player_age = get_years(player_info.find("span", {"data-birth": True}).text.strip())
-
-        # Processing the min and max radar values
-        if (i == 0):
-            if (not os.path.exists("busquets_replacements_comparision/assets/data.csv")):
-                values_links = list(map(lambda x: "https://fbref.com" + x[0], filter(lambda y: y != [], [[td["data-endpoint"] for td in row.find_all("td", {"data-endpoint": True})] for row in filtered_rows])))
-                
-                for j in range(len(values_links)):
-                    time.sleep(3)
-
-                    pageTree = requests.get(values_links[j], headers = headers)
-                    pageSoup = BeautifulSoup(pageTree.content, "html.parser")
-
-                    values = pageSoup.find("tbody").find_all("td", {"data-stat": "per90"})
-                    min_values.append(float(values[-1].text))
-                    max_values.append(float(values[0].text))
-
-                with open("busquets_replacements_comparision/assets/data.csv", "w", newline = "") as file:
-                    writer = csv.writer(file)
-                    writer.writerows([min_values, max_values])
-
-            else:
-                with open("busquets_replacements_comparision/assets/data.csv", "r") as file:
-                    reader = csv.reader(file)
-                    i = 0
-                    for row in reader:
-                        sublist = [float(element) for element in row]
-                        
-                        if (i == 0):
-                            min_values = sublist
-                        if (i == 1):
-                            max_values = sublist
-
-                        i += 1
+@instrumentation.phase("fetch")
+def fetch_pages(player_data_pages, refresh = False):
+    # Fetching the pages missing from the storage, or revalidating all of them on refresh
+    missing_pages = [page for page in player_data_pages if refresh or not report_cache.has_page(report_cache.get_slug(page))]
+    file_paths = [report_cache.get_html_path(report_cache.get_slug(page)) for page in missing_pages]
+
+    instrumentation.count("cache_hits", len(player_data_pages) - len(missing_pages))
+
+    results = fetcher.get_fetcher().fetch_all(missing_pages, file_paths)
+    report_cache.archive_pages([report_cache.get_slug(page) for page in missing_pages])
+
+    return results
+
+def fetch_page(player_data_page):
+    fetch_pages([player_data_page])
+
+    return report_cache.get_slug(player_data_page)
+
+def load_player(player_data_page):
+    # Loading the parsed scouting report, the page itself is only parsed when its content changed
+    report = report_cache.load_report(fetch_page(player_data_page))
+
+    with instrumentation.phase("process"):
+        # Creating a DataFrame from the report stats
+        data = [[report.stats[j], report.per90[j], report.percentiles[j]] for j in range(len(report.stats))]
+
+        df = pd.DataFrame(data, columns = report.headers)
 
         # Editing dataframe edge case
         df.at[4, "Statistic"] = " Pass Completion % "
 
-        # Adding dataframe into data_frames array
-        data_frames.append(df)
+    return PlayerData(report.player_name, get_years(report.birthdate), df, report)
+
+@instrumentation.phase("process")
+def load_ranges(report, refresh = False):
+    # Processing the min and max radar values from the newest percentile distribution snapshot
+    return range_store.load_ranges(report, refresh = refresh)
+
+def load_logo():
+    return templates.get_logo()
+
+def get_save_file(save_path):
+    # Saving as <folder>/<folder name>_viz.png
+    return os.path.join(save_path, os.path.basename(save_path) + "_viz.png")
+
+@instrumentation.phase("render")
+def render_comparision(first_player, second_player, min_values, max_values, save_path = None):
+    data_frames = [first_player.frame, second_player.frame]
+
+    first_player_name, first_player_age = first_player.name, first_player.age
+    second_player_name, second_player_age = second_player.name, second_player.age
 
     # VIZ PART
-    # Creating the plot area
-    fig, (ax1, ax2) = plt.subplots(1, 2)
+    # Creating the branded plot area
+    fig, (ax1, ax2) = templates.create_figure((16, 9.5), 1, 2)
 
     # Setting up graph global defaults
-    fig.set_size_inches(16, 9.5)
-    fig.set_facecolor(BACKGROUND_COLOR)
-    fig.set_edgecolor(PRIMARY_COLOR)
     fig.subplots_adjust(left = 0.004, right=1)
 
     plt.subplots_adjust(wspace=0.1)
@@ -160,7 +119,7 @@ def create_comparision(player_data_page, save_path):
     ax2.axis("off")
 
     # Setting up title
-    plt.suptitle("BUSQUETS' POTENTIAL REPLACEMENTS COMPARISION", y = 0.969, fontsize = 20, fontweight = "bold", family = FONT_FAMILY, color = PRIMARY_COLOR)
+    templates.add_title(fig, "BUSQUETS' POTENTIAL REPLACEMENTS COMPARISION")
 
     # LEFT SUBPLOT
     # Scattering the plot on the left subplot
@@ -200,16 +159,25 @@ def create_comparision(player_data_page, save_path):
     # Setting cell design for table2
     set_cell_design(table2, data_frames[1])
 
-    # Adding logo
-    plt.figimage(Image.open("logo.png").resize((100, 100), Image.LANCZOS), xo = 17, yo = -1)
-
     # Adding data source text
-    plt.text(0.95, 0.54, "Source:", transform = plt.gca().transAxes, family = FONT_FAMILY, ha = "right", va = "center", color = PRIMARY_COLOR, fontweight = "regular", fontsize = 12, rotation = 270)
-    plt.text(0.95, 0.46, "FBref", transform = plt.gca().transAxes, family = FONT_FAMILY, ha = "right", va = "center", color = PRIMARY_COLOR, fontweight = "bold", fontsize = 12, rotation = 270)
+    templates.add_source(ax2, "FBref", (0.95, 0.54), (0.95, 0.46), rotation = 270)
 
-    # Save the figure to a custom path
-    save_path = save_path + "\\" + save_path.split("\\")[-1] + "_viz.png"
-    plt.savefig(save_path)
+    # Save the figure to a custom path, a figure rendered for the render service is only encoded in memory
+    if (save_path is not None):
+        with instrumentation.phase("save"):
+            plt.savefig(get_save_file(save_path))
+
+    return fig
+
+def create_comparision(player_data_page, save_path):
+    # DATA FETCHING AND PROCESSING PART
+    first_player = load_player(BUSQUETS_DATA_PAGE)
+    second_player = load_player(player_data_page)
+
+    min_values, max_values = load_ranges(first_player.report)
+
+    # VIZ PART
+    render_comparision(first_player, second_player, min_values, max_values, save_path)
 
     # Show the viz
     plt.show()
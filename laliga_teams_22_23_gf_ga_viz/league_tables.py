@@ -0,0 +1,195 @@
+# IMPORTS
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import time
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import fetcher
+from shared import fragments
+from shared import instrumentation
+
+# CONSTANTS
+TABLES_PATH = "laliga_teams_22_23_gf_ga_viz/tables/"
+PAGES_PATH = TABLES_PATH + "pages/"
+STORE_FILE_PATH = TABLES_PATH + "league_tables.npz"
+
+# FBref competition ids and the names used in their URLs
+COMPETITIONS = {
+    "La-Liga": 12,
+    "Premier-League": 9,
+    "Serie-A": 11,
+    "Bundesliga": 20,
+    "Ligue-1": 13,
+}
+DEFAULT_COMPETITION = "La-Liga"
+
+SEASONS = ["2013-2014", "2014-2015", "2015-2016", "2016-2017", "2017-2018", "2018-2019", "2019-2020", "2020-2021", "2021-2022", "2022-2023"]
+
+# Every stored column of the overall table, the strings are dictionary encoded
+NUMERIC_COLUMNS = ["rank", "games", "wins", "ties", "losses", "goals_for", "goals_against", "points"]
+
+# FUNCTIONS
+def get_page_url(competition, season):
+    return "https://fbref.com/en/comps/" + str(COMPETITIONS[competition]) + "/" + season + "/" + season + "-" + competition + "-Stats"
+
+def get_page_path(competition, season):
+    return PAGES_PATH + competition + "-" + season + ".html"
+
+def get_table_id(competition, season):
+    # e.g. results2022-2023121_overall for the 2022/23 LaLiga season
+    return "results" + season + str(COMPETITIONS[competition]) + "1_overall"
+
+def get_season_label(season):
+    # 2022-2023 -> 2022/23
+    return season[:4] + "/" + season[-2:]
+
+def parse_table(html, table_id):
+    from bs4 import BeautifulSoup
+
+    if (isinstance(html, bytes)):
+        html = html.decode("utf-8")
+
+    # Parsing only the overall table, not the whole page
+    table_fragment = fragments.slice_fragment(html, 'id="' + table_id + '"', "</table>")
+    if (table_fragment is None):
+        raise ValueError("League table " + table_id + " not found")
+
+    table_body = BeautifulSoup(table_fragment, "html.parser").find("tbody")
+
+    # Going over the rows once, every row yields the whole club record
+    clubs = []
+    for row in table_body.find_all("tr", recursive = False):
+        cells = {cell.get("data-stat"): cell for cell in row.find_all(["th", "td"], recursive = False)}
+        if ("team" not in cells or cells["team"].find("a") is None):
+            continue
+
+        club = {"team": cells["team"].find("a").text.strip()}
+        for column in NUMERIC_COLUMNS:
+            value = cells[column].text.strip() if column in cells else ""
+            club[column] = int(value) if value.lstrip("-").isdigit() else -1
+
+        clubs.append(club)
+
+    return clubs
+
+def to_columns(clubs, competition, season):
+    columns = {"competition": [competition] * len(clubs), "season": [season] * len(clubs), "team": [club["team"] for club in clubs]}
+    for column in NUMERIC_COLUMNS:
+        columns[column] = [club[column] for club in clubs]
+
+    return columns
+
+def read_store(store_path = STORE_FILE_PATH):
+    # Decoding the season-keyed table into plain columns
+    if (not os.path.exists(store_path)):
+        return None
+
+    with np.load(store_path) as store:
+        columns = {name: store[name + "_names"][store[name]].tolist() for name in ["competition", "season", "team"]}
+        for column in NUMERIC_COLUMNS:
+            columns[column] = store[column].tolist()
+
+    return columns
+
+def write_store(columns, store_path = STORE_FILE_PATH):
+    # Strings as codes into a small lookup, the numbers as int16, a full decade of a league fits in a few kilobytes
+    arrays = {}
+    for name in ["competition", "season", "team"]:
+        names, codes = np.unique(np.array(columns[name], dtype = str), return_inverse = True)
+        arrays[name] = codes.astype(np.int16)
+        arrays[name + "_names"] = names
+
+    for column in NUMERIC_COLUMNS:
+        arrays[column] = np.array(columns[column], dtype = np.int16)
+
+    os.makedirs(os.path.dirname(store_path), exist_ok = True)
+
+    with open(store_path + ".tmp", "wb") as file:
+        np.savez_compressed(file, **arrays)
+    os.replace(store_path + ".tmp", store_path)
+
+def merge(columns, seasons_columns):
+    # Replacing the stored rows of every freshly ingested season
+    if (columns is None):
+        columns = {name: [] for name in ["competition", "season", "team"] + NUMERIC_COLUMNS}
+
+    ingested = set((competition, season) for season_columns in seasons_columns for competition, season in zip(season_columns["competition"], season_columns["season"]))
+    keep = [i for i in range(len(columns["team"])) if (columns["competition"][i], columns["season"][i]) not in ingested]
+
+    merged = {name: [values[i] for i in keep] for name, values in columns.items()}
+    for season_columns in seasons_columns:
+        for name in merged:
+            merged[name].extend(season_columns[name])
+
+    return merged
+
+@instrumentation.phase("fetch")
+def fetch_seasons(competition_seasons, refresh = False):
+    # Only the pages missing from the storage get fetched, unless they are all revalidated on refresh
+    os.makedirs(PAGES_PATH, exist_ok = True)
+
+    missing = [(competition, season) for competition, season in competition_seasons if refresh or not os.path.exists(get_page_path(competition, season))]
+    instrumentation.count("cache_hits", len(competition_seasons) - len(missing))
+
+    return fetcher.get_fetcher().fetch_all([get_page_url(competition, season) for competition, season in missing], [get_page_path(competition, season) for competition, season in missing])
+
+def parse_season(competition, season):
+    with open(get_page_path(competition, season), "rb") as file:
+        html = file.read()
+
+    return to_columns(parse_table(html, get_table_id(competition, season)), competition, season)
+
+def ingest(competition_seasons, refresh = False, workers = 4):
+    fetch_seasons(competition_seasons, refresh)
+
+    # Parsing the stored pages next to each other, the parser only ever sees the overall tables
+    with instrumentation.phase("parse"):
+        with ThreadPoolExecutor(max_workers = max(1, min(workers, len(competition_seasons)))) as executor:
+            seasons_columns = list(executor.map(lambda competition_season: parse_season(*competition_season), competition_seasons))
+
+    with instrumentation.phase("save"):
+        columns = merge(read_store(), seasons_columns)
+        write_store(columns)
+
+    return columns
+
+def get_season(columns, season, competition = DEFAULT_COMPETITION):
+    # Returning the club names, GF and GA of a single season in table order
+    indices = [i for i in range(len(columns["team"])) if columns["season"][i] == season and columns["competition"][i] == competition]
+    indices = sorted(indices, key = lambda i: columns["rank"][i])
+
+    return np.array([columns["team"][i] for i in indices]), np.array([columns["goals_for"][i] for i in indices]), np.array([columns["goals_against"][i] for i in indices])
+
+def load_seasons(seasons, competition = DEFAULT_COMPETITION, refresh = False):
+    # Ingesting only the seasons missing from the local table, then serving every chart from it
+    columns = read_store()
+    stored = set() if columns is None else set(zip(columns["competition"], columns["season"]))
+
+    missing = [(competition, season) for season in seasons if refresh or (competition, season) not in stored]
+    if (len(missing) > 0):
+        columns = ingest(missing, refresh)
+
+    return columns
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Ingest the overall league tables of many seasons into " + STORE_FILE_PATH)
+    parser.add_argument("--competition", action = "append", choices = list(COMPETITIONS.keys()), help = DEFAULT_COMPETITION + " by default")
+    parser.add_argument("--season", action = "append", help = "e.g. 2022-2023, the last ten seasons by default")
+    parser.add_argument("--refresh", action = "store_true", help = "revalidate the stored pages")
+    args = parser.parse_args()
+
+    competitions = args.competition or [DEFAULT_COMPETITION]
+    seasons = args.season or SEASONS
+
+    start = time.perf_counter()
+    columns = ingest([(competition, season) for competition in competitions for season in seasons], args.refresh)
+    print("Stored {} club seasons of {} competitions in {:.2f}s".format(len(columns["team"]), len(set(columns["competition"])), time.perf_counter() - start))
@@ -1,10 +1,21 @@
 # IMPORTS
-from bs4 import BeautifulSoup
-import requests
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
-from PIL import Image
+
+import league_tables
+
+from shared import fetcher
+from shared import instrumentation
+from shared import labels
+from shared import templates
 
 # CONSTANTS
 BACKGROUND_COLOR = "#15141b"
@@ -12,94 +23,207 @@ PRIMARY_COLOR = "#ffffff"
 
 FONT_FAMILY = "sans-serif"
 
+SEASON = "2022-2023"
+
+PAGE = league_tables.get_page_url(league_tables.DEFAULT_COMPETITION, SEASON)
+TABLE_ID = league_tables.get_table_id(league_tables.DEFAULT_COMPETITION, SEASON)
+
+CRESTS_PATH = "laliga_teams_22_23_gf_ga_viz/crests/"
+CREST_ZOOM = 0.25
+SMALL_MULTIPLE_CREST_ZOOM = 0.1
+
+# Seconds the club names may take to place, the clubs with the fewest goals go unlabelled past it
+LABELS_TIME_BUDGET = 1
+
 # HELPING FUNCTIONS
-def getImage(path):
-    return OffsetImage(plt.imread(path), alpha = 1, zoom = 0.25)
+def getImage(crest, zoom = CREST_ZOOM):
+    # The stored crests are already scaled down, the zoom keeps them at their original size
+    return OffsetImage(crest, alpha = 1, zoom = zoom / templates.CREST_SCALE)
 
-# DATA FETCHING
-# Setting up HTTP header
-headers = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/47..2526.106 Safari/537.36"}
+def add_crests(ax, club_names, club_goals_for, club_goals_against, zoom = CREST_ZOOM, textsize = 11):
+    # Clubs of older seasons may miss a crest, they keep their plain marker and get their name next to it
+    crest_indices = [i for i in range(len(club_names)) if os.path.exists(CRESTS_PATH + club_names[i] + ".png")]
+    crests = templates.get_crests([CRESTS_PATH + club_names[i] + ".png" for i in crest_indices])
 
-# Fetching the actual data from the web
-page = "https://fbref.com/en/comps/12/La-Liga-Stats"
-pageTree = requests.get(page, headers = headers)
-pageSoup = BeautifulSoup(pageTree.content, "html.parser")
+    for i, crest in zip(crest_indices, crests):
+        ab = AnnotationBbox(getImage(crest, zoom), (club_goals_for[i], club_goals_against[i]), frameon = False)
+        ax.add_artist(ab)
 
-# DATA PROCESSING
-# Extract the table of club stats from fetched html
-clubs_table = pageSoup.find("table", {"id": "results2022-2023121_overall"}).find("tbody")
+    name_indices = [i for i in range(len(club_names)) if i not in crest_indices]
+    if (len(name_indices) == 0):
+        return
+
+    # The names must not cover any crest, their boxes in pixels are the stored size times the zoom
+    fig = ax.figure
+    crest_sizes = [(crest.shape[1] * zoom / templates.CREST_SCALE * fig.dpi / 72, crest.shape[0] * zoom / templates.CREST_SCALE * fig.dpi / 72) for crest in crests]
+    obstacles = labels.get_image_obstacles(ax, club_goals_for[crest_indices], club_goals_against[crest_indices], crest_sizes)
 
-# Extracting the club names
-club_names = np.array([item.find("a").text for item in clubs_table.find_all("td", {"data-stat": "team"}) if item.find("a") is not None])
+    with instrumentation.phase("labels"):
+        labels.place_labels(fig, ax, club_goals_for[name_indices], club_goals_against[name_indices], club_names[name_indices], priorities = club_goals_for[name_indices], obstacles = obstacles, time_budget = LABELS_TIME_BUDGET, family = FONT_FAMILY, textcolor = PRIMARY_COLOR, textsize = textsize, linecolor = PRIMARY_COLOR)
 
-# Extracting the GF
-club_goals_for = np.array([int(item.text) for item in clubs_table.find_all("td", {"data-stat": "goals_for"}) if item is not None])
+# DATA FETCHING
+@instrumentation.phase("fetch")
+def fetch_page(page = PAGE):
+    # Fetching the actual data from the web
+    return fetcher.get_fetcher().fetch(page).content
+
+# DATA PROCESSING
+@instrumentation.phase("parse")
+def parse_clubs(html, table_id = TABLE_ID):
+    # Extracting every club row of the overall table in a single pass
+    clubs = league_tables.parse_table(html, table_id)
 
-# Extracting the GA
-club_goals_against = np.array([int(item.text) for item in clubs_table.find_all("td", {"data-stat": "goals_against"}) if item is not None])
+    club_names = np.array([club["team"] for club in clubs])
+    club_goals_for = np.array([club["goals_for"] for club in clubs])
+    club_goals_against = np.array([club["goals_against"] for club in clubs])
+
+    return club_names, club_goals_for, club_goals_against
 
 # GRAPH
-# Creating the plot area
-fig, ax = plt.subplots()
+@instrumentation.phase("render")
+def render(club_names, club_goals_for, club_goals_against, season = SEASON):
+    # Creating the branded plot area
+    fig, ax = templates.create_figure((16, 9.5))
+
+    # Setting up graph global defaults
+    ax.set_facecolor(BACKGROUND_COLOR)
+
+    plt.rc("xtick", labelsize = 12)
+    plt.rc("ytick", labelsize = 12)
+
+    # Setting up spine colors
+    ax.spines["top"].set_color(PRIMARY_COLOR)
+    ax.spines["right"].set_color(PRIMARY_COLOR)
+    ax.spines["bottom"].set_color(PRIMARY_COLOR)
+    ax.spines["left"].set_color(PRIMARY_COLOR)
+
+    # Setting up ticks color
+    ax.tick_params(axis = "x", colors = PRIMARY_COLOR, size = 8, labelsize = 13)
+    ax.tick_params(axis = "y", colors = PRIMARY_COLOR, size = 8, labelsize = 13)
+
+    # Setting up title
+    templates.add_title(fig, "CLUBS' GF AND GA DURING THE " + league_tables.get_season_label(season) + " LA LIGA SEASON")
+
+    # Setting up axes labels
+    ax.set_xlabel("Goals for (Attack)", color = PRIMARY_COLOR, family = FONT_FAMILY, fontweight = "bold", fontsize = 15, labelpad = 14)
+    ax.set_ylabel("Goals against (Defense)", color = PRIMARY_COLOR, family = FONT_FAMILY, fontweight = "bold", fontsize = 15, labelpad = 14)
+
+    # Setting up axes limits
+    ax.set_ylim(bottom = club_goals_against.min() - 7, top = club_goals_against.max() + 7)
+
+    # Setting up section labels
+    ax.text(club_goals_for.min() - 1.75, club_goals_against.max() + 5, "Poor attack & Poor defense", color = PRIMARY_COLOR, size = "12", style = "italic", fontfamily = FONT_FAMILY, fontweight = 600, ha = "left", va = "center")
+    ax.text(club_goals_for.min() - 1.75, club_goals_against.min() - 5.25, "Poor attack & Strong defense", color = PRIMARY_COLOR, size = "12", style = "italic", fontfamily = FONT_FAMILY, fontweight = 600, ha = "left", va = "center")
+    ax.text(club_goals_for.max() + 1.75, club_goals_against.min() - 5.25, "Strong attack & Strong defense", color = PRIMARY_COLOR, size = "12", style = "italic", fontfamily = FONT_FAMILY, fontweight = 600, ha = "right", va = "center")
+    ax.text(club_goals_for.max() + 1.75, club_goals_against.max() + 5, "Strong attack & Poor defense", color = PRIMARY_COLOR, size = "12", style = "italic", fontfamily = FONT_FAMILY, fontweight = 600, ha = "right", va = "center")
+
+    # Adding data source text
+    templates.add_source(ax, "FBref", (0.955, -0.095), (1.0, -0.095))
+
+    # Plot the data
+    plt.plot(club_goals_for, club_goals_against, "o")
+
+    # Adding avg lines
+    plt.plot([club_goals_for.mean(), club_goals_for.mean()], [club_goals_against.max() + 3, club_goals_against.min() - 3], linestyle = ":", lw = 1, color = PRIMARY_COLOR)
+    plt.plot([club_goals_for.min(), club_goals_for.max()], [club_goals_against.mean(), club_goals_against.mean()], linestyle = ":", lw = 1, color = PRIMARY_COLOR)
+
+    # Avg line explanation
+    fig.text(0.3915, 0.14, "Average GF", size = 10, transform = plt.gca().transAxes, color = PRIMARY_COLOR, rotation = 90, alpha = 0.75)
+    fig.text(0.85, 0.56, "Average GA", size = 10, transform = plt.gca().transAxes, color = PRIMARY_COLOR, alpha = 0.75)
+
+    # Label the data
+    add_crests(ax, club_names, club_goals_for, club_goals_against)
+
+    return fig
+
+@instrumentation.phase("render")
+def render_small_multiples(columns, seasons, competition = league_tables.DEFAULT_COMPETITION):
+    # One panel per season, all of them sharing the axes so the seasons can be compared at a glance
+    nrows = 2 if len(seasons) > 4 else 1
+    ncols = int(np.ceil(len(seasons) / nrows))
+
+    fig, axes = templates.create_figure((4 * ncols, 4.75 * nrows + 0.5), nrows, ncols)
+    axes = np.atleast_1d(axes).ravel()
+
+    fig.subplots_adjust(left = 0.06, right = 0.98, bottom = 0.1, top = 0.86, wspace = 0.08, hspace = 0.25)
+
+    templates.add_title(fig, "CLUBS' GF AND GA IN LA LIGA, " + league_tables.get_season_label(seasons[0]) + " – " + league_tables.get_season_label(seasons[-1]))
+
+    # Sharing the limits, so every panel uses the same scale
+    goals_for = [value for season in seasons for value in league_tables.get_season(columns, season, competition)[1]]
+    goals_against = [value for season in seasons for value in league_tables.get_season(columns, season, competition)[2]]
+    for i, ax in enumerate(axes):
+        if (i >= len(seasons)):
+            ax.axis("off")
+            continue
+
+        if (len(goals_for) > 0):
+            ax.set_xlim(min(goals_for) - 5, max(goals_for) + 5)
+            ax.set_ylim(min(goals_against) - 5, max(goals_against) + 5)
+
+        if (i % ncols != 0):
+            ax.set_yticklabels([])
+        if (i < len(seasons) - ncols):
+            ax.set_xticklabels([])
 
-# Setting up graph global defaults
-fig.set_size_inches(16, 9.5)
+    for i, season in enumerate(seasons):
+        ax = axes[i]
+        club_names, club_goals_for, club_goals_against = league_tables.get_season(columns, season, competition)
 
-fig.set_facecolor(BACKGROUND_COLOR)
-fig.set_edgecolor(PRIMARY_COLOR)
-ax.set_facecolor(BACKGROUND_COLOR)
+        ax.set_facecolor(BACKGROUND_COLOR)
+        for spine in ax.spines.values():
+            spine.set_color(PRIMARY_COLOR)
+        ax.tick_params(colors = PRIMARY_COLOR, labelsize = 10)
 
-plt.rc("xtick", labelsize = 12)
-plt.rc("ytick", labelsize = 12)
+        ax.set_title(league_tables.get_season_label(season), color = PRIMARY_COLOR, family = FONT_FAMILY, fontweight = "bold", fontsize = 13)
 
-# Setting up spine colors
-ax.spines["top"].set_color(PRIMARY_COLOR)
-ax.spines["right"].set_color(PRIMARY_COLOR)
-ax.spines["bottom"].set_color(PRIMARY_COLOR)
-ax.spines["left"].set_color(PRIMARY_COLOR)
+        if (len(club_names) == 0):
+            continue
 
-# Setting up ticks color
-ax.tick_params(axis = "x", colors = PRIMARY_COLOR, size = 8, labelsize = 13)
-ax.tick_params(axis = "y", colors = PRIMARY_COLOR, size = 8, labelsize = 13)
+        ax.plot(club_goals_for, club_goals_against, "o", color = PRIMARY_COLOR, markersize = 3)
 
-# Setting up title
-plt.suptitle("CLUBS' GF AND GA DURING THE 2022/23 LA LIGA SEASON", y = 0.969, fontsize = 20, fontweight = "bold", family = FONT_FAMILY, color = PRIMARY_COLOR)
+        # Adding avg lines
+        ax.axvline(club_goals_for.mean(), linestyle = ":", lw = 1, color = PRIMARY_COLOR)
+        ax.axhline(club_goals_against.mean(), linestyle = ":", lw = 1, color = PRIMARY_COLOR)
 
-# Setting up axes labels
-ax.set_xlabel("Goals for (Attack)", color = PRIMARY_COLOR, family = FONT_FAMILY, fontweight = "bold", fontsize = 15, labelpad = 14)
-ax.set_ylabel("Goals against (Defense)", color = PRIMARY_COLOR, family = FONT_FAMILY, fontweight = "bold", fontsize = 15, labelpad = 14)
+        add_crests(ax, club_names, club_goals_for, club_goals_against, SMALL_MULTIPLE_CREST_ZOOM, textsize = 7)
 
-# Setting up axes limits
-ax.set_ylim(bottom = club_goals_against.min() - 7, top = club_goals_against.max() + 7)
+    # Setting up axes labels
+    fig.text(0.52, 0.035, "Goals for (Attack)", color = PRIMARY_COLOR, family = FONT_FAMILY, fontweight = "bold", fontsize = 15, ha = "center")
+    fig.text(0.015, 0.48, "Goals against (Defense)", color = PRIMARY_COLOR, family = FONT_FAMILY, fontweight = "bold", fontsize = 15, va = "center", rotation = 90)
 
-# Setting up section labels
-ax.text(club_goals_for.min() - 1.75, club_goals_against.max() + 5, "Poor attack & Poor defense", color = PRIMARY_COLOR, size = "12", style = "italic", fontfamily = FONT_FAMILY, fontweight = 600, ha = "left", va = "center")
-ax.text(club_goals_for.min() - 1.75, club_goals_against.min() - 5.25, "Poor attack & Strong defense", color = PRIMARY_COLOR, size = "12", style = "italic", fontfamily = FONT_FAMILY, fontweight = 600, ha = "left", va = "center")
-ax.text(club_goals_for.max() + 1.75, club_goals_against.min() - 5.25, "Strong attack & Strong defense", color = PRIMARY_COLOR, size = "12", style = "italic", fontfamily = FONT_FAMILY, fontweight = 600, ha = "right", va = "center")
-ax.text(club_goals_for.max() + 1.75, club_goals_against.max() + 5, "Strong attack & Poor defense", color = PRIMARY_COLOR, size = "12", style = "italic", fontfamily = FONT_FAMILY, fontweight = 600, ha = "right", va = "center")
+    # Adding data source text
+    templates.add_source(axes[len(seasons) - 1], "FBref", (0.835, -0.17), (1.0, -0.17))
 
-# Adding logo
-plt.figimage(Image.open("logo.png").resize((100, 100), Image.LANCZOS), xo = 17, yo = -1)
+    return fig
 
-# Adding data source text
-plt.text(0.955, -0.095, "Source:", transform = plt.gca().transAxes, family = FONT_FAMILY, ha = "right", va = "center", color = PRIMARY_COLOR, fontweight = "regular", fontsize = 12)
-plt.text(1.0, -0.095, "FBref", transform = plt.gca().transAxes, family = FONT_FAMILY, ha = "right", va = "center", color = PRIMARY_COLOR, fontweight = "bold", fontsize = 12)
+# RUN
+if __name__ == "__main__":
+    import argparse
 
-# Plot the data
-plt.plot(club_goals_for, club_goals_against, "o")
+    parser = argparse.ArgumentParser(description = "Render the GF/GA chart of a season, or small multiples of many, from the local league tables")
+    parser.add_argument("--season", action = "append", help = "e.g. 2021-2022, " + SEASON + " by default")
+    parser.add_argument("--small-multiples", action = "store_true", help = "render the seasons (the last ten by default) as one figure of small multiples")
+    parser.add_argument("--save-path", default = None, help = "save the charts into this folder instead of showing them")
+    parser.add_argument("--refresh", action = "store_true", help = "revalidate the stored league table pages")
+    args = parser.parse_args()
 
-# Adding avg lines
-plt.plot([club_goals_for.mean(), club_goals_for.mean()], [club_goals_against.max() + 3, club_goals_against.min() - 3], linestyle = ":", lw = 1, color = PRIMARY_COLOR)
-plt.plot([club_goals_for.min(), club_goals_for.max()], [club_goals_against.mean(), club_goals_against.mean()], linestyle = ":", lw = 1, color = PRIMARY_COLOR)
+    seasons = args.season or (league_tables.SEASONS if args.small_multiples else [SEASON])
 
-# Avg line explanation
-fig.text(0.3915, 0.14, "Average GF", size = 10, transform = plt.gca().transAxes, color = PRIMARY_COLOR, rotation = 90, alpha = 0.75)
-fig.text(0.85, 0.56, "Average GA", size = 10, transform = plt.gca().transAxes, color = PRIMARY_COLOR, alpha = 0.75)
+    # Ingesting the missing seasons in one go, every chart then renders from the local table
+    columns = league_tables.load_seasons(seasons, refresh = args.refresh)
 
-# Label the data
-for i in range(len(club_names)):
-    ab = AnnotationBbox(getImage("laliga_teams_22_23_gf_ga_viz/crests/" + club_names[i] + ".png"), (club_goals_for[i], club_goals_against[i]), frameon = False)
-    ax.add_artist(ab)
+    if (args.small_multiples):
+        figures = [("small_multiples", render_small_multiples(columns, seasons))]
+    else:
+        figures = [(season, render(*league_tables.get_season(columns, season), season = season)) for season in seasons]
 
-# Display the vizz
-plt.show()
+    if (args.save_path is None):
+        # Display the vizz
+        plt.show()
+    else:
+        os.makedirs(args.save_path, exist_ok = True)
+        for name, fig in figures:
+            with instrumentation.phase("save"):
+                fig.savefig(os.path.join(args.save_path, "gf_ga_" + name + ".png"), facecolor = fig.get_facecolor())
+            plt.close(fig)
@@ -0,0 +1,198 @@
+# IMPORTS
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import matplotlib.pyplot as plt
+from PIL import Image
+
+import event_store
+import pass_store
+import renderer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import instrumentation
+
+# CONSTANTS
+ANIMATION_FILE_PATH = "messi_busquets_laliga_passes_viz/animation.gif"
+
+# Frames of the animation when the passes carry no season, one per season otherwise
+FRAMES = len(event_store.SEASONS)
+
+# Milliseconds every frame stays on, the complete map stays on for longer before the GIF loops
+FRAME_DURATION = 700
+LAST_FRAME_DURATION = 3000
+
+# Resolution of the frames, the stills are saved at the same one
+DPI = 100
+
+# Colours of the GIF palette, taken from the complete map so every frame shares it and the encoder never has to remap one
+PALETTE_COLORS = 256
+
+# HELPING FUNCTIONS
+def get_frames(all_passes, frames = FRAMES):
+    # The rows drawn by every frame, season by season, or the matches split into even frames in their stored order when the passes have no season
+    season_ids = np.asarray(all_passes["season_id"]) if "season_id" in all_passes else np.full(all_passes["rows"], -1)
+
+    if (len(season_ids) > 0 and (season_ids >= 0).all()):
+        present = set(np.unique(season_ids).tolist())
+        ordered = [season_id for season_id, name in event_store.SEASONS if season_id in present]
+        ordered += sorted(present - set(ordered))
+
+        return [(event_store.get_season_name(season_id), np.flatnonzero(season_ids == season_id)) for season_id in ordered]
+
+    match_ids = np.asarray(all_passes["match_id"]) if "match_id" in all_passes else np.arange(all_passes["rows"])
+    unique_match_ids, first_rows = np.unique(match_ids, return_index = True)
+    unique_match_ids = unique_match_ids[np.argsort(first_rows)]
+
+    chunks = [chunk for chunk in np.array_split(unique_match_ids, min(frames, len(unique_match_ids))) if len(chunk) > 0]
+    start = 0
+    labelled = []
+    for chunk in chunks:
+        labelled.append(("MATCHES " + str(start + 1) + "–" + str(start + len(chunk)), np.flatnonzero(np.isin(match_ids, chunk))))
+        start += len(chunk)
+
+    return labelled
+
+def get_overlays(ax, zorder = renderer.PASS_ZORDER):
+    # Everything the still draws above the passes, it is kept out of the background and drawn on top of every frame, the axis stays hidden like in the still
+    hidden = [ax.patch] + ([] if ax.axison else [ax.xaxis, ax.yaxis] + list(ax.spines.values()))
+
+    return [artist for artist in ax.get_children() if artist.get_zorder() > zorder and artist.get_visible() and not artist.get_animated() and artist not in hidden]
+
+def grab_frame(canvas):
+    return Image.frombuffer("RGBA", canvas.get_width_height(), bytes(canvas.buffer_rgba()), "raw", "RGBA", 0, 1).convert("RGB")
+
+def write_gif(images, save_path, frame_duration = FRAME_DURATION, last_frame_duration = LAST_FRAME_DURATION):
+    # The complete map holds every colour of the animation, one shared palette keeps the frames from flickering
+    palette = images[-1].quantize(colors = PALETTE_COLORS, method = Image.Quantize.MEDIANCUT)
+    frames = [image.quantize(palette = palette, dither = Image.Dither.NONE) for image in images]
+
+    durations = [frame_duration] * (len(frames) - 1) + [last_frame_duration]
+    frames[0].save(save_path, save_all = True, append_images = frames[1:], duration = durations, loop = 0, optimize = False)
+
+# FUNCTIONS
+def animate(all_passes, title, subtitle, save_path = ANIMATION_FILE_PATH, frames = FRAMES, dpi = DPI):
+    # Drawing the pitch and the branding once, every frame then only blits its own batch of passes onto the map drawn so far
+    stats = {"frames": 0, "passes": 0, "frame_times": []}
+    start = time.perf_counter()
+
+    with instrumentation.phase("render"):
+        fig, ax = renderer.create_pass_map(title, subtitle)
+        fig.set_dpi(dpi)
+
+        # The texts changing every frame and whatever covers the passes are left out of the background, so nothing gets drawn over itself
+        totals_texts = renderer.add_pass_totals(ax, 0, 0)
+        frame_text = ax.text(0.985, 0.97, "", transform = ax.transAxes, family = renderer.FONT_FAMILY, ha = "right", va = "top", color = renderer.PRIMARY_COLOR, fontweight = "bold", fontsize = 16, style = "italic")
+        animated = get_overlays(ax) + list(totals_texts) + [frame_text]
+        for artist in animated:
+            artist.set_animated(True)
+
+        canvas = fig.canvas
+        canvas.draw()
+        background = canvas.copy_from_bbox(fig.bbox)
+
+        x, y, end_x, end_y, incomplete = [np.asarray(values) for values in pass_store.get_coordinates(all_passes)]
+
+    stats["setup_time"] = time.perf_counter() - start
+
+    images = []
+    non_successful_passes = 0
+    for label, rows in get_frames(all_passes, frames):
+        frame_start = time.perf_counter()
+
+        with instrumentation.phase("render"):
+            canvas.restore_region(background)
+
+            quiver = renderer.draw_passes(ax, x[rows], y[rows], end_x[rows], end_y[rows], incomplete[rows])
+            if (quiver is not None):
+                ax.draw_artist(quiver)
+
+            # The passes so far become the background of the next frame
+            background = canvas.copy_from_bbox(fig.bbox)
+
+            stats["passes"] += len(rows)
+            non_successful_passes += int(incomplete[rows].sum())
+            renderer.update_pass_totals(totals_texts, stats["passes"], non_successful_passes)
+            frame_text.set_text(label)
+            for artist in animated:
+                ax.draw_artist(artist)
+
+            images.append(grab_frame(canvas))
+
+        stats["frames"] += 1
+        stats["frame_times"].append(time.perf_counter() - frame_start)
+
+    encode_start = time.perf_counter()
+    if (save_path is not None and len(images) > 0):
+        with instrumentation.phase("save"):
+            write_gif(images, save_path)
+    stats["encode_time"] = time.perf_counter() - encode_start
+
+    # The figure ends up as the complete still, totals included
+    frame_text.remove()
+    for artist in animated:
+        artist.set_animated(False)
+
+    stats["time"] = time.perf_counter() - start
+
+    return fig, stats
+
+def render_still(all_passes, title, subtitle, dpi = DPI):
+    # A full render and save of the still pass map, what every frame would cost without blitting
+    import io
+
+    import viz
+
+    start = time.perf_counter()
+    fig = viz.render(all_passes, title, subtitle)
+    fig.savefig(io.BytesIO(), format = "png", dpi = dpi, facecolor = fig.get_facecolor())
+    plt.close(fig)
+
+    return time.perf_counter() - start
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    import ingest
+    import viz
+
+    plt.switch_backend("Agg")
+
+    parser = argparse.ArgumentParser(description = "Export the pass map as a GIF building up season by season")
+    parser.add_argument("--save-path", default = ANIMATION_FILE_PATH)
+    parser.add_argument("--from-events", action = "store_true", help = "animate the passes between any two players of the event store instead of the pass store")
+    parser.add_argument("--passer", default = ingest.PASSER)
+    parser.add_argument("--recipient", default = ingest.RECIPIENT)
+    parser.add_argument("--frames", type = int, default = FRAMES, help = "frames of the animation when the passes have no season ids")
+    parser.add_argument("--dpi", type = int, default = DPI)
+    parser.add_argument("--compare-still", action = "store_true", help = "also time a full render of the still pass map")
+    args = parser.parse_args()
+
+    if (args.from_events):
+        if (not event_store.exists()):
+            sys.exit("No event store in " + event_store.STORE_PATH + " yet, build it with event_store.py --ingest")
+
+        all_passes = event_store.get_passes(event_store.load_store(), args.passer, args.recipient, columns = event_store.PASS_COLUMNS + ["season_id", "match_id"])
+        title = (args.passer + "' passes to " + args.recipient).upper()
+        subtitle = "Seasons from " + event_store.SEASONS[0][1] + " – " + event_store.SEASONS[-1][1] + " | LaLiga"
+    else:
+        all_passes = viz.load_passes()
+        title, subtitle = viz.TITLE, viz.SUBTITLE
+
+    fig, stats = animate(all_passes, title, subtitle, args.save_path, args.frames, args.dpi)
+    plt.close(fig)
+
+    frame_times = stats["frame_times"]
+    print("Animated {} passes in {} frames in {:.2f}s: setup {:.3f}s, frames {:.3f}s (mean {:.1f}ms, p50 {:.1f}ms, max {:.1f}ms), GIF encoding {:.3f}s".format(stats["passes"], stats["frames"], stats["time"], stats["setup_time"], sum(frame_times), statistics.mean(frame_times) * 1000 if frame_times else 0, statistics.median(frame_times) * 1000 if frame_times else 0, max(frame_times, default = 0) * 1000, stats["encode_time"]))
+
+    if (args.compare_still):
+        render_still(all_passes, title, subtitle, args.dpi)
+        still_time = render_still(all_passes, title, subtitle, args.dpi)
+        print("One still renders in {:.3f}s, the animation took as long as {:.1f} stills".format(still_time, stats["time"] / still_time))
@@ -0,0 +1,184 @@
+# IMPORTS
+import os
+import sys
+import time
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import LinearSegmentedColormap
+
+import pass_store
+import renderer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import templates
+
+# CONSTANTS
+# StatsBomb pitch coordinates the grids are binned in
+PITCH_LENGTH = 120
+PITCH_WIDTH = 80
+
+# The grids are drawn in the StatsBomb coordinates the passes are drawn in, so a heatmap under the pass map lines up with the arrows
+PITCH_EXTENT = (0, PITCH_LENGTH, 0, PITCH_WIDTH)
+
+# 20 x 20 yard zones for the binned counts and success rates
+ZONE_BINS = (6, 4)
+
+# Half yard cells for the density surface, smoothed by a gaussian kernel of this many yards
+DENSITY_BINS = (240, 160)
+BANDWIDTH = 3
+
+# The kernel is cut off this many bandwidths from its centre, the grid is zero padded by as much so nothing wraps around
+KERNEL_RADIUS = 4
+
+HEATMAP_COLOR = "#a277ff"
+HEATMAP_ALPHA = 0.85
+
+KINDS = ["density", "origins", "destinations", "success"]
+
+# Kernel transforms, computed once per grid shape and bandwidth
+cache = {}
+
+# HELPING FUNCTIONS
+def get_cell_size(bins):
+    return PITCH_LENGTH / bins[0], PITCH_WIDTH / bins[1]
+
+def get_cells(x, y, bins):
+    # The flat cell index of every point, points without a location are dropped
+    x, y = np.asarray(x, dtype = np.float64), np.asarray(y, dtype = np.float64)
+    valid = np.isfinite(x) & np.isfinite(y)
+
+    columns = np.clip((x[valid] / PITCH_LENGTH * bins[0]).astype(np.int64), 0, bins[0] - 1)
+    rows = np.clip((y[valid] / PITCH_WIDTH * bins[1]).astype(np.int64), 0, bins[1] - 1)
+
+    return rows * bins[0] + columns, valid
+
+def bin_points(x, y, bins, weights = None):
+    # Counting the points per cell in one bincount, rows are y and columns are x like the pitch
+    cells, valid = get_cells(x, y, bins)
+    if (weights is not None):
+        weights = np.asarray(weights, dtype = np.float64)[valid]
+
+    return np.bincount(cells, weights = weights, minlength = bins[0] * bins[1]).reshape(bins[1], bins[0])
+
+def get_kernel(shape, bins, bandwidth):
+    key = (shape, bins, bandwidth)
+    if (key not in cache):
+        cell_length, cell_width = get_cell_size(bins)
+
+        # Distances from the kernel centre in yards, wrapped around so the centre sits on cell 0
+        dy = np.fft.fftfreq(shape[0], 1 / shape[0]) * cell_width
+        dx = np.fft.fftfreq(shape[1], 1 / shape[1]) * cell_length
+
+        kernel = np.exp(-(dy[:, None] ** 2 + dx[None, :] ** 2) / (2 * bandwidth ** 2))
+        cache[key] = np.fft.rfft2(kernel / kernel.sum())
+
+    return cache[key]
+
+def get_colormap(color = HEATMAP_COLOR):
+    return LinearSegmentedColormap.from_list("heatmap", [templates.BACKGROUND_COLOR, color])
+
+# FUNCTIONS
+def get_zones(x, y, end_x, end_y, incomplete, bins = ZONE_BINS):
+    # Where the passes start and end, and how many of those started in a zone were successful
+    origins = bin_points(x, y, bins)
+    successful = bin_points(x, y, bins, weights = ~np.asarray(incomplete, dtype = bool))
+
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        success_rate = np.where(origins > 0, successful / origins * 100, np.nan)
+
+    return {"origins": origins, "destinations": bin_points(end_x, end_y, bins), "success_rate": success_rate}
+
+def get_density(x, y, bins = DENSITY_BINS, bandwidth = BANDWIDTH, weights = None):
+    # Binning every point once and smoothing the whole grid with one FFT convolution, the cost does not grow with the points
+    counts = bin_points(x, y, bins, weights)
+
+    cell_length, cell_width = get_cell_size(bins)
+    padding = (int(np.ceil(KERNEL_RADIUS * bandwidth / cell_width)), int(np.ceil(KERNEL_RADIUS * bandwidth / cell_length)))
+    shape = (bins[1] + padding[0], bins[0] + padding[1])
+
+    smoothed = np.fft.irfft2(np.fft.rfft2(counts, s = shape) * get_kernel(shape, bins, bandwidth), s = shape)[:bins[1], :bins[0]]
+
+    # Passes per square yard, the FFT leaves tiny negative values where the grid is empty
+    return np.maximum(smoothed, 0) / (cell_length * cell_width)
+
+def get_grid(all_passes, kind, zone_bins = ZONE_BINS, density_bins = DENSITY_BINS, bandwidth = BANDWIDTH):
+    x, y, end_x, end_y, incomplete = pass_store.get_coordinates(all_passes)
+
+    if (kind == "density"):
+        return get_density(x, y, density_bins, bandwidth)
+
+    zones = get_zones(x, y, end_x, end_y, incomplete, zone_bins)
+
+    return zones["success_rate"] if kind == "success" else zones[kind]
+
+def draw_heatmap(ax, grid, smooth = False, color = HEATMAP_COLOR, vmin = None, vmax = None):
+    # One image over the pitch, below its lines, imshow would otherwise crop the view to the image
+    limits = ax.get_xlim(), ax.get_ylim()
+    image = ax.imshow(np.ma.masked_invalid(grid), extent = PITCH_EXTENT, origin = "lower", aspect = "auto", cmap = get_colormap(color), vmin = vmin, vmax = vmax, alpha = HEATMAP_ALPHA, interpolation = "bilinear" if smooth else "nearest", zorder = 0)
+    ax.set_xlim(limits[0])
+    ax.set_ylim(limits[1])
+
+    return image
+
+def add_zone_labels(ax, grid, text_format = "{:.0f}"):
+    # Writing every zone's value at its centre, empty zones stay blank
+    cell_length, cell_width = (PITCH_EXTENT[1] - PITCH_EXTENT[0]) / grid.shape[1], (PITCH_EXTENT[3] - PITCH_EXTENT[2]) / grid.shape[0]
+
+    texts = []
+    for row, column in zip(*np.nonzero(np.isfinite(grid))):
+        texts.append(ax.text(PITCH_EXTENT[0] + (column + 0.5) * cell_length, PITCH_EXTENT[2] + (row + 0.5) * cell_width, text_format.format(grid[row, column]), ha = "center", va = "center", family = templates.FONT_FAMILY, color = templates.PRIMARY_COLOR, fontweight = "bold", fontsize = 13, zorder = 3))
+
+    return texts
+
+def render(all_passes, kind, title, subtitle):
+    # The branded pitch of the pass map, with the heatmap where the arrows would be
+    fig, ax = renderer.create_pass_map(title, subtitle, legend = False)
+
+    grid = get_grid(all_passes, kind)
+    if (kind == "density"):
+        draw_heatmap(ax, grid, smooth = True)
+    elif (kind == "success"):
+        draw_heatmap(ax, grid, vmin = 0, vmax = 100)
+        add_zone_labels(ax, grid, "{:.0f}%")
+    else:
+        draw_heatmap(ax, grid)
+        add_zone_labels(ax, np.where(grid > 0, grid, np.nan))
+
+    renderer.add_pass_totals(ax, all_passes["rows"], int(pass_store.get_incomplete(all_passes).sum()))
+
+    return fig
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    import viz
+
+    parser = argparse.ArgumentParser(description = "Render the passes of the pass map as a density surface or as zone heatmaps")
+    parser.add_argument("--kind", choices = KINDS, default = "density")
+    parser.add_argument("--save-path", default = None, help = "save the heatmap into this file instead of showing it")
+    parser.add_argument("--repeat", type = int, default = None, help = "only time the grids over the passes tiled this many times")
+    args = parser.parse_args()
+
+    all_passes = viz.load_passes()
+
+    if (args.repeat is not None):
+        x, y, end_x, end_y, incomplete = [np.tile(np.asarray(values), args.repeat) for values in pass_store.get_coordinates(all_passes)]
+
+        for name, build in [("density", lambda: get_density(x, y)), ("zones", lambda: get_zones(x, y, end_x, end_y, incomplete))]:
+            build()
+            start = time.perf_counter()
+            build()
+            print("{:<8} {:>8} passes {:>8.2f}ms".format(name, len(x), (time.perf_counter() - start) * 1000))
+        sys.exit(0)
+
+    fig = render(all_passes, args.kind, viz.TITLE, viz.SUBTITLE)
+
+    if (args.save_path is None):
+        plt.show()
+    else:
+        fig.savefig(args.save_path, facecolor = fig.get_facecolor())
@@ -0,0 +1,319 @@
+# IMPORTS
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import pass_network
+import pass_store
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import fetcher
+from shared import instrumentation
+
+# CONSTANTS
+EVENTS_PATH = "messi_busquets_laliga_passes_viz/events/"
+CHECKPOINTS_PATH = EVENTS_PATH + "matches/"
+STORE_PATH = EVENTS_PATH + "store/"
+META_FILE_NAME = "meta.json"
+
+WORKERS = 8
+
+# StatsBomb's LaLiga seasons with Messi, oldest first, the season ids themselves are not in chronological order
+SEASONS = [
+    (41, "2008/2009"), (21, "2009/2010"), (22, "2010/2011"), (23, "2011/2012"), (24, "2012/2013"), (25, "2013/2014"), (26, "2014/2015"),
+    (27, "2015/2016"), (2, "2016/2017"), (1, "2017/2018"), (4, "2018/2019"), (42, "2019/2020"), (90, "2020/2021"),
+]
+
+# Every kept event column and the StatsBomb column it comes from, the strings get dictionary encoded
+CATEGORICAL_COLUMNS = {"type": "type", "player": "player", "recipient": "pass_recipient", "team": "team", "outcome": "pass_outcome"}
+INTEGER_COLUMNS = {"match_id": ("match_id", np.int32), "season_id": ("season_id", np.int16), "index": ("index", np.int32), "period": ("period", np.int8), "minute": ("minute", np.int16)}
+LOCATION_COLUMNS = {"location": ("x", "y"), "pass_end_location": ("end_x", "end_y")}
+
+# Columns with a posting list per value, every query narrows the rows through them
+INDEXED_COLUMNS = ["type", "player", "recipient", "match_id", "season_id"]
+
+# The columns the pass map renderer reads
+PASS_COLUMNS = ["x", "y", "end_x", "end_y", "outcome"]
+
+# HELPING FUNCTIONS
+def get_checkpoint_path(match_id):
+    return CHECKPOINTS_PATH + str(match_id) + ".npz"
+
+def get_season_ids(first_season = None, last_season = None):
+    # The ids of every season from first to last, both given by name like 2008/2009
+    names = [name for season_id, name in SEASONS]
+    first = names.index(first_season) if first_season is not None else 0
+    last = names.index(last_season) if last_season is not None else len(SEASONS) - 1
+
+    return [season_id for season_id, name in SEASONS[first:last + 1]]
+
+def get_season_name(season_id):
+    return dict(SEASONS).get(season_id, str(season_id))
+
+def parse_locations(column):
+    # Only passes carry an end location, the other events keep NaN
+    locations = np.full((len(column), 2), np.nan, dtype = np.float32)
+
+    present = column.notna().to_numpy()
+    if (present.any()):
+        locations[present] = pass_store.parse_locations(column[present])
+
+    return locations
+
+def get_code_type(size):
+    return np.int8 if size < 128 else np.int16 if size < 32768 else np.int32
+
+def write_index(codes, size, store_path, name):
+    # A posting list per value, the rows of value i are rows[offsets[i]:offsets[i + 1]] in ascending order
+    rows = np.argsort(codes, kind = "stable").astype(np.int32)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength = size))]).astype(np.int64)
+
+    np.save(store_path + "index_" + name + "_rows.npy", rows)
+    np.save(store_path + "index_" + name + "_offsets.npy", offsets)
+
+def to_values(values):
+    return values if isinstance(values, (list, tuple, range, np.ndarray)) else [values]
+
+def intersect(rows, other_rows):
+    # Both sides are sorted, so every row of the smaller side is looked up in the larger one by binary search
+    if (len(other_rows) == 0):
+        return rows[:0]
+
+    positions = np.minimum(np.searchsorted(other_rows, rows), len(other_rows) - 1)
+
+    return rows[other_rows[positions] == rows]
+
+# FUNCTIONS
+def project_events(events, season_id = -1):
+    # Keeping the columns the store needs as plain arrays, which is also what a match checkpoint holds
+    columns = {}
+
+    for name, source in CATEGORICAL_COLUMNS.items():
+        columns[name] = events[source].fillna("").astype(str).to_numpy(dtype = str) if source in events.columns else np.full(len(events), "", dtype = str)
+
+    for name, (source, dtype) in INTEGER_COLUMNS.items():
+        if (source in events.columns):
+            columns[name] = events[source].fillna(-1).to_numpy().astype(dtype)
+        else:
+            columns[name] = np.full(len(events), season_id if name == "season_id" else -1, dtype = dtype)
+
+    for source, (x_name, y_name) in LOCATION_COLUMNS.items():
+        locations = parse_locations(events[source]) if source in events.columns else np.full((len(events), 2), np.nan, dtype = np.float32)
+        columns[x_name], columns[y_name] = locations[:, 0], locations[:, 1]
+
+    return columns
+
+def ingest_match(match_id, season_id):
+    from statsbombpy import sb
+    fetcher.route_statsbomb()
+
+    columns = project_events(sb.events(match_id = match_id), season_id)
+
+    # Checkpointing through a temporary file, so an interrupted write never looks like an ingested match
+    checkpoint_path = get_checkpoint_path(match_id)
+    with open(checkpoint_path + ".tmp", "wb") as file:
+        np.savez_compressed(file, **columns)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+    return match_id, season_id, columns
+
+@instrumentation.phase("fetch")
+def ingest(matches, workers = WORKERS):
+    os.makedirs(CHECKPOINTS_PATH, exist_ok = True)
+
+    # Every event of a match is kept, so any pair of players can be queried without fetching the match again
+    pending_matches = [(match_id, season_id) for match_id, season_id in matches if not os.path.exists(get_checkpoint_path(match_id))]
+    if (len(pending_matches) == 0):
+        return []
+
+    ingested = []
+    with ThreadPoolExecutor(max_workers = max(1, min(workers, len(pending_matches)))) as executor:
+        futures = [executor.submit(ingest_match, match_id, season_id) for match_id, season_id in pending_matches]
+        for future in as_completed(futures):
+            try:
+                match_id, season_id, columns = future.result()
+            except Exception as error:
+                # The match stays pending and gets picked up by the next run
+                print("Could not ingest a match: " + str(error))
+                continue
+
+            # Merging the match into the pass matrices as it arrives, on this thread only, so the player codes are never written concurrently
+            pass_network.add_match(match_id, season_id, columns)
+            ingested.append((match_id, len(columns["type"])))
+
+    return ingested
+
+@instrumentation.phase("save")
+def write_store(chunks, store_path = STORE_PATH):
+    os.makedirs(store_path, exist_ok = True)
+
+    columns = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+    # Sorting by season, match and event, so the rows of a match or a season are contiguous
+    order = np.lexsort((columns["index"], columns["match_id"], columns["season_id"]))
+    columns = {name: values[order] for name, values in columns.items()}
+
+    categories = {}
+    for name in CATEGORICAL_COLUMNS:
+        keys, codes = np.unique(columns[name], return_inverse = True)
+        columns[name] = codes.astype(get_code_type(len(keys)))
+        categories[name] = [str(key) for key in keys]
+
+    # Every column is a raw .npy file, so it can be memory-mapped on load
+    for name, values in columns.items():
+        np.save(store_path + name + ".npy", np.ascontiguousarray(values))
+
+    for name in INDEXED_COLUMNS:
+        if (name in categories):
+            write_index(columns[name].astype(np.int64), len(categories[name]), store_path, name)
+        else:
+            keys, codes = np.unique(columns[name], return_inverse = True)
+            np.save(store_path + "index_" + name + "_keys.npy", keys)
+            write_index(codes, len(keys), store_path, name)
+
+    with open(store_path + META_FILE_NAME + ".tmp", "w", encoding = "utf-8") as file:
+        json.dump({"rows": len(order), "columns": list(columns.keys()), "categories": categories, "indexes": INDEXED_COLUMNS}, file, ensure_ascii = False, indent = 4)
+    os.replace(store_path + META_FILE_NAME + ".tmp", store_path + META_FILE_NAME)
+
+    return len(order)
+
+def build_store(match_ids, store_path = STORE_PATH):
+    # Rebuilding the store from the match checkpoints, the events are only fetched once
+    chunks = []
+    for match_id in match_ids:
+        with np.load(get_checkpoint_path(match_id)) as checkpoint:
+            chunks.append({name: checkpoint[name] for name in checkpoint.files})
+
+    return write_store(chunks, store_path)
+
+def exists(store_path = STORE_PATH):
+    return os.path.exists(store_path + META_FILE_NAME)
+
+def load_store(store_path = STORE_PATH, mmap = True):
+    with open(store_path + META_FILE_NAME, "r", encoding = "utf-8") as file:
+        meta = json.load(file)
+
+    mmap_mode = "r" if mmap else None
+
+    # Memory-mapping the columns and the posting lists, a query only touches the pages of the rows it returns
+    store = {name: np.load(store_path + name + ".npy", mmap_mode = mmap_mode) for name in meta["columns"]}
+    store["rows"] = meta["rows"]
+    store["categories"] = meta["categories"]
+
+    store["indexes"] = {}
+    for name in meta["indexes"]:
+        if (name in meta["categories"]):
+            keys = {key: code for code, key in enumerate(meta["categories"][name])}
+        else:
+            keys = {int(key): code for code, key in enumerate(np.load(store_path + "index_" + name + "_keys.npy"))}
+
+        store["indexes"][name] = (keys, np.load(store_path + "index_" + name + "_offsets.npy"), np.load(store_path + "index_" + name + "_rows.npy", mmap_mode = mmap_mode))
+
+    return store
+
+def get_rows(store, name, values):
+    keys, offsets, rows = store["indexes"][name]
+    codes = sorted(keys[value] for value in to_values(values) if value in keys)
+
+    parts = [np.asarray(rows[offsets[code]:offsets[code + 1]]) for code in codes]
+    if (len(parts) == 0):
+        return np.empty(0, dtype = np.int32)
+    if (len(parts) == 1):
+        return parts[0]
+
+    # The posting lists of the match and season indexes follow each other, the others need merging
+    rows = np.concatenate(parts)
+
+    return rows if np.all(rows[1:] > rows[:-1]) else np.sort(rows)
+
+def query(store, columns = PASS_COLUMNS, **filters):
+    # Intersecting the posting lists from the shortest one up, then materializing only the asked columns of the matching rows
+    postings = sorted([get_rows(store, name, values) for name, values in filters.items() if values is not None], key = len)
+
+    rows = postings[0] if len(postings) > 0 else np.arange(store["rows"], dtype = np.int32)
+    for other_rows in postings[1:]:
+        rows = intersect(rows, other_rows)
+
+    # The same shape as the pass store, so the result goes straight into the pass map renderer
+    result = {name: np.asarray(store[name][rows]) for name in columns}
+    result["rows"] = len(rows)
+    result["categories"] = {name: store["categories"][name] for name in columns if name in store["categories"]}
+
+    return result
+
+def get_passes(store, passer, recipient = None, season_ids = None, columns = PASS_COLUMNS):
+    return query(store, columns, type = "Pass", player = passer, recipient = recipient, season_id = season_ids)
+
+def find_players(store, text, column = "player"):
+    return [player for player in store["categories"][column] if text.lower() in player.lower()]
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    import ingest as pass_ingest
+
+    parser = argparse.ArgumentParser(description = "Ingest every StatsBomb LaLiga event once into an indexed columnar store and query the passes between any two players")
+    parser.add_argument("--ingest", action = "store_true", help = "fetch the events of every match of the seasons, resuming from the match checkpoints, and rebuild the store")
+    parser.add_argument("--from-csv", default = None, help = "rebuild the store from an events CSV instead, e.g. " + pass_ingest.DATA_FILE_PATH)
+    parser.add_argument("--workers", type = int, default = WORKERS)
+    parser.add_argument("--passer", default = pass_ingest.PASSER)
+    parser.add_argument("--recipient", default = pass_ingest.RECIPIENT)
+    parser.add_argument("--from-season", default = None, help = "e.g. 2008/2009, the first season by default")
+    parser.add_argument("--to-season", default = None, help = "e.g. 2020/2021, the last season by default")
+    parser.add_argument("--render", action = "store_true", help = "draw the passes on the pass map")
+    parser.add_argument("--save-path", default = None, help = "save the pass map into this file instead of showing it")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    if (args.ingest):
+        matches = pass_ingest.get_matches([season_id for season_id, name in SEASONS])
+        ingest(matches, args.workers)
+        rows = build_store([match_id for match_id, season_id in matches if os.path.exists(get_checkpoint_path(match_id))])
+        print("Stored {} events in {:.2f}s".format(rows, time.perf_counter() - start))
+    elif (args.from_csv is not None):
+        import pandas as pd
+
+        rows = write_store([project_events(pd.read_csv(args.from_csv))])
+        print("Stored {} events in {:.2f}s".format(rows, time.perf_counter() - start))
+
+    if (not exists()):
+        sys.exit("No event store in " + STORE_PATH + " yet, build it with --ingest")
+
+    store = load_store()
+    for player, column in [(args.passer, "player"), (args.recipient, "recipient")]:
+        if (player not in store["categories"][column]):
+            sys.exit(player + " is not in the store, did you mean one of: " + ", ".join(find_players(store, player.split(" ")[0], column)))
+
+    # Seasons missing from the store are skipped, a store built from a CSV without season ids only has -1
+    season_ids = get_season_ids(args.from_season, args.to_season) if args.from_season is not None or args.to_season is not None else None
+
+    start = time.perf_counter()
+    passes = get_passes(store, args.passer, args.recipient, season_ids)
+    query_time = time.perf_counter() - start
+
+    incomplete = int(pass_store.get_incomplete(passes).sum())
+    print("{} passes from {} to {} ({} incomplete) out of {} events in {:.2f}ms".format(passes["rows"], args.passer, args.recipient, incomplete, store["rows"], query_time * 1000))
+
+    if (args.render):
+        import matplotlib.pyplot as plt
+
+        import viz
+
+        first_season = get_season_name(season_ids[0]) if season_ids is not None else SEASONS[0][1]
+        last_season = get_season_name(season_ids[-1]) if season_ids is not None else SEASONS[-1][1]
+
+        fig = viz.render(passes, (args.passer + "' passes to " + args.recipient).upper(), "Seasons from " + first_season + " – " + last_season + " | LaLiga")
+
+        if (args.save_path is None):
+            plt.show()
+        else:
+            fig.savefig(args.save_path, facecolor = fig.get_facecolor())
@@ -0,0 +1,136 @@
+# IMPORTS
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import pass_store
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import fetcher
+from shared import instrumentation
+
+# CONSTANTS
+DATA_FILE_PATH = "messi_busquets_laliga_passes_viz/passes.csv"
+CHECKPOINTS_PATH = "messi_busquets_laliga_passes_viz/matches/"
+
+WORKERS = 8
+
+COMPETITION_ID = 11 # LaLiga
+SEASON_IDS = np.array([90, 42, 4, 1, 2, 27, 26, 25, 24, 23, 22, 21, 41]) # as Messi's first match with Busquets was in September 2008 against Racing Santander
+
+PASSER = "Sergio Busquets i Burgos"
+RECIPIENT = "Lionel Andrés Messi Cuccittini"
+
+# FUNCTIONS
+def get_pair_path(passer = PASSER, recipient = RECIPIENT):
+    # The checkpoints only hold the passes between one pair of players, so every pair gets its own folder
+    return CHECKPOINTS_PATH + hashlib.sha1((passer + "|" + recipient).encode("utf-8")).hexdigest()[:12] + "/"
+
+def get_checkpoint_path(match_id, passer = PASSER, recipient = RECIPIENT):
+    return get_pair_path(passer, recipient) + str(match_id) + ".csv"
+
+def get_matches(season_ids = SEASON_IDS, competition_id = COMPETITION_ID):
+    # statsbombpy and its HTTP stack are only imported once something actually gets ingested
+    from statsbombpy import sb
+    fetcher.route_statsbomb()
+
+    # Returning (match_id, season_id) pairs, so every stored pass knows its season
+    return [(match_id, season_id) for season_id in season_ids for match_id in sb.matches(competition_id = competition_id, season_id = season_id)["match_id"]]
+
+def filter_passes(events, passer = PASSER, recipient = RECIPIENT):
+    # One vectorized mask over the whole match instead of re-reading the events for every condition
+    if ("pass_recipient" not in events.columns):
+        return events.iloc[0:0]
+
+    return events[(events["type"] == "Pass") & (events["player"] == passer) & (events["pass_recipient"] == recipient)]
+
+def ingest_match(match_id, season_id, passer = PASSER, recipient = RECIPIENT):
+    from statsbombpy import sb
+    fetcher.route_statsbomb()
+
+    # Loading the match events only once
+    passes = filter_passes(sb.events(match_id = match_id), passer, recipient).assign(season_id = season_id)
+
+    # Checkpointing through a temporary file, so an interrupted write never looks like an ingested match
+    checkpoint_path = get_checkpoint_path(match_id, passer, recipient)
+    passes.to_csv(checkpoint_path + ".tmp", index = False)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+    return match_id, len(passes)
+
+def get_pending_match_ids(match_ids, passer = PASSER, recipient = RECIPIENT):
+    return [match_id for match_id in match_ids if not os.path.exists(get_checkpoint_path(match_id, passer, recipient))]
+
+@instrumentation.phase("fetch")
+def ingest(matches, passer = PASSER, recipient = RECIPIENT, workers = WORKERS):
+    os.makedirs(get_pair_path(passer, recipient), exist_ok = True)
+
+    # Only the matches missing from the local store get fetched
+    pending_match_ids = get_pending_match_ids([match_id for match_id, season_id in matches], passer, recipient)
+    pending_matches = [(match_id, season_id) for match_id, season_id in matches if match_id in pending_match_ids]
+    if (len(pending_matches) == 0):
+        return []
+
+    workers = max(1, min(workers, len(pending_matches)))
+
+    # The crawl waits on the network most of the time, so threads are enough to overlap the matches
+    ingested = []
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        futures = [executor.submit(ingest_match, match_id, season_id, passer, recipient) for match_id, season_id in pending_matches]
+        for future in as_completed(futures):
+            try:
+                ingested.append(future.result())
+            except Exception as error:
+                # The match stays pending and gets picked up by the next run
+                print("Could not ingest a match: " + str(error))
+
+    return ingested
+
+@instrumentation.phase("process")
+def combine(match_ids, passer = PASSER, recipient = RECIPIENT):
+    # Concating the checkpoints of the requested matches in their original order
+    checkpoint_paths = [get_checkpoint_path(match_id, passer, recipient) for match_id in match_ids]
+    frames = [pd.read_csv(checkpoint_path) for checkpoint_path in checkpoint_paths if os.path.exists(checkpoint_path)]
+    frames = [frame for frame in frames if len(frame) > 0]
+
+    if (len(frames) == 0):
+        return pd.DataFrame()
+
+    return pd.concat(frames, ignore_index = True)
+
+def build_passes(season_ids = SEASON_IDS, passer = PASSER, recipient = RECIPIENT, workers = WORKERS):
+    matches = get_matches(season_ids)
+    ingest(matches, passer, recipient, workers)
+
+    match_ids = [match_id for match_id, season_id in matches]
+
+    pending_match_ids = get_pending_match_ids(match_ids, passer, recipient)
+    if (len(pending_match_ids) > 0):
+        raise RuntimeError(str(len(pending_match_ids)) + " matches could not be ingested, run the ingestion again to resume")
+
+    all_passes = combine(match_ids, passer, recipient)
+
+    with instrumentation.phase("save"):
+        all_passes.to_csv(DATA_FILE_PATH, index = False)
+        pass_store.write_store(all_passes, source_path = DATA_FILE_PATH)
+
+    return all_passes
+
+# RUN
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Ingest the StatsBomb LaLiga passes between two players into " + DATA_FILE_PATH)
+    parser.add_argument("--workers", type = int, default = WORKERS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    all_passes = build_passes(workers = args.workers)
+    print("Stored {} passes in {:.2f}s".format(len(all_passes), time.perf_counter() - start))
@@ -0,0 +1,278 @@
+# IMPORTS
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+# CONSTANTS
+NETWORKS_PATH = "messi_busquets_laliga_passes_viz/events/networks/"
+PLAYERS_FILE_NAME = "players.json"
+
+# StatsBomb attacks towards x = 120, the goal mouth is centred on y = 40
+GOAL = (120, 40)
+
+# Every matrix holds these values per passer and recipient pair. The matrices are kept as sorted COO arrays rather than scipy.sparse ones, although
+# scipy comes with mplsoccer: the four values share one set of pairs, a merge is a single np.unique over the packed pair keys, a lookup a single binary
+# search, and the arrays go into an npz as they are
+VALUES = {"passes": np.int32, "completed": np.int32, "incomplete": np.int32, "progressive": np.float32}
+
+TOP_CONNECTIONS = 10
+
+# Player codes, loaded once per process
+players = {"names": None, "codes": None}
+
+# HELPING FUNCTIONS
+def get_match_path(match_id, networks_path = NETWORKS_PATH):
+    return networks_path + "matches/" + str(match_id) + ".npz"
+
+def get_season_path(season_id, networks_path = NETWORKS_PATH):
+    return networks_path + "seasons/" + str(season_id) + ".npz"
+
+def load_players(networks_path = NETWORKS_PATH):
+    # The codes only ever get appended to, so every stored matrix keeps meaning the same players
+    if (players["names"] is None):
+        players_path = networks_path + PLAYERS_FILE_NAME
+        names = []
+        if (os.path.exists(players_path)):
+            with open(players_path, "r", encoding = "utf-8") as file:
+                names = json.load(file)
+
+        players["names"] = names
+        players["codes"] = {name: code for code, name in enumerate(names)}
+
+    return players
+
+def save_players(networks_path = NETWORKS_PATH):
+    os.makedirs(networks_path, exist_ok = True)
+
+    with open(networks_path + PLAYERS_FILE_NAME + ".tmp", "w", encoding = "utf-8") as file:
+        json.dump(players["names"], file, ensure_ascii = False)
+    os.replace(networks_path + PLAYERS_FILE_NAME + ".tmp", networks_path + PLAYERS_FILE_NAME)
+
+def get_codes(names, networks_path = NETWORKS_PATH):
+    # Coding every distinct name once, new players get the next free code
+    load_players(networks_path)
+
+    unique_names, inverse = np.unique(names, return_inverse = True)
+    for name in unique_names:
+        if (str(name) not in players["codes"]):
+            players["codes"][str(name)] = len(players["names"])
+            players["names"].append(str(name))
+
+    return np.array([players["codes"][str(name)] for name in unique_names], dtype = np.int32)[inverse]
+
+def get_player_code(name, networks_path = NETWORKS_PATH):
+    return load_players(networks_path)["codes"].get(name)
+
+def get_keys(matrix):
+    return matrix["passers"].astype(np.int64) << 32 | matrix["recipients"].astype(np.int64)
+
+def get_empty():
+    matrix = {"passers": np.empty(0, dtype = np.int32), "recipients": np.empty(0, dtype = np.int32)}
+    for name, dtype in VALUES.items():
+        matrix[name] = np.empty(0, dtype = dtype)
+
+    return matrix
+
+def get_progressive_distance(x, y, end_x, end_y):
+    # How much closer to the goal the pass took the ball, passes going backwards count as 0
+    start_distance = np.hypot(GOAL[0] - x, GOAL[1] - y)
+    end_distance = np.hypot(GOAL[0] - end_x, GOAL[1] - end_y)
+
+    return np.maximum(start_distance - end_distance, 0)
+
+def read_matrix(matrix_path):
+    if (not os.path.exists(matrix_path)):
+        return get_empty()
+
+    with np.load(matrix_path) as stored:
+        return {name: stored[name] for name in stored.files}
+
+def write_matrix(matrix, matrix_path):
+    os.makedirs(os.path.dirname(matrix_path), exist_ok = True)
+
+    with open(matrix_path + ".tmp", "wb") as file:
+        np.savez_compressed(file, **matrix)
+    os.replace(matrix_path + ".tmp", matrix_path)
+
+# FUNCTIONS
+def reduce(passers, recipients, values):
+    # Summing the values of every passer and recipient pair, the pairs end up sorted by passer then recipient
+    keys = passers.astype(np.int64) << 32 | recipients.astype(np.int64)
+    unique_keys, inverse = np.unique(keys, return_inverse = True)
+
+    matrix = {"passers": (unique_keys >> 32).astype(np.int32), "recipients": (unique_keys & 0xFFFFFFFF).astype(np.int32)}
+    for name, dtype in VALUES.items():
+        matrix[name] = np.bincount(inverse, weights = values[name], minlength = len(unique_keys)).astype(dtype)
+
+    return matrix
+
+def aggregate(columns, networks_path = NETWORKS_PATH):
+    # Turning the events of a match, as projected by the event store, into its sparse passer x recipient matrix
+    passes = (columns["type"] == "Pass") & (columns["recipient"] != "")
+    if (not passes.any()):
+        return get_empty()
+
+    # StatsBomb leaves the outcome empty for completed passes, the pass map only counts the Incomplete ones as unsuccessful
+    outcome = columns["outcome"][passes]
+    completed = outcome == ""
+
+    progressive = get_progressive_distance(columns["x"][passes], columns["y"][passes], columns["end_x"][passes], columns["end_y"][passes])
+
+    values = {
+        "passes": np.ones(int(passes.sum())),
+        "completed": completed.astype(np.float64),
+        "incomplete": (outcome == "Incomplete").astype(np.float64),
+        "progressive": np.where(completed, np.nan_to_num(progressive), 0),
+    }
+
+    return reduce(get_codes(columns["player"][passes], networks_path), get_codes(columns["recipient"][passes], networks_path), values)
+
+def merge(matrices):
+    # Merging is a sum over the union of the pairs, so a season grows one match at a time
+    matrices = [matrix for matrix in matrices if len(matrix["passers"]) > 0]
+    if (len(matrices) == 0):
+        return get_empty()
+    if (len(matrices) == 1):
+        return matrices[0]
+
+    return reduce(np.concatenate([matrix["passers"] for matrix in matrices]), np.concatenate([matrix["recipients"] for matrix in matrices]), {name: np.concatenate([matrix[name] for matrix in matrices]).astype(np.float64) for name in VALUES})
+
+def has_match(match_id, networks_path = NETWORKS_PATH):
+    return os.path.exists(get_match_path(match_id, networks_path))
+
+def add_match(match_id, season_id, columns, networks_path = NETWORKS_PATH):
+    # The season remembers its matches, a match merged twice would count its passes twice
+    season_path = get_season_path(season_id, networks_path)
+    season = read_matrix(season_path)
+
+    match_ids = season.get("match_ids", np.empty(0, dtype = np.int64))
+    if (match_id in match_ids):
+        return None
+
+    matrix = aggregate(columns, networks_path)
+    save_players(networks_path)
+
+    # The merged season and its match list are written in one file, so an interrupted merge never half counts a match
+    merged = dict(merge([season, matrix]))
+    merged["match_ids"] = np.append(match_ids, match_id).astype(np.int64)
+    write_matrix(merged, season_path)
+
+    write_matrix(matrix, get_match_path(match_id, networks_path))
+
+    return matrix
+
+def get_seasons(networks_path = NETWORKS_PATH):
+    seasons_path = networks_path + "seasons/"
+    if (not os.path.exists(seasons_path)):
+        return []
+
+    return sorted(int(name[:-4]) for name in os.listdir(seasons_path) if name.endswith(".npz"))
+
+def load_matrix(season_ids = None, networks_path = NETWORKS_PATH):
+    # One season matrix, or the merge of many, every season by default
+    if (season_ids is None):
+        season_ids = get_seasons(networks_path)
+
+    return merge([read_matrix(get_season_path(season_id, networks_path)) for season_id in season_ids])
+
+def get_pair(matrix, passer, recipient, networks_path = NETWORKS_PATH):
+    # A binary search over the sorted pairs, no event gets read
+    pair = {name: 0 for name in VALUES}
+
+    passer_code, recipient_code = get_player_code(passer, networks_path), get_player_code(recipient, networks_path)
+    if (passer_code is None or recipient_code is None):
+        return pair
+
+    keys = get_keys(matrix)
+    key = passer_code << 32 | recipient_code
+    position = np.searchsorted(keys, key)
+    if (position < len(keys) and keys[position] == key):
+        pair = {name: matrix[name][position].item() for name in VALUES}
+
+    return pair
+
+def get_success_rate(pair):
+    # The same rate the pass map shows, only the Incomplete passes count against it
+    return 100 - pair["incomplete"] / pair["passes"] * 100 if pair["passes"] > 0 else 0
+
+def get_top_connections(matrix, k = TOP_CONNECTIONS, by = "passes", networks_path = NETWORKS_PATH):
+    names = load_players(networks_path)["names"]
+
+    k = min(k, len(matrix[by]))
+    if (k == 0):
+        return []
+
+    top = np.argpartition(-matrix[by], k - 1)[:k]
+    top = top[np.argsort(-matrix[by][top], kind = "stable")]
+
+    return [(names[matrix["passers"][i]], names[matrix["recipients"][i]], {name: matrix[name][i].item() for name in VALUES}) for i in top]
+
+def get_network(matrix, player_names, value = "passes", networks_path = NETWORKS_PATH):
+    # A dense player x player slice of the matrix for a pass network chart
+    codes = load_players(networks_path)["codes"]
+    positions = {codes[name]: i for i, name in enumerate(player_names) if name in codes}
+
+    network = np.zeros((len(player_names), len(player_names)), dtype = VALUES[value])
+    keep = np.isin(matrix["passers"], list(positions.keys())) & np.isin(matrix["recipients"], list(positions.keys()))
+    for passer, recipient, amount in zip(matrix["passers"][keep], matrix["recipients"][keep], matrix[value][keep]):
+        network[positions[passer], positions[recipient]] = amount
+
+    return network
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    import event_store
+    import ingest
+
+    parser = argparse.ArgumentParser(description = "Look up the passes between players in the per season passer x recipient matrices")
+    parser.add_argument("--rebuild", action = "store_true", help = "add every ingested match missing from the matrices, from the event store checkpoints")
+    parser.add_argument("--from-csv", default = None, help = "add the matches of an events CSV instead, e.g. " + ingest.DATA_FILE_PATH)
+    parser.add_argument("--passer", default = ingest.PASSER)
+    parser.add_argument("--recipient", default = ingest.RECIPIENT)
+    parser.add_argument("--from-season", default = None, help = "e.g. 2008/2009, the first season by default")
+    parser.add_argument("--to-season", default = None, help = "e.g. 2020/2021, the last season by default")
+    parser.add_argument("--top", type = int, default = TOP_CONNECTIONS, help = "list this many of the most frequent connections")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    if (args.rebuild):
+        checkpoints = os.listdir(event_store.CHECKPOINTS_PATH) if os.path.exists(event_store.CHECKPOINTS_PATH) else []
+        match_ids = [int(name[:-4]) for name in checkpoints if name.endswith(".npz") and not has_match(int(name[:-4]))]
+
+        for match_id in match_ids:
+            with np.load(event_store.get_checkpoint_path(match_id)) as checkpoint:
+                columns = {name: checkpoint[name] for name in checkpoint.files}
+
+            add_match(match_id, int(columns["season_id"][0]) if len(columns["season_id"]) > 0 else -1, columns)
+
+        print("Added {} matches in {:.2f}s".format(len(match_ids), time.perf_counter() - start))
+    elif (args.from_csv is not None):
+        import pandas as pd
+
+        events = pd.read_csv(args.from_csv)
+        added = [add_match(match_id, -1, event_store.project_events(match_events)) for match_id, match_events in events.groupby("match_id", sort = False)]
+
+        print("Added {} matches in {:.2f}s".format(sum(1 for matrix in added if matrix is not None), time.perf_counter() - start))
+
+    season_ids = event_store.get_season_ids(args.from_season, args.to_season) if args.from_season is not None or args.to_season is not None else None
+
+    start = time.perf_counter()
+    matrix = load_matrix(season_ids)
+    pair = get_pair(matrix, args.passer, args.recipient)
+    lookup_time = time.perf_counter() - start
+
+    print("{} passes from {} to {}, {} completed, {} incomplete, {:.2f}% success rate, {:.0f} yards of progressive distance ({:.2f}ms)".format(pair["passes"], args.passer, args.recipient, pair["completed"], pair["incomplete"], get_success_rate(pair), pair["progressive"], lookup_time * 1000))
+
+    print("{:<4} {:<35} {:<35} {:>7} {:>10}".format("", "passer", "recipient", "passes", "success"))
+    for rank, (passer, recipient, values) in enumerate(get_top_connections(matrix, args.top)):
+        print("{:<4} {:<35} {:<35} {:>7} {:>9.2f}%".format(rank + 1, passer, recipient, values["passes"], get_success_rate(values)))
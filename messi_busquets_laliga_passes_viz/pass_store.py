@@ -0,0 +1,163 @@
+# IMPORTS
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# CONSTANTS
+STORE_PATH = "messi_busquets_laliga_passes_viz/passes/"
+META_FILE_NAME = "meta.json"
+
+# StatsBomb leaves the outcome empty for completed passes
+COMPLETE_OUTCOME = "Complete"
+
+CATEGORICAL_COLUMNS = {"outcome": "pass_outcome", "player": "player", "recipient": "pass_recipient"}
+INTEGER_COLUMNS = {"match_id": ("match_id", np.int32), "season_id": ("season_id", np.int16)}
+
+# FUNCTIONS
+def parse_locations(column):
+    # Decoding "[x, y]" strings (or lists fresh from StatsBomb) into a float array in one go
+    if (len(column) == 0):
+        return np.empty((0, 2), dtype = np.float32)
+
+    if (isinstance(column.iloc[0], str)):
+        return column.str.strip("[]").str.split(",", expand = True).iloc[:, :2].astype(np.float32).to_numpy()
+
+    return np.array(column.tolist(), dtype = np.float32)[:, :2]
+
+def encode_categories(column, fill_value):
+    # Dictionary encoding, the smallest integer type able to hold the codes
+    categorical = pd.Categorical(column.fillna(fill_value))
+    code_type = np.int8 if len(categorical.categories) < 128 else np.int16 if len(categorical.categories) < 32768 else np.int32
+
+    return categorical.codes.astype(code_type), [str(category) for category in categorical.categories]
+
+def get_source_stamp(path):
+    # The modification time and size decide whether the store still matches the CSV it was converted from
+    stat = os.stat(path)
+
+    return [stat.st_mtime_ns, stat.st_size]
+
+def write_store(all_passes, store_path = STORE_PATH, source_path = None):
+    os.makedirs(store_path, exist_ok = True)
+
+    # Projecting only the columns the viz needs
+    location = parse_locations(all_passes["location"])
+    end_location = parse_locations(all_passes["pass_end_location"])
+
+    columns = {"x": location[:, 0], "y": location[:, 1], "end_x": end_location[:, 0], "end_y": end_location[:, 1]}
+    categories = {}
+
+    for name, source in CATEGORICAL_COLUMNS.items():
+        values = all_passes[source] if source in all_passes.columns else pd.Series([None] * len(all_passes), dtype = object)
+        columns[name], categories[name] = encode_categories(values, COMPLETE_OUTCOME if name == "outcome" else "Unknown")
+
+    for name, (source, dtype) in INTEGER_COLUMNS.items():
+        values = all_passes[source] if source in all_passes.columns else pd.Series([-1] * len(all_passes))
+        columns[name] = values.fillna(-1).to_numpy().astype(dtype)
+
+    # Every column is a raw .npy file, so it can be memory-mapped on load
+    for name, values in columns.items():
+        np.save(store_path + name + ".npy", np.ascontiguousarray(values))
+
+    with open(store_path + META_FILE_NAME, "w", encoding = "utf-8") as file:
+        json.dump({"rows": len(all_passes), "columns": list(columns.keys()), "categories": categories, "source": get_source_stamp(source_path) if source_path is not None else None}, file, ensure_ascii = False, indent = 4)
+
+def exists(store_path = STORE_PATH):
+    return os.path.exists(store_path + META_FILE_NAME)
+
+def is_current(source_path, store_path = STORE_PATH):
+    # A store written from another version of the CSV, or before the CSV was recorded, is outdated
+    if (not exists(store_path)):
+        return False
+
+    with open(store_path + META_FILE_NAME, "r", encoding = "utf-8") as file:
+        meta = json.load(file)
+
+    return meta.get("source") == get_source_stamp(source_path)
+
+def load_store(store_path = STORE_PATH, columns = None, mmap = True):
+    with open(store_path + META_FILE_NAME, "r", encoding = "utf-8") as file:
+        meta = json.load(file)
+
+    if (columns is None):
+        columns = meta["columns"]
+
+    # Memory-mapping the columns, the pages only get read once they are touched
+    store = {name: np.load(store_path + name + ".npy", mmap_mode = "r" if mmap else None) for name in columns}
+    store["rows"] = meta["rows"]
+    store["categories"] = meta["categories"]
+
+    return store
+
+def get_category_mask(store, column, value):
+    categories = store["categories"][column]
+    if (value not in categories):
+        return np.zeros(store["rows"], dtype = bool)
+
+    return np.asarray(store[column]) == categories.index(value)
+
+def get_incomplete(store):
+    return get_category_mask(store, "outcome", "Incomplete")
+
+def get_coordinates(store):
+    return store["x"], store["y"], store["end_x"], store["end_y"], get_incomplete(store)
+
+def to_frame(store):
+    frame = {}
+    for name in store:
+        if (name in ["rows", "categories"]):
+            continue
+
+        if (name in store["categories"]):
+            frame[name] = pd.Categorical.from_codes(np.asarray(store[name]), store["categories"][name])
+        else:
+            frame[name] = np.asarray(store[name])
+
+    return pd.DataFrame(frame)
+
+def get_footprint(store):
+    return sum(store[name].nbytes for name in store if name not in ["rows", "categories"])
+
+def get_peak_rss():
+    # Peak resident set size in bytes, not available on Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Convert passes.csv into the columnar pass store and report the load cost of both")
+    parser.add_argument("--data", default = "messi_busquets_laliga_passes_viz/passes.csv")
+    parser.add_argument("--report-only", action = "store_true", help = "only measure an existing store")
+    args = parser.parse_args()
+
+    if (not args.report_only):
+        start = time.perf_counter()
+        csv_passes = pd.read_csv(args.data)
+        csv_load_time = time.perf_counter() - start
+
+        write_store(csv_passes, source_path = args.data)
+        print("CSV   load {:.3f}s, footprint {:.2f} MB".format(csv_load_time, csv_passes.memory_usage(deep = True).sum() / 1e6))
+
+    start = time.perf_counter()
+    store = load_store()
+    incomplete = get_incomplete(store)
+    store_load_time = time.perf_counter() - start
+
+    print("Store load {:.3f}s, footprint {:.2f} MB ({} passes, {} incomplete)".format(store_load_time, get_footprint(store) / 1e6, store["rows"], int(incomplete.sum())))
+
+    peak_rss = get_peak_rss()
+    if (peak_rss is not None):
+        print("Peak RSS {:.1f} MB".format(peak_rss / 1e6))
@@ -0,0 +1,157 @@
+# IMPORTS
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+import pass_store
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import templates
+
+# CONSTANTS
+PRIMARY_COLOR = templates.PRIMARY_COLOR
+FONT_FAMILY = templates.FONT_FAMILY
+
+SUCCESSFUL_PASS_COLOR = "#a277ff"
+NON_SUCCESSFUL_PASS_COLOR = "#60ffce"
+
+# Arrow geometry in pitch units, close to the old ax.arrow head of 1 plus its edge line
+SHAFT_WIDTH = 0.2
+HEAD_SIZE = 1.2
+
+# The passes sit below the pitch lines and the legend
+PASS_ZORDER = 1
+
+# FUNCTIONS
+def get_coordinates(all_passes):
+    location = pass_store.parse_locations(all_passes["location"])
+    end_location = pass_store.parse_locations(all_passes["pass_end_location"])
+
+    if ("pass_outcome" in all_passes.columns):
+        incomplete = (all_passes["pass_outcome"] == "Incomplete").to_numpy()
+    else:
+        incomplete = np.zeros(len(all_passes), dtype = bool)
+
+    return location[:, 0], location[:, 1], end_location[:, 0], end_location[:, 1], incomplete
+
+def draw_passes(ax, x, y, end_x, end_y, incomplete):
+    # One quiver for the whole pass map instead of an arrow patch per pass, the per arrow colours keep the original drawing order
+    if (len(x) == 0):
+        return None
+
+    colors = np.where(incomplete, NON_SUCCESSFUL_PASS_COLOR, SUCCESSFUL_PASS_COLOR)
+
+    return ax.quiver(x, y, end_x - x, end_y - y, color = colors, angles = "xy", scale_units = "xy", scale = 1, units = "xy", width = SHAFT_WIDTH, headwidth = HEAD_SIZE / SHAFT_WIDTH, headlength = HEAD_SIZE / SHAFT_WIDTH, headaxislength = HEAD_SIZE / SHAFT_WIDTH, zorder = PASS_ZORDER)
+
+def drawPass(row, ax):
+    if (row["pass_outcome"] == "Incomplete"):
+        color = NON_SUCCESSFUL_PASS_COLOR
+    else:
+        color = SUCCESSFUL_PASS_COLOR
+
+    location = json.loads(row["location"])
+    end_location = json.loads(row["pass_end_location"])
+
+    ax.arrow(x = location[0], y = location[1], dx = end_location[0] - location[0], dy = end_location[1] - location[1], head_width = 1, head_length = 1, color = color)
+
+def draw_pass_map(ax, all_passes, mode = "batched"):
+    if (mode == "per_pass"):
+        all_passes.apply(drawPass, axis = 1, ax = ax)
+        return
+
+    draw_passes(ax, *get_coordinates(all_passes))
+
+def create_pass_map(title, subtitle, legend = True):
+    # Creating figure
+    fig, ax = templates.create_figure((14.5, 9.5))
+    fig.subplots_adjust(left = 0.1185, right = 0.885)
+
+    # Setting up margins
+    ax.set_xmargin(0)
+    ax.set_ymargin(0)
+
+    # Creating pitch
+    templates.draw_pitch(ax)
+
+    # Setting up graph (sub)title
+    templates.add_title(fig, title, ax, subtitle)
+
+    # Adding the data source
+    templates.add_source(ax, "StatsBomb", (0.905, -0.0735), (1.0, -0.0735))
+
+    if (not legend):
+        return fig, ax
+
+    # Adding legend texts
+    line1 = plt.Line2D([], [], color = SUCCESSFUL_PASS_COLOR, linewidth = 3)
+    line2 = plt.Line2D([], [], color = NON_SUCCESSFUL_PASS_COLOR, linewidth = 3)
+
+    ax.legend((line1, line2), ("Successful pass", "Non-successful pass"), loc = "upper left", framealpha = 0, labelcolor = PRIMARY_COLOR, prop = {"family": FONT_FAMILY, "size": 14, "weight": "bold", "style": "italic"})
+
+    return fig, ax
+
+def get_totals_texts(passes_attempted, non_successful_passes):
+    success_rate = 100 - (non_successful_passes / passes_attempted * 100) if passes_attempted > 0 else 0
+
+    return "PASSES ATTEMPTED\n" + str(passes_attempted), "SUCCESS RATE\n" + "{:.2f}".format(success_rate) + "%"
+
+def add_pass_totals(ax, passes_attempted, non_successful_passes):
+    attempted, success = get_totals_texts(passes_attempted, non_successful_passes)
+
+    # Adding informational texts
+    attempted_text = ax.text(-0.073, 0.5, attempted, transform = ax.transAxes, family = FONT_FAMILY, ha = "center", va = "center", color = PRIMARY_COLOR, fontweight = "bold", fontsize = 40, rotation = 90)
+    success_text = ax.text(1.07, 0.5, success, transform = ax.transAxes, family = FONT_FAMILY, ha = "center", va = "center", color = PRIMARY_COLOR, fontweight = "bold", fontsize = 40, rotation = 270)
+
+    return attempted_text, success_text
+
+def update_pass_totals(texts, passes_attempted, non_successful_passes):
+    # Rewriting the texts of add_pass_totals in place, for a map which keeps growing
+    for text, content in zip(texts, get_totals_texts(passes_attempted, non_successful_passes)):
+        text.set_text(content)
+
+def measure(all_passes, mode):
+    # Drawing the passes on an empty figure and timing a full canvas draw
+    fig, ax = plt.subplots()
+    fig.set_size_inches(14.5, 9.5)
+    ax.set_xlim(0, 130)
+    ax.set_ylim(0, 90)
+    base_artists = len(ax.get_children())
+
+    start = time.perf_counter()
+    draw_pass_map(ax, all_passes, mode)
+    fig.canvas.draw()
+    duration = time.perf_counter() - start
+
+    artists = len(ax.get_children()) - base_artists
+    plt.close(fig)
+
+    return {"mode": mode, "passes": len(all_passes), "artists": artists, "render_time": duration}
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    plt.switch_backend("Agg")
+
+    parser = argparse.ArgumentParser(description = "Compare the batched pass map renderer with the per pass one")
+    parser.add_argument("--data", default = "messi_busquets_laliga_passes_viz/passes.csv")
+    parser.add_argument("--repeat", type = int, default = 1, help = "tile the passes to simulate larger pass maps")
+    parser.add_argument("--skip-per-pass", action = "store_true", help = "only measure the batched renderer")
+    args = parser.parse_args()
+
+    all_passes = pd.read_csv(args.data, usecols = ["location", "pass_end_location", "pass_outcome"])
+    all_passes = pd.concat([all_passes] * args.repeat, ignore_index = True)
+
+    modes = ["batched"] if args.skip_per_pass else ["per_pass", "batched"]
+    for mode in modes:
+        result = measure(all_passes, mode)
+        print("{:<10} {:>8} passes {:>8} artists {:>8.3f}s".format(result["mode"], result["passes"], result["artists"], result["render_time"]))
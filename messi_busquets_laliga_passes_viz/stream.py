@@ -0,0 +1,188 @@
+# IMPORTS
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import os
+import sys
+import time
+
+import numpy as np
+import matplotlib.pyplot as plt
+import pandas as pd
+
+import ingest
+import renderer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import instrumentation
+
+# CONSTANTS
+# Passes drawn per update of the figure, the memory held by the pipeline stays around this many passes
+BATCH_SIZE = 500
+
+# A snapshot of the partial map is saved every this many batches
+SNAPSHOT_EVERY = 2
+
+SNAPSHOT_FILE_PATH = "messi_busquets_laliga_passes_viz/stream.png"
+
+# Matches fetched at the same time, also the most matches held in memory before they are drawn
+WORKERS = 8
+
+# The columns a batch needs from the passes
+PASS_COLUMNS = ["location", "pass_end_location", "pass_outcome"]
+
+# HELPING FUNCTIONS
+def get_empty_batch():
+    return tuple(np.empty(0, dtype = np.float32) for i in range(4)) + (np.empty(0, dtype = bool),)
+
+def to_batch(passes):
+    if (len(passes) == 0 or "location" not in passes.columns):
+        return get_empty_batch()
+
+    return renderer.get_coordinates(passes)
+
+def concat_batches(batches):
+    return tuple(np.concatenate([batch[i] for batch in batches]) for i in range(5))
+
+# FUNCTIONS
+def load_match(match_id, season_id, passer = ingest.PASSER, recipient = ingest.RECIPIENT):
+    # Reading the checkpoint of an already ingested match, fetching and checkpointing the others
+    checkpoint_path = ingest.get_checkpoint_path(match_id, passer, recipient)
+    if (not os.path.exists(checkpoint_path)):
+        ingest.ingest_match(match_id, season_id, passer, recipient)
+
+    return to_batch(pd.read_csv(checkpoint_path))
+
+def iter_matches(matches, passer = ingest.PASSER, recipient = ingest.RECIPIENT, workers = WORKERS, failed_match_ids = None):
+    # Yielding the passes of every match in order, only a window of matches is in flight at any time
+    os.makedirs(ingest.get_pair_path(passer, recipient), exist_ok = True)
+
+    matches = iter(matches)
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        pending = deque((match_id, executor.submit(load_match, match_id, season_id, passer, recipient)) for match_id, season_id in islice(matches, workers))
+
+        while (len(pending) > 0):
+            match_id, future = pending.popleft()
+
+            for next_match_id, season_id in islice(matches, 1):
+                pending.append((next_match_id, executor.submit(load_match, next_match_id, season_id, passer, recipient)))
+
+            try:
+                batch = future.result()
+            except Exception as error:
+                # The match is left out of the map and stays pending, the next run picks it up from the checkpoints
+                print("Could not ingest match " + str(match_id) + ": " + str(error))
+                instrumentation.count("failed_matches")
+                if (failed_match_ids is not None):
+                    failed_match_ids.append(match_id)
+                continue
+
+            yield batch
+
+def iter_csv(data_path, chunk_size = BATCH_SIZE):
+    # The same batches from a passes CSV, read chunk by chunk
+    for chunk in pd.read_csv(data_path, usecols = PASS_COLUMNS, chunksize = chunk_size):
+        yield to_batch(chunk)
+
+def iter_batches(parts, batch_size = BATCH_SIZE):
+    # Regrouping the passes into batches of at least batch_size, a batch only overshoots by the last match
+    batches, size = [], 0
+
+    for part in parts:
+        batches.append(part)
+        size += len(part[0])
+
+        if (size >= batch_size):
+            yield concat_batches(batches)
+            batches, size = [], 0
+
+    if (size > 0):
+        yield concat_batches(batches)
+
+def stream(batches, title, subtitle, snapshot_path = SNAPSHOT_FILE_PATH, snapshot_every = SNAPSHOT_EVERY, show = False):
+    # Drawing every batch onto the same figure as it arrives, nothing but the figure keeps the passes drawn so far
+    start = time.perf_counter()
+
+    fig, ax = renderer.create_pass_map(title, subtitle)
+    totals_texts = renderer.add_pass_totals(ax, 0, 0)
+
+    if (show):
+        plt.ion()
+        plt.show()
+
+    stats = {"batches": 0, "passes": 0, "incomplete": 0, "snapshots": 0, "first_snapshot_time": None}
+
+    def save_snapshot():
+        with instrumentation.phase("save"):
+            fig.savefig(snapshot_path, facecolor = fig.get_facecolor())
+
+        stats["snapshots"] += 1
+        if (stats["first_snapshot_time"] is None):
+            stats["first_snapshot_time"] = time.perf_counter() - start
+
+    for batch in batches:
+        with instrumentation.phase("render"):
+            renderer.draw_passes(ax, *batch)
+
+            stats["batches"] += 1
+            stats["passes"] += len(batch[0])
+            stats["incomplete"] += int(batch[4].sum())
+            renderer.update_pass_totals(totals_texts, stats["passes"], stats["incomplete"])
+
+        if (show):
+            fig.canvas.draw_idle()
+            plt.pause(0.001)
+
+        if (snapshot_path is not None and stats["batches"] % snapshot_every == 0):
+            save_snapshot()
+
+    # The complete map always ends up in the snapshot
+    if (snapshot_path is not None and stats["batches"] % snapshot_every != 0):
+        save_snapshot()
+
+    stats["time"] = time.perf_counter() - start
+
+    return fig, stats
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+    import tracemalloc
+
+    import viz
+
+    parser = argparse.ArgumentParser(description = "Draw the pass map progressively while the matches are ingested, saving snapshots of the partial map")
+    parser.add_argument("--from-csv", default = None, help = "stream the passes of a CSV instead of the StatsBomb matches, e.g. " + ingest.DATA_FILE_PATH)
+    parser.add_argument("--batch-size", type = int, default = BATCH_SIZE)
+    parser.add_argument("--snapshot-every", type = int, default = SNAPSHOT_EVERY, help = "batches between two snapshots")
+    parser.add_argument("--snapshot-path", default = SNAPSHOT_FILE_PATH)
+    parser.add_argument("--workers", type = int, default = WORKERS)
+    parser.add_argument("--show", action = "store_true", help = "show the figure while it grows")
+    parser.add_argument("--trace-memory", action = "store_true", help = "report the peak memory allocated by the pipeline, slows it down")
+    args = parser.parse_args()
+
+    if (args.trace_memory):
+        tracemalloc.start()
+
+    failed_match_ids = []
+    if (args.from_csv is not None):
+        parts = iter_csv(args.from_csv, args.batch_size)
+    else:
+        parts = iter_matches(ingest.get_matches(), workers = args.workers, failed_match_ids = failed_match_ids)
+
+    fig, stats = stream(iter_batches(parts, args.batch_size), viz.TITLE, viz.SUBTITLE, args.snapshot_path, args.snapshot_every, args.show)
+
+    print("Drew {} passes ({} incomplete) in {} batches in {:.2f}s, {} snapshots, the first one after {:.2f}s".format(stats["passes"], stats["incomplete"], stats["batches"], stats["time"], stats["snapshots"], stats["first_snapshot_time"] or 0))
+
+    if (len(failed_match_ids) > 0):
+        print(str(len(failed_match_ids)) + " matches could not be ingested and are missing from the map, run the stream again to resume")
+
+    if (args.trace_memory):
+        print("Peak traced memory {:.2f} MB".format(tracemalloc.get_traced_memory()[1] / 1e6))
+
+    if (args.show):
+        plt.ioff()
+        plt.show()
@@ -0,0 +1,245 @@
+# IMPORTS
+from datetime import date
+import hashlib
+import json
+import lzma
+import os
+import sys
+import zlib
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import locks
+
+# CONSTANTS
+INDEX_FILE_NAME = "index.json"
+LOCK_FILE_NAME = "index.lock"
+BLOCKS_FOLDER_NAME = "blocks/"
+
+# Bump whenever the chunking or the block format changes
+ARCHIVE_VERSION = 1
+
+VERSION_DATE_FORMAT = "%Y-%m-%d"
+
+# Content defined chunking over whole lines, a chunk ends on a line whose checksum matches the mask, so an edit only moves the chunks around it
+CHUNK_MASK = (1 << 3) - 1
+MIN_CHUNK_SIZE = 2048
+MAX_CHUNK_SIZE = 65536
+
+# Hex digits kept of a chunk hash, plenty for a few thousand pages and it keeps the index small
+CHUNK_HASH_LENGTH = 16
+
+LZMA_PRESET = 9
+
+# Decompressed blocks kept in memory, a page rarely spans more than a couple of them
+MAX_CACHED_BLOCKS = 32
+
+# Indexes and decompressed blocks, loaded once per process
+cache = {"indexes": {}, "blocks": {}}
+
+# HELPING FUNCTIONS
+def get_content_hash(content):
+    # The same hash the parsed report cache is keyed by, so a cached report is found without decompressing anything
+    return hashlib.sha1(content).hexdigest()
+
+def get_chunk_hash(chunk):
+    return hashlib.sha1(chunk).hexdigest()[:CHUNK_HASH_LENGTH]
+
+def split_chunks(content):
+    chunks = []
+    start = 0
+    size = 0
+
+    for line in content.splitlines(keepends = True):
+        size += len(line)
+
+        if ((size >= MIN_CHUNK_SIZE and (zlib.crc32(line) & CHUNK_MASK) == 0) or size >= MAX_CHUNK_SIZE):
+            chunks.append(content[start:start + size])
+            start += size
+            size = 0
+
+    if (size > 0):
+        chunks.append(content[start:])
+
+    return chunks
+
+def get_index_path(archive_path):
+    return os.path.join(archive_path, INDEX_FILE_NAME)
+
+def get_lock_path(archive_path):
+    return os.path.join(archive_path, LOCK_FILE_NAME)
+
+def get_block_path(archive_path, block):
+    return os.path.join(archive_path, BLOCKS_FOLDER_NAME, block + ".xz")
+
+def read_index(archive_path):
+    # Reloading the index only once another process rewrote it
+    index_path = get_index_path(archive_path)
+    if (not os.path.exists(index_path)):
+        return {"version": ARCHIVE_VERSION, "chunks": {}, "pages": {}}
+
+    stamp = os.stat(index_path).st_mtime_ns
+    if (archive_path in cache["indexes"] and cache["indexes"][archive_path][0] == stamp):
+        return cache["indexes"][archive_path][1]
+
+    index = load_index(archive_path)
+    cache["indexes"][archive_path] = (stamp, index)
+
+    return index
+
+def load_index(archive_path):
+    # A private copy straight from the disk, the one a writer edits
+    index_path = get_index_path(archive_path)
+    if (not os.path.exists(index_path)):
+        return {"version": ARCHIVE_VERSION, "chunks": {}, "pages": {}}
+
+    with open(index_path, "r", encoding = "utf-8") as file:
+        index = json.load(file)
+
+    if (index.get("version") != ARCHIVE_VERSION):
+        raise ValueError("The archive in " + archive_path + " was written by another version, rebuild it from the pages")
+
+    return index
+
+def write_index(index, archive_path):
+    os.makedirs(archive_path, exist_ok = True)
+
+    with open(get_index_path(archive_path) + ".tmp", "w", encoding = "utf-8") as file:
+        json.dump(index, file, ensure_ascii = False, separators = (",", ":"), sort_keys = True)
+    os.replace(get_index_path(archive_path) + ".tmp", get_index_path(archive_path))
+
+def read_block(archive_path, block):
+    key = (archive_path, block)
+    if (key not in cache["blocks"]):
+        if (len(cache["blocks"]) >= MAX_CACHED_BLOCKS):
+            cache["blocks"].clear()
+
+        with open(get_block_path(archive_path, block), "rb") as file:
+            cache["blocks"][key] = lzma.decompress(file.read())
+
+    return cache["blocks"][key]
+
+def write_block(chunks, archive_path):
+    # The new chunks of a page are compressed together, a block is immutable and named after its content
+    compressed = lzma.compress(b"".join(chunks), preset = LZMA_PRESET)
+    block = hashlib.sha1(compressed).hexdigest()[:CHUNK_HASH_LENGTH]
+
+    block_path = get_block_path(archive_path, block)
+    os.makedirs(os.path.dirname(block_path), exist_ok = True)
+
+    with open(block_path + ".tmp", "wb") as file:
+        file.write(compressed)
+    os.replace(block_path + ".tmp", block_path)
+
+    return block, len(compressed)
+
+def add_locked_page(slug, content, archive_path, version_date):
+    index = load_index(archive_path)
+    content_hash = get_content_hash(content)
+
+    versions = index["pages"].setdefault(slug, [])
+    if (len(versions) > 0 and versions[-1]["content_hash"] == content_hash):
+        return versions[-1], 0
+
+    chunks = split_chunks(content)
+    chunk_hashes = [get_chunk_hash(chunk) for chunk in chunks]
+
+    new_chunks = {}
+    for chunk_hash, chunk in zip(chunk_hashes, chunks):
+        if (chunk_hash not in index["chunks"] and chunk_hash not in new_chunks):
+            new_chunks[chunk_hash] = chunk
+
+    written = 0
+    if (len(new_chunks) > 0):
+        block, written = write_block(list(new_chunks.values()), archive_path)
+
+        offset = 0
+        for chunk_hash, chunk in new_chunks.items():
+            index["chunks"][chunk_hash] = [block, offset, len(chunk)]
+            offset += len(chunk)
+
+    # A second version on the same day replaces the first one
+    version = {"date": version_date.strftime(VERSION_DATE_FORMAT), "content_hash": content_hash, "size": len(content), "chunks": chunk_hashes}
+    versions[:] = [stored for stored in versions if stored["date"] != version["date"]] + [version]
+
+    write_index(index, archive_path)
+
+    return version, written
+
+# FUNCTIONS
+def get_versions(slug, archive_path):
+    # Every dated version of a page, oldest first
+    return read_index(archive_path)["pages"].get(slug, [])
+
+def get_version(slug, archive_path, version_date = None):
+    # The entry of the newest version, or of a given date, no page bytes are read
+    versions = get_versions(slug, archive_path)
+    if (version_date is not None):
+        versions = [version for version in versions if version["date"] == version_date.strftime(VERSION_DATE_FORMAT)]
+
+    return versions[-1] if len(versions) > 0 else None
+
+def read_page(slug, archive_path, version_date = None):
+    # Decompressing only the blocks holding the chunks of this version
+    index = read_index(archive_path)
+
+    version = get_version(slug, archive_path, version_date)
+    if (version is None):
+        raise FileNotFoundError(slug + " is not in the archive " + archive_path)
+
+    parts = []
+    for chunk in version["chunks"]:
+        block, offset, length = index["chunks"][chunk]
+        parts.append(read_block(archive_path, block)[offset:offset + length])
+
+    content = b"".join(parts)
+    if (get_content_hash(content) != version["content_hash"]):
+        raise ValueError("The archived " + slug + " page is corrupted")
+
+    return content
+
+def add_page(slug, content, archive_path, version_date = None):
+    # Storing a dated version of a page, unchanged pages and the chunks shared with any stored page take no space
+    if (version_date is None):
+        version_date = date.today()
+
+    # Every writer, thread or process, edits the index as the previous one left it, so no added version gets lost
+    with locks.file_lock(get_lock_path(archive_path)):
+        return add_locked_page(slug, content, archive_path, version_date)
+
+def get_stats(archive_path):
+    index = read_index(archive_path)
+
+    blocks = set(block for block, offset, length in index["chunks"].values())
+    stored = sum(os.path.getsize(get_block_path(archive_path, block)) for block in blocks) + os.path.getsize(get_index_path(archive_path))
+    pages = sum(version["size"] for versions in index["pages"].values() for version in versions)
+
+    return {"pages": len(index["pages"]), "versions": sum(len(versions) for versions in index["pages"].values()), "chunks": len(index["chunks"]), "blocks": len(blocks), "original_bytes": pages, "stored_bytes": stored}
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description = "Store raw pages as compressed, deduplicated, dated versions")
+    parser.add_argument("archive", help = "archive folder, e.g. busquets_replacements_comparision/assets/archive/")
+    parser.add_argument("pages", nargs = "*", help = "pages to add, stored under their file name without the extension")
+    parser.add_argument("--date", default = None, help = "date of the added versions, today by default")
+    parser.add_argument("--prune", action = "store_true", help = "remove every added page once it is archived")
+    args = parser.parse_args()
+
+    version_date = datetime.strptime(args.date, VERSION_DATE_FORMAT).date() if args.date is not None else None
+
+    for path in args.pages:
+        with open(path, "rb") as file:
+            version, written = add_page(os.path.splitext(os.path.basename(path))[0], file.read(), args.archive, version_date)
+
+        print("{:<40} {:>10} -> {:>8} bytes".format(os.path.basename(path), version["size"], written))
+
+        if (args.prune):
+            os.remove(path)
+
+    stats = get_stats(args.archive)
+    print("{} pages in {} versions, {} chunks in {} blocks, {:.2f} MB stored as {:.2f} MB ({:.1f}x)".format(stats["pages"], stats["versions"], stats["chunks"], stats["blocks"], stats["original_bytes"] / 1e6, stats["stored_bytes"] / 1e6, stats["original_bytes"] / max(stats["stored_bytes"], 1)))
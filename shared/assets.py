@@ -0,0 +1,191 @@
+# IMPORTS
+import json
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import locks
+
+# CONSTANTS
+ASSETS_CACHE_PATH = "shared/cache/assets/"
+INDEX_FILE_NAME = "atlas.json"
+
+# Held while the atlas gets rebuilt, so two processes adding different images never drop each other's
+LOCK_FILE_NAME = "atlas.lock"
+
+# Bump whenever the decoding or resampling changes so the stored pixels get rebuilt
+ATLAS_VERSION = 1
+
+# A superseded atlas is kept this long, so workers which read the previous index can still map it
+ATLAS_GRACE_SECONDS = 600
+
+# Times an atlas load starts over when another worker replaced the atlas while it was being read
+LOAD_ATTEMPTS = 3
+
+# Views into the memory-mapped atlas, loaded once per process
+cache = {}
+
+# HELPING FUNCTIONS
+def get_key(path, size = None, scale = None):
+    if (size is not None):
+        return path + "@" + str(size[0]) + "x" + str(size[1])
+    if (scale is not None):
+        return path + "@" + str(scale)
+
+    return path
+
+def get_source_stamp(path):
+    # The modification time and size decide whether the stored pixels still match the image file
+    stat = os.stat(path)
+
+    return [stat.st_mtime_ns, stat.st_size]
+
+def decode(path, size = None, scale = None):
+    from PIL import Image
+
+    image = Image.open(path).convert("RGBA")
+
+    if (scale is not None):
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    if (size is not None):
+        image = image.resize(size, Image.LANCZOS)
+
+    return np.asarray(image, dtype = np.uint8)
+
+def read_index(cache_path = ASSETS_CACHE_PATH):
+    index_path = cache_path + INDEX_FILE_NAME
+    if (not os.path.exists(index_path)):
+        return None
+
+    with open(index_path, "r", encoding = "utf-8") as file:
+        index = json.load(file)
+
+    if (index.get("version") != ATLAS_VERSION or not os.path.exists(cache_path + index["atlas"])):
+        return None
+
+    return index
+
+def write_atlas(images, cache_path = ASSETS_CACHE_PATH):
+    # Packing every image into one flat uint8 array plus offsets, so a single memory map serves all of them
+    os.makedirs(cache_path, exist_ok = True)
+
+    keys = list(images.keys())
+    offsets = np.cumsum([0] + [images[key]["pixels"].size for key in keys]).tolist()
+    pixels = np.concatenate([images[key]["pixels"].ravel() for key in keys]) if len(keys) > 0 else np.array([], dtype = np.uint8)
+
+    # A new file per write, readers still mapping the previous atlas keep working until they reload
+    atlas_name = "atlas." + uuid.uuid4().hex[:12] + ".npy"
+    np.save(cache_path + atlas_name, pixels)
+
+    index = {
+        "version": ATLAS_VERSION,
+        "atlas": atlas_name,
+        "images": {key: {"offset": offsets[i], "shape": list(images[key]["pixels"].shape), "source": images[key]["source"]} for i, key in enumerate(keys)},
+    }
+
+    # Stamping the atlas being superseded, its grace period starts now rather than when it was written
+    previous_index = read_index(cache_path)
+    if (previous_index is not None):
+        try:
+            os.utime(cache_path + previous_index["atlas"])
+        except OSError:
+            pass
+
+    with open(cache_path + INDEX_FILE_NAME + ".tmp", "w", encoding = "utf-8") as file:
+        json.dump(index, file, ensure_ascii = False, indent = 4)
+    os.replace(cache_path + INDEX_FILE_NAME + ".tmp", cache_path + INDEX_FILE_NAME)
+
+    # Dropping the atlases superseded a while ago, the workers which read their index have mapped them by then
+    now = time.time()
+    for name in os.listdir(cache_path):
+        if (name.startswith("atlas.") and name.endswith(".npy") and name != atlas_name):
+            try:
+                if (now - os.path.getmtime(cache_path + name) > ATLAS_GRACE_SECONDS):
+                    os.remove(cache_path + name)
+            except OSError:
+                pass
+
+    return index
+
+def get_views(index, cache_path = ASSETS_CACHE_PATH):
+    atlas = np.load(cache_path + index["atlas"], mmap_mode = "r")
+
+    return {key: atlas[entry["offset"]:entry["offset"] + int(np.prod(entry["shape"]))].reshape(entry["shape"]) for key, entry in index["images"].items()}
+
+def get_stale(index, keys, requests):
+    stored = index["images"] if index is not None else {}
+
+    return [(key, request) for key, request in zip(keys, requests) if key not in stored or stored[key]["source"] != get_source_stamp(request[0])]
+
+def update_atlas(keys, requests, cache_path = ASSETS_CACHE_PATH):
+    index = read_index(cache_path)
+
+    if (len(get_stale(index, keys, requests)) > 0):
+        # Rebuilding under the lock from the index as it is once the lock is held, so the images another process just added are kept
+        with locks.file_lock(cache_path + LOCK_FILE_NAME):
+            index = read_index(cache_path)
+            stale = get_stale(index, keys, requests)
+
+            if (len(stale) > 0):
+                # Rewriting the atlas once with the stored images plus the newly decoded ones
+                images = {}
+                if (index is not None):
+                    views = get_views(index, cache_path)
+                    images = {key: {"pixels": views[key], "source": entry["source"]} for key, entry in index["images"].items()}
+
+                for key, (path, size, scale) in stale:
+                    images[key] = {"pixels": decode(path, size, scale), "source": get_source_stamp(path)}
+
+                index = write_atlas(images, cache_path)
+
+    return get_views(index, cache_path)
+
+# FUNCTIONS
+def load_images(requests, cache_path = ASSETS_CACHE_PATH):
+    # Every request is a (path, size, scale) triple, only the images missing from the atlas get decoded and resampled
+    keys = [get_key(path, size, scale) for path, size, scale in requests]
+    if (all(key in cache for key in keys)):
+        return [cache[key] for key in keys]
+
+    for attempt in range(LOAD_ATTEMPTS):
+        try:
+            views = update_atlas(keys, requests, cache_path)
+            break
+        except FileNotFoundError:
+            # Another worker dropped the atlas between reading the index and mapping it, the index it wrote points to a newer one
+            if (attempt == LOAD_ATTEMPTS - 1):
+                raise
+
+    cache.clear()
+    cache.update(views)
+
+    return [cache[key] for key in keys]
+
+def load_image(path, size = None, scale = None, cache_path = ASSETS_CACHE_PATH):
+    return load_images([(path, size, scale)], cache_path)[0]
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+    import glob
+    import time
+
+    parser = argparse.ArgumentParser(description = "Pre-build the image atlas with the logo and every club crest")
+    parser.add_argument("--crests", default = "laliga_teams_22_23_gf_ga_viz/crests/")
+    args = parser.parse_args()
+
+    from shared import templates
+
+    start = time.perf_counter()
+    templates.get_logo()
+    templates.get_crests(sorted(glob.glob(os.path.join(args.crests, "*.png"))))
+
+    index = read_index()
+    print("Stored {} images ({:.2f} MB) in {:.2f}s".format(len(index["images"]), os.path.getsize(ASSETS_CACHE_PATH + index["atlas"]) / 1e6, time.perf_counter() - start))
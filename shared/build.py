@@ -0,0 +1,371 @@
+# IMPORTS
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import ast
+import glob
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+import sys
+import time
+
+# Rendering without a window, every output only gets saved
+os.environ["MPLBACKEND"] = "Agg"
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+sys.path.append(os.path.join(parent_dir, "busquets_replacements_comparision"))
+sys.path.append(os.path.join(parent_dir, "messi_busquets_laliga_passes_viz"))
+sys.path.append(os.path.join(parent_dir, "laliga_teams_22_23_gf_ga_viz"))
+sys.path.append(os.path.join(parent_dir, "barca_playing_time_22_23_viz"))
+
+from shared import assets
+from shared import instrumentation
+from shared import templates
+
+# CONSTANTS
+STATE_FILE_PATH = "shared/cache/build.json"
+
+# Bump whenever the recorded inputs change meaning, every output then gets rebuilt once
+BUILD_VERSION = 1
+
+# Libraries whose upgrade can change the pixels of every chart
+LIBRARIES = ["matplotlib", "mplsoccer", "numpy", "pandas", "Pillow"]
+
+SHARED_CODE = ["shared/templates.py", "shared/assets.py", "shared/fragments.py", "shared/labels.py"]
+
+COMPARISION_CODE = ["busquets_replacements_comparision/viz_template.py", "busquets_replacements_comparision/report_cache.py", "busquets_replacements_comparision/range_store.py", "shared/archive.py"]
+GFGA_CODE = ["laliga_teams_22_23_gf_ga_viz/viz.py", "laliga_teams_22_23_gf_ga_viz/league_tables.py"]
+PLAYING_TIME_CODE = ["barca_playing_time_22_23_viz/viz.py", "barca_playing_time_22_23_viz/squads.py"]
+PASSES_CODE = ["messi_busquets_laliga_passes_viz/viz.py", "messi_busquets_laliga_passes_viz/pass_store.py", "messi_busquets_laliga_passes_viz/renderer.py"]
+
+GFGA_OUTPUT_FILE_PATH = "laliga_teams_22_23_gf_ga_viz/viz.png"
+PLAYING_TIME_OUTPUT_FILE_PATH = "barca_playing_time_22_23_viz/viz.png"
+PASSES_OUTPUT_FILE_PATH = "messi_busquets_laliga_passes_viz/viz.png"
+
+# One output with everything its pixels depend on, build is a (function, args) pair run in a worker process
+Target = namedtuple("Target", ["name", "output", "files", "code", "data", "build"])
+
+# Pipeline modules, loaded once per process
+modules = {}
+
+# HELPING FUNCTIONS
+def load_module(name, path):
+    # The GF/GA, playing time and passes scripts are all called viz.py, so they get loaded under their own names
+    if (name not in modules):
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        modules[name] = module
+
+    return modules[name]
+
+def get_hash(content):
+    if (isinstance(content, str)):
+        content = content.encode("utf-8")
+
+    return hashlib.sha256(content).hexdigest()
+
+def get_file_hash(path, files):
+    # Content hash of a file, only read again once its modification time or size changed
+    if (not os.path.exists(path)):
+        return None
+
+    stamp = assets.get_source_stamp(path)
+    if (path in files and files[path]["stamp"] == stamp):
+        return files[path]["hash"]
+
+    with open(path, "rb") as file:
+        content_hash = get_hash(file.read())
+
+    files[path] = {"stamp": stamp, "hash": content_hash}
+
+    return content_hash
+
+def is_constant(node):
+    # Module level UPPER_CASE assignments of plain literals, the colours, sizes and fonts of every viz
+    if (not isinstance(node, ast.Assign) or not all(isinstance(target, ast.Name) and target.id.isupper() for target in node.targets)):
+        return False
+
+    try:
+        ast.literal_eval(node.value)
+    except ValueError:
+        return False
+
+    return True
+
+def get_code_inputs(path):
+    # The code version ignores comments, formatting and the constants, so those never trigger a rebuild on their own
+    with open(path, "r", encoding = "utf-8") as file:
+        tree = ast.parse(file.read())
+
+    constants = {target.id: ast.literal_eval(node.value) for node in tree.body if is_constant(node) for target in node.targets}
+    tree.body = [node for node in tree.body if not is_constant(node)]
+
+    return get_hash(ast.dump(tree)), get_hash(json.dumps(constants, sort_keys = True, default = str))
+
+def get_library_versions():
+    versions = {}
+    for library in LIBRARIES:
+        try:
+            versions[library] = importlib.metadata.version(library)
+        except importlib.metadata.PackageNotFoundError:
+            versions[library] = None
+
+    return versions
+
+def get_inputs(target, files, code_inputs):
+    # Flat input name -> hash map, comparing two of them tells exactly which input changed
+    inputs = {"build": str(BUILD_VERSION)}
+
+    for path in target.files:
+        inputs["file:" + path] = get_file_hash(path, files)
+
+    for path in target.code:
+        if (path not in code_inputs):
+            code_inputs[path] = get_code_inputs(path)
+        inputs["code:" + path], inputs["style:" + path] = code_inputs[path]
+
+    for name, value in target.data.items():
+        inputs["data:" + name] = get_hash(json.dumps(value, sort_keys = True, default = str))
+
+    return inputs
+
+def get_changes(inputs, recorded):
+    return sorted(set(name for name in set(inputs) | set(recorded) if inputs.get(name) != recorded.get(name)))
+
+def read_state(state_path = STATE_FILE_PATH):
+    if (not os.path.exists(state_path)):
+        return {"version": BUILD_VERSION, "files": {}, "targets": {}}
+
+    with open(state_path, "r", encoding = "utf-8") as file:
+        return json.load(file)
+
+def write_state(state, state_path = STATE_FILE_PATH):
+    os.makedirs(os.path.dirname(state_path), exist_ok = True)
+
+    with open(state_path + ".tmp", "w", encoding = "utf-8") as file:
+        json.dump(state, file, indent = 4)
+    os.replace(state_path + ".tmp", state_path)
+
+def save_figure(fig, output):
+    import matplotlib.pyplot as plt
+
+    with instrumentation.phase("save"):
+        fig.savefig(output, facecolor = fig.get_facecolor())
+    plt.close(fig)
+
+# FIGURES
+def get_comparision_figure(page, min_values = None, max_values = None, save_path = None):
+    import viz_template
+
+    first_player = viz_template.load_player(viz_template.BUSQUETS_DATA_PAGE)
+    second_player = viz_template.load_player(page)
+
+    if (min_values is None):
+        min_values, max_values = viz_template.load_ranges(first_player.report)
+
+    return viz_template.render_comparision(first_player, second_player, min_values, max_values, save_path)
+
+def get_gfga_figure(season):
+    import league_tables
+
+    gfga_viz = load_module("gfga_viz", "laliga_teams_22_23_gf_ga_viz/viz.py")
+
+    with open(league_tables.get_page_path(league_tables.DEFAULT_COMPETITION, season), "rb") as file:
+        club_names, club_goals_for, club_goals_against = gfga_viz.parse_clubs(file.read(), league_tables.get_table_id(league_tables.DEFAULT_COMPETITION, season))
+
+    return gfga_viz.render(club_names, club_goals_for, club_goals_against, season = season)
+
+def get_playing_time_figure(club):
+    import squads
+
+    playing_time_viz = load_module("playing_time_viz", "barca_playing_time_22_23_viz/viz.py")
+
+    player_names, player_minutes, player_ages = playing_time_viz.get_arrays(squads.parse_stored_squad(club, squads.SEASON))
+    club_title = playing_time_viz.CLUB_TITLE if club == playing_time_viz.CLUB else club.upper()
+
+    return playing_time_viz.render(player_names, player_minutes, player_ages, club_title = club_title)
+
+def get_passes_figure(rebuild = False):
+    passes_viz = load_module("passes_viz", "messi_busquets_laliga_passes_viz/viz.py")
+
+    return passes_viz.render(passes_viz.load_passes(rebuild))
+
+# BUILD FUNCTIONS
+def build_comparision(page, save_path, min_values, max_values):
+    import matplotlib.pyplot as plt
+
+    # The comparision saves itself
+    plt.close(get_comparision_figure(page, min_values, max_values, save_path))
+
+def build_gfga(season, output):
+    save_figure(get_gfga_figure(season), output)
+
+def build_playing_time(club, output):
+    save_figure(get_playing_time_figure(club), output)
+
+def build_passes(output):
+    # Only built when something changed, the store is rewritten in case it was the CSV
+    save_figure(get_passes_figure(rebuild = True), output)
+
+def init_worker(tracing = False):
+    # Tracing the workers whenever the build itself is traced, their phases get sent back with every job
+    if (tracing and not instrumentation.is_enabled()):
+        instrumentation.enable()
+    instrumentation.collect()
+
+def run_job(name, build):
+    start = time.perf_counter()
+
+    function, args = build
+    function(*args)
+
+    return name, time.perf_counter() - start, instrumentation.collect()
+
+# FUNCTIONS
+@instrumentation.phase("fetch")
+def fetch_inputs(refresh = False):
+    # Fetching the pages missing from the storage, or revalidating all of them on refresh, an unchanged page keeps its hash
+    import batch
+    import league_tables
+    import squads
+    import viz_template
+
+    playing_time_viz = load_module("playing_time_viz", "barca_playing_time_22_23_viz/viz.py")
+    gfga_viz = load_module("gfga_viz", "laliga_teams_22_23_gf_ga_viz/viz.py")
+
+    viz_template.fetch_pages([viz_template.BUSQUETS_DATA_PAGE] + [comparision["page"] for comparision in batch.load_manifest(batch.MANIFEST_FILE_PATH)], refresh)
+    league_tables.fetch_seasons([(league_tables.DEFAULT_COMPETITION, gfga_viz.SEASON)], refresh)
+    squads.fetch_squads([(playing_time_viz.CLUB, squads.SEASON)], refresh)
+
+def get_targets(refresh = False):
+    import batch
+    import league_tables
+    import report_cache
+    import squads
+    import viz_template
+
+    playing_time_viz = load_module("playing_time_viz", "barca_playing_time_22_23_viz/viz.py")
+    gfga_viz = load_module("gfga_viz", "laliga_teams_22_23_gf_ga_viz/viz.py")
+
+    libraries = get_library_versions()
+    targets = []
+
+    # The radar ranges are part of every comparision, a new snapshot rescales all of them
+    first_player = viz_template.load_player(viz_template.BUSQUETS_DATA_PAGE)
+    min_values, max_values = viz_template.load_ranges(first_player.report, refresh)
+
+    for comparision in batch.load_manifest(batch.MANIFEST_FILE_PATH):
+        # The pages are either fresh assets/<slug>.html files or archived versions, both known by their content hash
+        pages = [report_cache.get_page_hash(report_cache.get_slug(page)) for page in [viz_template.BUSQUETS_DATA_PAGE, comparision["page"]]]
+        data = {"pages": pages, "ranges": [min_values, max_values], "libraries": libraries}
+        build = (build_comparision, (comparision["page"], comparision["save_path"], min_values, max_values))
+
+        targets.append(Target("comparision/" + os.path.basename(comparision["save_path"]), viz_template.get_save_file(comparision["save_path"]), [templates.LOGO_FILE_PATH], COMPARISION_CODE + SHARED_CODE, data, build))
+
+    crests = sorted(glob.glob(gfga_viz.CRESTS_PATH + "*.png"))
+    targets.append(Target("gfga/" + gfga_viz.SEASON, GFGA_OUTPUT_FILE_PATH, [league_tables.get_page_path(league_tables.DEFAULT_COMPETITION, gfga_viz.SEASON), templates.LOGO_FILE_PATH] + crests, GFGA_CODE + SHARED_CODE, {"libraries": libraries}, (build_gfga, (gfga_viz.SEASON, GFGA_OUTPUT_FILE_PATH))))
+
+    targets.append(Target("playing_time/" + playing_time_viz.CLUB, PLAYING_TIME_OUTPUT_FILE_PATH, [squads.get_page_path(playing_time_viz.CLUB), templates.LOGO_FILE_PATH], PLAYING_TIME_CODE + SHARED_CODE, {"libraries": libraries}, (build_playing_time, (playing_time_viz.CLUB, PLAYING_TIME_OUTPUT_FILE_PATH))))
+
+    targets.append(Target("passes", PASSES_OUTPUT_FILE_PATH, ["messi_busquets_laliga_passes_viz/passes.csv", templates.LOGO_FILE_PATH], PASSES_CODE + SHARED_CODE, {"libraries": libraries}, (build_passes, (PASSES_OUTPUT_FILE_PATH,))))
+
+    return targets
+
+def get_stale(targets, state, force = False):
+    # A target is rebuilt when any recorded input changed, or when its output is gone or was overwritten since
+    code_inputs = {}
+    stale = []
+
+    for target in targets:
+        inputs = get_inputs(target, state["files"], code_inputs)
+        recorded = state["targets"].get(target.name)
+
+        if (force or recorded is None):
+            changes = ["forced" if force else "new"]
+        else:
+            changes = get_changes(inputs, recorded["inputs"])
+            if (not os.path.exists(target.output) or assets.get_source_stamp(target.output) != recorded["output"]):
+                changes.append("output")
+
+        if (len(changes) > 0):
+            stale.append((target, inputs, changes))
+
+    return stale
+
+def build(names = None, refresh = False, force = False, workers = None, dry_run = False, state_path = STATE_FILE_PATH):
+    fetch_inputs(refresh)
+
+    state = read_state(state_path)
+    if (state.get("version") != BUILD_VERSION):
+        state = {"version": BUILD_VERSION, "files": {}, "targets": {}}
+
+    with instrumentation.phase("process"):
+        targets = [target for target in get_targets(refresh) if names is None or any(target.name.startswith(name) for name in names)]
+        stale = get_stale(targets, state, force)
+
+    instrumentation.count("targets_skipped", len(targets) - len(stale))
+
+    if (dry_run or len(stale) == 0):
+        write_state(state, state_path)
+        return targets, stale, []
+
+    if (workers is None):
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(stale)))
+
+    # Building the asset atlas up front, the workers only memory-map it
+    templates.get_logo()
+
+    results = []
+    stale_inputs = {target.name: (target, inputs) for target, inputs, changes in stale}
+    with ProcessPoolExecutor(max_workers = workers, initializer = init_worker, initargs = (instrumentation.is_enabled(),)) as executor:
+        futures = {executor.submit(run_job, target.name, target.build): target.name for target, inputs, changes in stale}
+        for future in as_completed(futures):
+            try:
+                name, duration, trace = future.result()
+            except Exception as error:
+                # The target keeps its old record, so the next build tries it again
+                print("Could not build " + futures[future] + ": " + str(error))
+                continue
+
+            instrumentation.merge(trace)
+
+            # Recording every finished output right away, an interrupted build keeps what it already built
+            target, inputs = stale_inputs[name]
+            state["targets"][name] = {"inputs": inputs, "output": assets.get_source_stamp(target.output), "built": datetime.now().isoformat(timespec = "seconds"), "duration": duration}
+            write_state(state, state_path)
+
+            results.append((name, duration))
+
+    return targets, stale, results
+
+def print_build(targets, stale, results, wall_time, dry_run = False):
+    durations = dict(results)
+
+    for target, inputs, changes in stale:
+        status = "would build" if dry_run else "{:.2f}s".format(durations[target.name]) if target.name in durations else "failed"
+        print("{:<40} {:>12}  {}".format(target.name, status, ", ".join(changes)))
+
+    print("{} {} of {} outputs, skipped {} unchanged in {:.2f}s".format("Would rebuild" if dry_run else "Rebuilt", len(stale) if dry_run else len(results), len(targets), len(targets) - len(stale), wall_time))
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Rebuild only the viz outputs whose pages, ranges, code, style constants or libraries changed")
+    parser.add_argument("--target", action = "append", help = "only build the targets starting with this, e.g. comparision/ or gfga")
+    parser.add_argument("--refresh", action = "store_true", help = "revalidate every page and rebuild the radar ranges first")
+    parser.add_argument("--force", action = "store_true", help = "rebuild every target whether it changed or not")
+    parser.add_argument("--workers", type = int, default = None)
+    parser.add_argument("--dry-run", action = "store_true", help = "only list the targets which would be rebuilt and why")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    targets, stale, results = build(args.target, args.refresh, args.force, args.workers, args.dry_run)
+    print_build(targets, stale, results, time.perf_counter() - start, args.dry_run)
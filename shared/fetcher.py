@@ -0,0 +1,253 @@
+# IMPORTS
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from shared import instrumentation
+
+# CONSTANTS
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/47.0.2526.106 Safari/537.36"}
+
+VALIDATORS_FILE_PATH = "shared/cache/validators.json"
+
+# Requests per second and burst size per host, the old code slept 3 seconds before every request
+HOST_LIMITS = {
+    "fbref.com": (1 / 3, 1),
+    "www.transfermarkt.com": (1 / 3, 1),
+    "raw.githubusercontent.com": (10, 10),
+}
+DEFAULT_LIMIT = (1, 1)
+
+# The fixed sleep every request paid before this layer existed
+BASELINE_SLEEP = 3
+
+MAX_RETRIES = 4
+BACKOFF_FACTOR = 1.5
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+# Address of a replay server standing in for every live host, e.g. http://127.0.0.1:8766, see shared/replay.py
+REPLAY_URL = os.environ.get("REPLAY_URL")
+
+# Outcome of a single fetch
+FetchResult = namedtuple("FetchResult", ["url", "status", "content", "revalidated", "attempts", "duration"])
+
+# CLASSES
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self, tolerance = 0):
+        # Taking a token when one is available, or due within tolerance seconds, otherwise returning how long until the next one
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if (self.tokens >= 1 - tolerance * self.rate):
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        # Blocking until a token is available, the lock is released while waiting so other hosts are not held up
+        while True:
+            wait = self.try_acquire()
+            if (wait == 0):
+                return
+
+            time.sleep(wait)
+
+class Fetcher:
+    def __init__(self, headers = DEFAULT_HEADERS, host_limits = HOST_LIMITS, default_limit = DEFAULT_LIMIT, max_workers = 8, validators_path = VALIDATORS_FILE_PATH, max_retries = MAX_RETRIES, backoff_factor = BACKOFF_FACTOR, replay_url = REPLAY_URL):
+        self.host_limits = host_limits
+        self.default_limit = default_limit
+        self.max_workers = max_workers
+        self.validators_path = validators_path
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.headers = headers
+        self.replay_url = replay_url
+
+        # Created on the first request, a run served from the storage never imports requests
+        self.session = None
+
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+        self.validators = {}
+        if (validators_path is not None and os.path.exists(validators_path)):
+            with open(validators_path, "r", encoding = "utf-8") as file:
+                self.validators = json.load(file)
+
+    def get_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # One pooled keep-alive session shared by every thread
+        with self.lock:
+            if (self.session is None):
+                session = requests.Session()
+                session.headers.update(self.headers)
+                adapter = HTTPAdapter(pool_connections = self.max_workers, pool_maxsize = self.max_workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+
+                self.session = session
+
+            return self.session
+
+    def get_bucket(self, url):
+        host = urlsplit(url).hostname or ""
+
+        with self.lock:
+            if (host not in self.buckets):
+                rate, capacity = self.host_limits.get(host, self.default_limit)
+                self.buckets[host] = TokenBucket(rate, capacity)
+
+            return self.buckets[host]
+
+    def get_retry_delay(self, response, attempt):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if (retry_after is not None and retry_after.isdigit()):
+            return int(retry_after)
+
+        return self.backoff_factor * (2 ** attempt)
+
+    def save_validators(self):
+        if (self.validators_path is None):
+            return
+
+        with self.lock:
+            os.makedirs(os.path.dirname(self.validators_path), exist_ok = True)
+            with open(self.validators_path, "w", encoding = "utf-8") as file:
+                json.dump(self.validators, file, indent = 4)
+
+    def fetch(self, url, cache_path = None):
+        import requests
+
+        start = time.perf_counter()
+        session = self.get_session()
+        bucket = self.get_bucket(url)
+
+        # The limits stay those of the live host, so the replay server can tell whether they are kept
+        request_url = url
+        if (self.replay_url is not None):
+            from shared import replay
+            request_url = replay.to_replay_url(url, self.replay_url)
+
+        # Revalidating the stored copy instead of downloading it again, a copy without validators is downloaded once to get them, as its mtime
+        # only tells when it was checked out or restored, not when the server sent it
+        headers = {}
+        validators = self.validators.get(url, {})
+        if (cache_path is not None and os.path.exists(cache_path)):
+            if ("etag" in validators):
+                headers["If-None-Match"] = validators["etag"]
+            if ("last_modified" in validators):
+                headers["If-Modified-Since"] = validators["last_modified"]
+
+        attempt = 0
+        while True:
+            bucket.acquire()
+
+            response = None
+            try:
+                response = session.get(request_url, headers = headers)
+            except requests.ConnectionError:
+                if (attempt >= self.max_retries):
+                    raise
+
+            if (response is not None and response.status_code not in RETRY_STATUSES):
+                break
+            if (attempt >= self.max_retries):
+                response.raise_for_status()
+
+            time.sleep(self.get_retry_delay(response, attempt))
+            attempt += 1
+
+        if (response.status_code == 304):
+            with open(cache_path, "rb") as file:
+                content = file.read()
+
+            instrumentation.count("cache_hits")
+
+            return FetchResult(url, 304, content, True, attempt + 1, time.perf_counter() - start)
+
+        response.raise_for_status()
+        content = response.content
+
+        instrumentation.count("cache_misses")
+        instrumentation.count("bytes_fetched", len(content))
+
+        if (cache_path is not None):
+            with open(cache_path, "wb") as file:
+                file.write(content)
+
+            validators = {}
+            if ("ETag" in response.headers):
+                validators["etag"] = response.headers["ETag"]
+            if ("Last-Modified" in response.headers):
+                validators["last_modified"] = response.headers["Last-Modified"]
+
+            with self.lock:
+                self.validators[url] = validators
+            self.save_validators()
+
+        return FetchResult(url, response.status_code, content, False, attempt + 1, time.perf_counter() - start)
+
+    def fetch_all(self, urls, cache_paths = None):
+        # Running the requests concurrently, the per-host buckets keep every host within its limit
+        if (cache_paths is None):
+            cache_paths = [None] * len(urls)
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+            return list(executor.map(self.fetch, urls, cache_paths))
+
+# FUNCTIONS
+default_fetcher = None
+
+def get_fetcher():
+    global default_fetcher
+
+    if (default_fetcher is None):
+        default_fetcher = Fetcher()
+
+    return default_fetcher
+
+def route_statsbomb(replay_url = REPLAY_URL):
+    # statsbombpy sends its own requests, its open data URLs get pointed at the replay server instead
+    if (replay_url is None):
+        return
+
+    from statsbombpy import config
+
+    from shared import replay
+
+    for name, path in config.OPEN_DATA_PATHS.items():
+        if (not path.startswith(replay_url)):
+            config.OPEN_DATA_PATHS[name] = replay.to_replay_url(path, replay_url)
+
+def get_report(results, wall_time):
+    # Comparing the wall time with the old sequential fetching, which slept before every request
+    baseline = sum(BASELINE_SLEEP + result.duration for result in results)
+
+    return {
+        "requests": len(results),
+        "revalidated": sum(1 for result in results if result.revalidated),
+        "retries": sum(result.attempts - 1 for result in results),
+        "bytes": sum(len(result.content) for result in results if not result.revalidated),
+        "wall_time": wall_time,
+        "baseline_time": baseline,
+        "speedup": baseline / wall_time if wall_time > 0 else 0,
+    }
+
+def print_report(report):
+    print("Fetched {} pages ({} revalidated, {} retries, {} bytes) in {:.2f}s, sequential 3s-sleep baseline {:.2f}s ({:.1f}x)".format(report["requests"], report["revalidated"], report["retries"], report["bytes"], report["wall_time"], report["baseline_time"], report["speedup"]))
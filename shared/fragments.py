@@ -0,0 +1,19 @@
+# FUNCTIONS
+def slice_fragment(html, marker, closing_tag, stop_marker = None):
+    # Cutting out only the element containing the marker, so the parser never sees the rest of the page
+    marker_index = html.find(marker)
+    if (marker_index == -1):
+        return None
+
+    start = html.rfind("<", 0, marker_index)
+
+    if (stop_marker is not None and html.find(stop_marker, marker_index) != -1):
+        stop_index = html.find(stop_marker, marker_index)
+    else:
+        stop_index = marker_index
+
+    end = html.find(closing_tag, stop_index)
+    if (end == -1):
+        return html[start:]
+
+    return html[start:end + len(closing_tag)]
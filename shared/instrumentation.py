@@ -0,0 +1,242 @@
+# IMPORTS
+from contextlib import contextmanager
+from datetime import datetime
+import atexit
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+
+# CONSTANTS
+TRACES_PATH = "shared/cache/traces/"
+
+# Setting VIZ_TRACE (to a folder, or to 1 for the default one) traces every run of any viz without editing it
+TRACE_ENVIRONMENT_VARIABLE = "VIZ_TRACE"
+# Setting VIZ_PROFILE to a phase name also dumps a cProfile of that phase next to the trace
+PROFILE_ENVIRONMENT_VARIABLE = "VIZ_PROFILE"
+
+# Writing 5 into clear_refs resets the peak RSS of the process, Linux only
+CLEAR_REFS_FILE_PATH = "/proc/self/clear_refs"
+STATUS_FILE_PATH = "/proc/self/status"
+
+# State of the current run, phases opened from worker threads are attributed to the phase open in the main thread
+state = {"enabled": False, "trace_path": None, "profile_phase": None, "profiler": None, "started": None, "start": None, "stack": [], "phases": [], "counters": {}}
+lock = threading.Lock()
+
+# HELPING FUNCTIONS
+def read_peak_rss():
+    # Peak resident set size in bytes since the last reset, or since the process started where resetting is not possible
+    try:
+        with open(STATUS_FILE_PATH, "r") as file:
+            for line in file:
+                if (line.startswith("VmHWM:")):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+def reset_peak_rss():
+    try:
+        with open(CLEAR_REFS_FILE_PATH, "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+def get_default_trace_path():
+    script_name = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+    parent_name = os.path.basename(os.path.dirname(os.path.abspath(sys.argv[0]))) if sys.argv[0] else ""
+
+    return os.path.join(TRACES_PATH, "-".join([name for name in [parent_name, script_name] if name != ""]) + "-" + datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+
+# FUNCTIONS
+def enable(trace_path = None, profile_phase = None):
+    if (trace_path is None or os.path.isdir(trace_path) or trace_path.endswith("/")):
+        trace_path = get_default_trace_path() if trace_path is None else os.path.join(trace_path, os.path.basename(get_default_trace_path()))
+
+    state["enabled"] = True
+    state["trace_path"] = trace_path
+    state["profile_phase"] = profile_phase
+    state["profiler"] = cProfile.Profile() if profile_phase is not None else None
+    state["started"] = datetime.now().isoformat(timespec = "seconds")
+    state["start"] = time.perf_counter()
+    state["stack"] = []
+    state["phases"] = []
+    state["counters"] = {}
+
+def is_enabled():
+    return state["enabled"]
+
+@contextmanager
+def phase(name):
+    # Works both as a with block and as a function decorator, a disabled trace costs a single check
+    if (not state["enabled"] or threading.current_thread() is not threading.main_thread()):
+        yield
+        return
+
+    record = {"name": name, "path": "/".join([parent["name"] for parent in state["stack"]] + [name]), "offset": time.perf_counter() - state["start"], "counters": {}}
+
+    # Keeping the peak of the parent phase before resetting it for this one
+    if (len(state["stack"]) > 0):
+        parent = state["stack"][-1]
+        parent["peak"] = max(parent["peak"], read_peak_rss() or 0)
+
+    record["rss_scope"] = "phase" if reset_peak_rss() else "process"
+    record["peak"] = 0
+
+    profiling = state["profiler"] is not None and name == state["profile_phase"] and not any(parent["name"] == name for parent in state["stack"])
+
+    state["stack"].append(record)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    if (profiling):
+        state["profiler"].enable()
+
+    try:
+        yield
+    finally:
+        if (profiling):
+            state["profiler"].disable()
+
+        record["wall_time"] = time.perf_counter() - wall_start
+        record["cpu_time"] = time.process_time() - cpu_start
+        record["peak_rss"] = max(record.pop("peak"), read_peak_rss() or 0)
+
+        state["stack"].pop()
+        if (len(state["stack"]) > 0):
+            parent = state["stack"][-1]
+            parent["peak"] = max(parent["peak"], record["peak_rss"])
+
+        with lock:
+            state["phases"].append(record)
+
+def count(name, value = 1):
+    # Adding to a counter of the innermost open phase, or of the run itself outside of any phase
+    if (not state["enabled"]):
+        return
+
+    with lock:
+        counters = state["stack"][-1]["counters"] if len(state["stack"]) > 0 else state["counters"]
+        counters[name] = counters.get(name, 0) + value
+
+def collect():
+    # Handing everything recorded so far over to another process, a render worker sends it back with its result
+    with lock:
+        collected = {"phases": state["phases"], "counters": state["counters"]}
+        state["phases"], state["counters"] = [], {}
+
+    return collected
+
+def merge(collected):
+    with lock:
+        state["phases"].extend(collected["phases"])
+
+        for name, value in collected["counters"].items():
+            state["counters"][name] = state["counters"].get(name, 0) + value
+
+def get_summary(phases):
+    # Totals per phase name, a batch run enters the same phase many times
+    summary = {}
+    for record in phases:
+        totals = summary.setdefault(record["path"], {"calls": 0, "wall_time": 0, "cpu_time": 0, "peak_rss": 0, "counters": {}})
+        totals["calls"] += 1
+        totals["wall_time"] += record["wall_time"]
+        totals["cpu_time"] += record["cpu_time"]
+        totals["peak_rss"] = max(totals["peak_rss"], record["peak_rss"])
+
+        for counter, value in record["counters"].items():
+            totals["counters"][counter] = totals["counters"].get(counter, 0) + value
+
+    return summary
+
+def get_trace():
+    phases = sorted(state["phases"], key = lambda record: record["offset"])
+
+    counters = dict(state["counters"])
+    for record in phases:
+        for counter, value in record["counters"].items():
+            counters[counter] = counters.get(counter, 0) + value
+
+    return {
+        "script": sys.argv[0],
+        "started": state["started"],
+        "wall_time": time.perf_counter() - state["start"],
+        "peak_rss": max([record["peak_rss"] for record in phases] + [read_peak_rss() or 0]),
+        "counters": counters,
+        "phases": phases,
+        "summary": get_summary(phases),
+    }
+
+def get_profile_path(trace_path, profile_phase):
+    return os.path.splitext(trace_path)[0] + "." + profile_phase + ".prof"
+
+def write_trace():
+    if (not state["enabled"]):
+        return None
+
+    trace = get_trace()
+
+    os.makedirs(os.path.dirname(state["trace_path"]) or ".", exist_ok = True)
+
+    if (state["profiler"] is not None):
+        trace["profile"] = get_profile_path(state["trace_path"], state["profile_phase"])
+        state["profiler"].dump_stats(trace["profile"])
+
+    with open(state["trace_path"], "w", encoding = "utf-8") as file:
+        json.dump(trace, file, indent = 4)
+
+    return state["trace_path"]
+
+def print_summary(trace):
+    print("{:<30} {:>6} {:>10} {:>10} {:>12}  {}".format("phase", "calls", "wall", "cpu", "peak rss", "counters"))
+
+    for path, totals in trace["summary"].items():
+        counters = ", ".join([counter + " " + str(value) for counter, value in totals["counters"].items()])
+        print("{:<30} {:>6} {:>9.3f}s {:>9.3f}s {:>9.1f} MB  {}".format(path, totals["calls"], totals["wall_time"], totals["cpu_time"], totals["peak_rss"] / 1e6, counters))
+
+    counters = ", ".join([counter + " " + str(value) for counter, value in trace["counters"].items()])
+    print("{:<30} {:>6} {:>9.3f}s {:>10} {:>9.1f} MB  {}".format("run", "", trace["wall_time"], "", trace["peak_rss"] / 1e6, counters))
+
+# Tracing from the environment, so production runs can be traced without touching the scripts
+if (os.environ.get(TRACE_ENVIRONMENT_VARIABLE, "") != "" or os.environ.get(PROFILE_ENVIRONMENT_VARIABLE, "") != ""):
+    trace_setting = os.environ.get(TRACE_ENVIRONMENT_VARIABLE, "")
+    enable(None if trace_setting in ["", "1"] else trace_setting, os.environ.get(PROFILE_ENVIRONMENT_VARIABLE) or None)
+    atexit.register(write_trace)
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+    import runpy
+
+    parser = argparse.ArgumentParser(description = "Run a viz script with every phase traced")
+    parser.add_argument("script", help = "viz script to run, e.g. laliga_teams_22_23_gf_ga_viz/viz.py")
+    parser.add_argument("--trace", default = None, help = "trace file or folder, " + TRACES_PATH + " by default")
+    parser.add_argument("--profile", default = None, help = "phase to dump a cProfile of, e.g. parse")
+    args, script_args = parser.parse_known_args()
+
+    # The scripts import this module as shared.instrumentation, so that instance gets enabled
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(os.path.abspath(os.path.join(current_dir, '..')))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+
+    from shared import instrumentation
+
+    sys.argv = [args.script] + script_args
+    instrumentation.enable(args.trace, args.profile)
+
+    try:
+        runpy.run_path(args.script, run_name = "__main__")
+    finally:
+        trace_path = instrumentation.write_trace()
+        instrumentation.print_summary(instrumentation.get_trace())
+        print("Stored the trace in " + trace_path)
@@ -0,0 +1,147 @@
+# IMPORTS
+import time
+
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.font_manager import FontProperties
+
+# CONSTANTS
+# Offsets tried around every point, in label heights, nearest first
+DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+RINGS = [0.35, 1, 2, 3.5, 5]
+
+# Labels further from their point than the first ring get a line back to it
+LINE_RING = 1
+
+# Space kept free around every label and marker, in pixels
+PADDING = 2
+
+# CLASSES
+class BoxGrid:
+    # Uniform grid of occupied boxes, a query only checks the boxes sharing a cell with the candidate
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.boxes = []
+
+    def get_cells(self, box):
+        x0, y0, x1, y1 = (int(value // self.cell_size) for value in box)
+
+        return [(i, j) for i in range(x0, x1 + 1) for j in range(y0, y1 + 1)]
+
+    def add(self, box):
+        self.boxes.append(box)
+        for cell in self.get_cells(box):
+            self.cells.setdefault(cell, []).append(len(self.boxes) - 1)
+
+    def overlaps(self, box):
+        for cell in self.get_cells(box):
+            for index in self.cells.get(cell, []):
+                other = self.boxes[index]
+                if (box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]):
+                    return True
+
+        return False
+
+# FUNCTIONS
+def get_text_sizes(fig, texts, size, family, weight):
+    # Measuring every distinct label once, in pixels
+    renderer = fig.canvas.get_renderer()
+    prop = FontProperties(family = family, size = size, weight = weight)
+
+    sizes = {}
+    for text in set(texts):
+        width, height, descent = renderer.get_text_width_height_descent(text, prop, ismath = False)
+        sizes[text] = (width, height)
+
+    return np.array([sizes[text] for text in texts], dtype = float).reshape(-1, 2)
+
+def get_candidate(point, size, direction, offset):
+    # The label box placed next to the point, so its nearest edge sits the offset away from it
+    x, y = point
+    width, height = size
+    dx, dy = direction
+
+    center_x = x + dx * (width / 2 + offset)
+    center_y = y + dy * (height / 2 + offset)
+
+    return (center_x - width / 2 - PADDING, center_y - height / 2 - PADDING, center_x + width / 2 + PADDING, center_y + height / 2 + PADDING)
+
+def get_nearest_point(box, point):
+    return (min(max(point[0], box[0] + PADDING), box[2] - PADDING), min(max(point[1], box[1] + PADDING), box[3] - PADDING))
+
+def place_labels(fig, ax, x, y, texts, priorities = None, obstacles = None, marker_size = 8, time_budget = None, textsize = 13, textcolor = "black", linecolor = "black", family = "sans-serif", fontweight = "normal", linewidth = 0.75):
+    # Greedy placement in priority order, labels without a free spot or past the time budget are dropped
+    start = time.perf_counter()
+
+    x = np.asarray(x, dtype = float)
+    y = np.asarray(y, dtype = float)
+    texts = [str(text) for text in texts]
+
+    if (len(texts) == 0):
+        return []
+
+    # Settling the autoscaled limits, so the data to pixel transform is final
+    ax.get_xlim()
+    ax.get_ylim()
+
+    points = ax.transData.transform(np.column_stack([x, y]))
+    sizes = get_text_sizes(fig, texts, textsize, family, fontweight)
+    bounds = ax.get_window_extent()
+
+    # Cells about one label in size keep every query to a handful of boxes
+    grid = BoxGrid(max(float(np.median(sizes[:, 0])), float(np.median(sizes[:, 1])), 1.0))
+
+    # The markers and any extra obstacles (pixel boxes, e.g. crests) can not be covered
+    marker_pixels = marker_size * fig.dpi / 72 / 2
+    for point in points:
+        grid.add((point[0] - marker_pixels, point[1] - marker_pixels, point[0] + marker_pixels, point[1] + marker_pixels))
+    for box in (obstacles if obstacles is not None else []):
+        grid.add(tuple(box))
+
+    order = np.argsort(-np.asarray(priorities, dtype = float), kind = "stable") if priorities is not None else np.arange(len(texts))
+
+    placed = []
+    lines = []
+    for index in order:
+        if (time_budget is not None and time.perf_counter() - start > time_budget):
+            break
+
+        offset_unit = sizes[index][1]
+        for ring in RINGS:
+            offset = marker_pixels + ring * offset_unit
+
+            candidate = None
+            for direction in DIRECTIONS:
+                box = get_candidate(points[index], sizes[index], direction, offset)
+                if (box[0] < bounds.x0 or box[1] < bounds.y0 or box[2] > bounds.x1 or box[3] > bounds.y1):
+                    continue
+
+                if (not grid.overlaps(box)):
+                    candidate = box
+                    break
+
+            if (candidate is not None):
+                grid.add(candidate)
+                placed.append((index, candidate))
+
+                if (ring > LINE_RING):
+                    lines.append((points[index], get_nearest_point(candidate, points[index])))
+                break
+
+    # Converting the chosen boxes back into data coordinates
+    to_data = ax.transData.inverted()
+    for index, box in placed:
+        center = to_data.transform(((box[0] + box[2]) / 2, (box[1] + box[3]) / 2))
+        ax.text(center[0], center[1], texts[index], ha = "center", va = "center", fontsize = textsize, color = textcolor, family = family, fontweight = fontweight)
+
+    if (len(lines) > 0):
+        ax.add_collection(LineCollection([to_data.transform(line) for line in lines], colors = linecolor, linewidths = linewidth, zorder = 1))
+
+    return [index for index, box in placed]
+
+def get_image_obstacles(ax, x, y, image_sizes):
+    # Pixel boxes of images centred on data points, image_sizes in pixels
+    points = ax.transData.transform(np.column_stack([np.asarray(x, dtype = float), np.asarray(y, dtype = float)]))
+
+    return [(point[0] - width / 2, point[1] - height / 2, point[0] + width / 2, point[1] + height / 2) for point, (width, height) in zip(points, image_sizes)]
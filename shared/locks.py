@@ -0,0 +1,61 @@
+# IMPORTS
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+# CONSTANTS
+# Seconds between two attempts at a lock file held by another process, Windows only, flock waits by itself
+RETRY_DELAY = 0.05
+
+# One lock per lock file, the threads of a process queue up here before taking the file lock
+thread_locks = {}
+thread_locks_lock = threading.Lock()
+
+# HELPING FUNCTIONS
+def get_thread_lock(lock_path):
+    with thread_locks_lock:
+        return thread_locks.setdefault(os.path.abspath(lock_path), threading.Lock())
+
+def lock_file(file):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+
+        # Windows locks byte ranges, the first byte stands for the whole file
+        while True:
+            try:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(RETRY_DELAY)
+
+    fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+
+def unlock_file(file):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+
+    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+# FUNCTIONS
+@contextmanager
+def file_lock(lock_path):
+    # Holding the lock file exclusively against the other threads of this process and every other process
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok = True)
+
+    with get_thread_lock(lock_path):
+        with open(lock_path, "a+b") as file:
+            lock_file(file)
+            try:
+                yield
+            finally:
+                unlock_file(file)
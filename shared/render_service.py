@@ -0,0 +1,272 @@
+# IMPORTS
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+# Rendering without a window, every chart is only encoded
+os.environ["MPLBACKEND"] = "Agg"
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import build
+
+# CONSTANTS
+HOST = "127.0.0.1"
+PORT = 8765
+
+WORKERS = 2
+
+# Latencies kept per chart for the metrics
+METRICS_WINDOW = 1000
+
+# Every chart the service renders and the query parameters it takes, with their defaults
+CHARTS = {
+    "comparision": {"page": None},
+    "gfga": {"season": "2022-2023"},
+    "playing_time": {"club": "Barcelona"},
+    "passes": {},
+}
+
+# The only pages the comparision chart fetches, FBref player pages, so the service never requests an arbitrary URL
+PLAYER_PAGE_PATTERN = re.compile(r"https://fbref\.com/en/players/[0-9a-f]{8}/[^/?#\s]+")
+
+# The inputs prepared before the workers start that every chart reads
+CHART_INPUTS = {
+    "comparision": ["player pages", "ranges"],
+    "gfga": ["league table"],
+    "playing_time": ["squad"],
+    "passes": ["pass store"],
+}
+
+# Latencies of the served jobs, per chart
+metrics = {chart: deque(maxlen = METRICS_WINDOW) for chart in CHARTS}
+metrics_lock = threading.Lock()
+
+# The pool of warm workers, started once per service
+executor = None
+
+# HELPING FUNCTIONS
+def warm_up(failed_inputs = ()):
+    # Importing every plotting library and pipeline module, building the asset atlas views and the font cache once per worker
+    import mplsoccer
+    import pandas
+
+    import viz_template
+
+    build.load_module("gfga_viz", "laliga_teams_22_23_gf_ga_viz/viz.py")
+    build.load_module("playing_time_viz", "barca_playing_time_22_23_viz/viz.py")
+    build.load_module("passes_viz", "messi_busquets_laliga_passes_viz/viz.py")
+
+    # Rendering every chart once, which fills the font, text layout and report caches, only from the inputs prepared before the workers started
+    for chart, params in CHARTS.items():
+        if (any(name in failed_inputs for name in CHART_INPUTS[chart])):
+            continue
+
+        try:
+            render_job(chart, dict(params, page = viz_template.BUSQUETS_DATA_PAGE), time.time())
+        except Exception as error:
+            # The chart then pays for its caches on its first job instead
+            print("Could not warm up the " + chart + " chart in worker " + str(os.getpid()) + ": " + str(error))
+
+def prepare_inputs(refresh = False):
+    # Fetching the pages and building the stores every chart reads once, in this process, so the workers only ever read them and never fetch
+    # with rate limits of their own or write the same files at the same time, the ranges are only crawled on refresh
+    import batch
+    import league_tables
+    import squads
+    import viz_template
+
+    gfga_viz = build.load_module("gfga_viz", "laliga_teams_22_23_gf_ga_viz/viz.py")
+    playing_time_viz = build.load_module("playing_time_viz", "barca_playing_time_22_23_viz/viz.py")
+
+    # The same pages as a build fetches, each chart only misses its own when one cannot be fetched
+    steps = [
+        ("player pages", lambda: viz_template.fetch_pages([viz_template.BUSQUETS_DATA_PAGE] + [comparision["page"] for comparision in batch.load_manifest(batch.MANIFEST_FILE_PATH)], refresh)),
+        ("league table", lambda: league_tables.fetch_seasons([(league_tables.DEFAULT_COMPETITION, gfga_viz.SEASON)], refresh)),
+        ("squad", lambda: squads.fetch_squads([(playing_time_viz.CLUB, squads.SEASON)], refresh)),
+        ("ranges", lambda: viz_template.load_ranges(viz_template.load_player(viz_template.BUSQUETS_DATA_PAGE).report, refresh)),
+        ("pass store", lambda: build.load_module("passes_viz", "messi_busquets_laliga_passes_viz/viz.py").load_passes()),
+    ]
+
+    failed_inputs = []
+    for name, step in steps:
+        try:
+            step()
+        except Exception as error:
+            # The charts needing it are not warmed up, they fail on their own jobs instead
+            print("Could not prepare the " + name + ": " + str(error))
+            failed_inputs.append(name)
+
+    return failed_inputs
+
+def get_figure(chart, params):
+    if (chart == "comparision"):
+        return build.get_comparision_figure(params["page"])
+    if (chart == "gfga"):
+        return build.get_gfga_figure(params["season"])
+    if (chart == "playing_time"):
+        return build.get_playing_time_figure(params["club"])
+
+    return build.get_passes_figure()
+
+def render_job(chart, params, submitted):
+    import matplotlib.pyplot as plt
+
+    # Time spent waiting for a free worker
+    started = time.time()
+
+    render_start = time.perf_counter()
+    fig = get_figure(chart, params)
+    render_time = time.perf_counter() - render_start
+
+    # Saving rasterizes the figure and encodes the PNG
+    draw_start = time.perf_counter()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format = "png", facecolor = fig.get_facecolor())
+    plt.close(fig)
+    draw_time = time.perf_counter() - draw_start
+
+    return buffer.getvalue(), {"queue_time": max(0, started - submitted), "render_time": render_time, "draw_time": draw_time, "worker": os.getpid()}
+
+def get_params(chart, query):
+    params = {}
+    for name, default in CHARTS[chart].items():
+        values = parse_qs(query).get(name)
+        if (values is None and default is None):
+            raise ValueError("The " + chart + " chart needs a " + name)
+
+        params[name] = values[0] if values is not None else default
+
+    if ("page" in params and PLAYER_PAGE_PATTERN.fullmatch(params["page"]) is None):
+        raise ValueError("The page has to be an FBref player page, like https://fbref.com/en/players/5ab0ea87/Sergio-Busquets")
+
+    return params
+
+def get_percentile(values, percentile):
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(round(percentile / 100 * (len(values) - 1))))]
+
+def get_metrics():
+    summary = {}
+    with metrics_lock:
+        for chart, latencies in metrics.items():
+            if (len(latencies) == 0):
+                continue
+
+            totals = [latency["total_time"] for latency in latencies]
+            summary[chart] = {
+                "jobs": len(totals),
+                "mean": sum(totals) / len(totals),
+                "p50": get_percentile(totals, 50),
+                "p95": get_percentile(totals, 95),
+                "max": max(totals),
+                "last": latencies[-1],
+            }
+
+    return summary
+
+# CLASSES
+class RenderHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, content):
+        body = json.dumps(content, indent = 4).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+
+        if (url.path == "/metrics"):
+            self.send_json(200, get_metrics())
+            return
+
+        # /render/<chart>?<params>
+        chart = url.path[len("/render/"):] if url.path.startswith("/render/") else None
+        if (chart not in CHARTS):
+            self.send_json(404, {"error": "Unknown chart, one of " + ", ".join(CHARTS.keys())})
+            return
+
+        try:
+            params = get_params(chart, url.query)
+        except ValueError as error:
+            self.send_json(400, {"error": str(error)})
+            return
+
+        start = time.perf_counter()
+        try:
+            content, latency = executor.submit(render_job, chart, params, time.time()).result()
+        except Exception as error:
+            self.send_json(500, {"error": str(error)})
+            return
+
+        latency["total_time"] = time.perf_counter() - start
+        with metrics_lock:
+            metrics[chart].append(latency)
+
+        # The latencies ride along with the image, so a client never needs a second request for them
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(content)))
+        for name in ["queue_time", "render_time", "draw_time", "total_time"]:
+            self.send_header("X-" + name.replace("_", "-").title(), "{:.4f}".format(latency[name]))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+# FUNCTIONS
+def start(host = HOST, port = PORT, workers = WORKERS, refresh = False):
+    global executor
+
+    # Building the asset atlas up front, the workers only memory-map it, like every other store
+    from shared import templates
+    templates.get_logo()
+
+    failed_inputs = prepare_inputs(refresh)
+
+    # Every worker gets warmed before the first job arrives, a job then only pays for its own chart
+    warm_start = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers = workers, initializer = warm_up, initargs = (failed_inputs,))
+    for future in [executor.submit(os.getpid) for i in range(workers)]:
+        future.result()
+
+    server = ThreadingHTTPServer((host, port), RenderHandler)
+
+    return server, time.perf_counter() - warm_start
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Serve PNG renders of every chart from a pool of warm worker processes")
+    parser.add_argument("--host", default = HOST)
+    parser.add_argument("--port", type = int, default = PORT)
+    parser.add_argument("--workers", type = int, default = WORKERS)
+    parser.add_argument("--refresh", action = "store_true", help = "revalidate every page and rebuild the radar ranges before the workers start")
+    args = parser.parse_args()
+
+    server, warm_time = start(args.host, args.port, args.workers, args.refresh)
+    print("Warmed {} workers in {:.2f}s, serving http://{}:{}/render/<{}> and /metrics".format(args.workers, warm_time, args.host, args.port, "|".join(CHARTS.keys())))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        executor.shutdown()
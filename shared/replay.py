@@ -0,0 +1,353 @@
+# IMPORTS
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.append(parent_dir)
+
+from shared import archive
+from shared import fetcher
+
+# CONSTANTS
+HOST = "127.0.0.1"
+PORT = 8766
+
+# Recorded responses, the bodies are kept compressed and deduplicated in a page archive
+RECORDINGS_PATH = "shared/recordings/"
+RECORDINGS_FILE_NAME = "recordings.json"
+ARCHIVE_FOLDER_NAME = "archive/"
+
+# Snapshots kept in the repo, served without recording them first
+PLAYER_PAGES_PREFIX = "https://fbref.com/en/players/"
+PLAYER_PAGES_ARCHIVE_PATH = "busquets_replacements_comparision/assets/archive/"
+FIXTURES = {
+    "https://fbref.com/en/comps/12/2022-2023/2022-2023-La-Liga-Stats": "benchmarks/fixtures/fbref_laliga.html",
+    "https://www.transfermarkt.com/fc-barcelona/leistungsdaten/verein/131/reldata/%262022/plus/1": "benchmarks/fixtures/transfermarkt_barcelona.html",
+}
+
+# The server's own endpoints, no recorded host starts with them
+CONTROL_PATH = "/__replay__/"
+
+# Every fault is off by default, the server then answers like a fast and patient host
+DEFAULT_FAULTS = {
+    "latency": 0, # seconds before the response starts
+    "jitter": 0, # seconds of uniform noise around the latency
+    "bandwidth": None, # bytes per second of every response body
+    "failure_rate": 0, # share of requests answered with a server error
+    "drop_rate": 0, # share of requests whose connection is closed without a response
+    "retry_after": 1, # seconds sent along with a 429
+}
+FAILURE_STATUSES = [500, 502, 503, 504]
+
+# Seconds a request may reach the host before its token, requests arrive a little later or earlier than the client sent them and a client keeping the limit is never throttled for the noise
+ARRIVAL_TOLERANCE = 0.1
+
+# Body chunks written between two bandwidth pauses
+CHUNK_SIZE = 16384
+
+# HELPING FUNCTIONS
+def to_replay_url(url, replay_url):
+    # https://fbref.com/en/... becomes <replay url>/fbref.com/en/..., the path and query stay untouched
+    parts = urlsplit(url)
+
+    return replay_url.rstrip("/") + "/" + parts.netloc + parts.path + ("?" + parts.query if parts.query else "")
+
+def to_original_url(path):
+    if (path.startswith(CONTROL_PATH) or len(path) <= 1):
+        return None
+
+    # Every recorded host is served over https
+    return "https://" + path[1:]
+
+def get_recording_slug(url):
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:archive.CHUNK_HASH_LENGTH]
+
+def get_archive_path(recordings_path):
+    return recordings_path + ARCHIVE_FOLDER_NAME
+
+def read_recordings(recordings_path = RECORDINGS_PATH):
+    recordings_file_path = recordings_path + RECORDINGS_FILE_NAME
+    if (not os.path.exists(recordings_file_path)):
+        return {}
+
+    with open(recordings_file_path, "r", encoding = "utf-8") as file:
+        return json.load(file)
+
+def write_recordings(recordings, recordings_path = RECORDINGS_PATH):
+    os.makedirs(recordings_path, exist_ok = True)
+
+    with open(recordings_path + RECORDINGS_FILE_NAME + ".tmp", "w", encoding = "utf-8") as file:
+        json.dump(recordings, file, indent = 4, sort_keys = True)
+    os.replace(recordings_path + RECORDINGS_FILE_NAME + ".tmp", recordings_path + RECORDINGS_FILE_NAME)
+
+def get_content_type(url):
+    return "application/json" if url.endswith(".json") else "text/html; charset=utf-8"
+
+def parse_limit(text):
+    # host=rate/burst, e.g. fbref.com=0.333/1
+    host, limit = text.split("=")
+    rate, burst = limit.split("/")
+
+    return host, (float(rate), int(burst))
+
+# CLASSES
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, recordings_path = RECORDINGS_PATH, record = False):
+        super().__init__(address, ReplayHandler)
+
+        self.recordings_path = recordings_path
+        self.recordings = read_recordings(recordings_path)
+        self.record = record
+        self.recorder = None
+
+        self.lock = threading.Lock()
+        self.configure()
+
+    def configure(self, faults = None, host_limits = None, seed = 0):
+        # Setting the faults and the per host limits, and starting the counts over, a seed replays the same sequence of faults
+        with self.lock:
+            self.faults = dict(DEFAULT_FAULTS, **(faults or {}))
+            self.host_limits = host_limits
+            self.buckets = {}
+            self.random = random.Random(seed)
+            self.metrics = {}
+
+    def get_url(self):
+        return "http://" + self.server_address[0] + ":" + str(self.server_address[1])
+
+    def count(self, host, name, value = 1):
+        with self.lock:
+            host_metrics = self.metrics.setdefault(host, {"requests": 0, "served": 0, "not_modified": 0, "throttled": 0, "failures": 0, "drops": 0, "misses": 0, "bytes": 0, "first_request": None, "last_request": None})
+            host_metrics[name] += value
+
+    def arrive(self, host):
+        # Counting the request, and taking one of the host's tokens, a request without a token is throttled like the live host would
+        now = time.monotonic()
+        self.count(host, "requests")
+
+        with self.lock:
+            host_metrics = self.metrics[host]
+            host_metrics["first_request"] = host_metrics["first_request"] or now
+            host_metrics["last_request"] = now
+
+            if (self.host_limits is None or host not in self.host_limits):
+                return True
+
+            if (host not in self.buckets):
+                rate, burst = self.host_limits[host]
+                self.buckets[host] = fetcher.TokenBucket(rate, burst)
+            bucket = self.buckets[host]
+
+        return bucket.try_acquire(ARRIVAL_TOLERANCE) == 0
+
+    def draw(self):
+        # The delay and the fault of a request come from the same draws whatever the outcome, so a seeded run replays the same faults
+        with self.lock:
+            delay = max(0, self.faults["latency"] + self.random.uniform(-self.faults["jitter"], self.faults["jitter"]))
+            draw = self.random.random()
+            failure_status = self.random.choice(FAILURE_STATUSES)
+
+        if (draw < self.faults["drop_rate"]):
+            return delay, "drop"
+        if (draw < self.faults["drop_rate"] + self.faults["failure_rate"]):
+            return delay, failure_status
+
+        return delay, None
+
+    def lookup(self, url):
+        # The recordings come first, then the fixtures, then the archived player pages
+        recording = self.recordings.get(url)
+        if (recording is not None):
+            return recording["status"], recording["content_type"], archive.read_page(recording["slug"], get_archive_path(self.recordings_path))
+
+        if (url in FIXTURES):
+            with open(FIXTURES[url], "rb") as file:
+                return 200, get_content_type(url), file.read()
+
+        if (url.startswith(PLAYER_PAGES_PREFIX)):
+            slug = url.rstrip("/").split("/")[-1]
+            if (archive.get_version(slug, PLAYER_PAGES_ARCHIVE_PATH) is not None):
+                return 200, get_content_type(url), archive.read_page(slug, PLAYER_PAGES_ARCHIVE_PATH)
+
+        if (self.record):
+            return self.record_response(url)
+
+        return None
+
+    def record_response(self, url):
+        # Fetching the live page once through the fetcher, its host limits keep the recording polite
+        with self.lock:
+            if (self.recorder is None):
+                self.recorder = fetcher.Fetcher(validators_path = None, replay_url = None)
+
+        result = self.recorder.fetch(url)
+
+        recording = {"status": result.status, "content_type": get_content_type(url), "slug": get_recording_slug(url)}
+
+        # The archived page and its recording are stored together, the archive index is also locked against the other processes writing to it
+        with self.lock:
+            archive.add_page(recording["slug"], result.content, get_archive_path(self.recordings_path))
+            self.recordings[url] = recording
+            write_recordings(self.recordings, self.recordings_path)
+
+        return recording["status"], recording["content_type"], result.content
+
+    def get_metrics(self):
+        # The counts per host, and the rate the host actually saw the requests arrive at
+        summary = {}
+        with self.lock:
+            for host, host_metrics in self.metrics.items():
+                duration = host_metrics["last_request"] - host_metrics["first_request"]
+
+                summary[host] = {name: value for name, value in host_metrics.items() if name not in ["first_request", "last_request"]}
+                summary[host]["request_rate"] = (host_metrics["requests"] - 1) / duration if duration > 0 else 0
+
+        return summary
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_body(self, status, content_type, content, headers = {}):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        # Pacing the body to the bandwidth cap chunk by chunk, without a cap it goes out in one write
+        bandwidth = self.server.faults["bandwidth"]
+        chunk_size = CHUNK_SIZE if bandwidth is not None else max(len(content), 1)
+
+        start = time.perf_counter()
+        for offset in range(0, len(content), chunk_size):
+            self.wfile.write(content[offset:offset + chunk_size])
+
+            if (bandwidth is not None):
+                wait = min(offset + chunk_size, len(content)) / bandwidth - (time.perf_counter() - start)
+                if (wait > 0):
+                    time.sleep(wait)
+
+    def send_json(self, status, content, headers = {}):
+        self.send_body(status, "application/json", json.dumps(content, indent = 4).encode("utf-8"), headers)
+
+    def do_GET(self):
+        if (self.path == CONTROL_PATH + "metrics"):
+            self.send_json(200, self.server.get_metrics())
+            return
+
+        url = to_original_url(self.path)
+        if (url is None):
+            self.send_json(404, {"error": "Unknown path, replayed URLs look like /<host>/<path>"})
+            return
+
+        host = urlsplit(url).hostname or ""
+
+        # The network delay comes before the host even sees the request
+        delay, fault = self.server.draw()
+        time.sleep(delay)
+
+        if (not self.server.arrive(host)):
+            # A throttled client is told when to come back
+            self.server.count(host, "throttled")
+            self.send_json(429, {"error": "Too many requests to " + host}, {"Retry-After": str(self.server.faults["retry_after"])})
+            return
+
+        if (fault == "drop"):
+            self.server.count(host, "drops")
+            self.close_connection = True
+            return
+        if (fault is not None):
+            self.server.count(host, "failures")
+            self.send_json(fault, {"error": "Injected failure"})
+            return
+
+        response = self.server.lookup(url)
+        if (response is None):
+            self.server.count(host, "misses")
+            self.send_json(404, {"error": "No recording of " + url + ", record it with --record"})
+            return
+
+        status, content_type, content = response
+
+        # Answering revalidations like the live hosts, the ETag is the hash the page archive already keys by
+        etag = '"' + archive.get_content_hash(content) + '"'
+        if (self.headers.get("If-None-Match") == etag):
+            self.server.count(host, "not_modified")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.server.count(host, "served")
+        self.server.count(host, "bytes", len(content))
+        self.send_body(status, content_type, content, {"ETag": etag})
+
+    def log_message(self, format, *args):
+        pass
+
+# FUNCTIONS
+def start(host = HOST, port = PORT, faults = None, host_limits = None, seed = 0, recordings_path = RECORDINGS_PATH, record = False):
+    # Serving from a background thread, port 0 picks a free one
+    server = ReplayServer((host, port), recordings_path, record)
+    server.configure(faults, host_limits, seed)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+
+    return server
+
+def add_recording(url, content, status = 200, recordings_path = RECORDINGS_PATH):
+    # Storing a response fetched by other means, e.g. a StatsBomb open data file from a local checkout
+    recordings = read_recordings(recordings_path)
+    recordings[url] = {"status": status, "content_type": get_content_type(url), "slug": get_recording_slug(url)}
+    archive.add_page(recordings[url]["slug"], content, get_archive_path(recordings_path))
+    write_recordings(recordings, recordings_path)
+
+# RUN
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Replay recorded FBref, Transfermarkt and StatsBomb responses with injected latency, bandwidth caps, rate limits and failures")
+    parser.add_argument("--host", default = HOST)
+    parser.add_argument("--port", type = int, default = PORT)
+    parser.add_argument("--latency", type = float, default = DEFAULT_FAULTS["latency"], help = "seconds before every response")
+    parser.add_argument("--jitter", type = float, default = DEFAULT_FAULTS["jitter"], help = "seconds of uniform noise around the latency")
+    parser.add_argument("--bandwidth", type = float, default = DEFAULT_FAULTS["bandwidth"], help = "bytes per second of every response body")
+    parser.add_argument("--failure-rate", type = float, default = DEFAULT_FAULTS["failure_rate"], help = "share of requests answered with a 5xx")
+    parser.add_argument("--drop-rate", type = float, default = DEFAULT_FAULTS["drop_rate"], help = "share of requests whose connection gets closed")
+    parser.add_argument("--retry-after", type = int, default = DEFAULT_FAULTS["retry_after"], help = "seconds sent along with a 429")
+    parser.add_argument("--rate-limit", action = "append", type = parse_limit, default = None, help = "host=rate/burst, the fetcher's limits by default")
+    parser.add_argument("--no-rate-limit", action = "store_true", help = "never answer with a 429")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--record", action = "store_true", help = "fetch and record the live response of every URL without a recording")
+    parser.add_argument("--add", nargs = 2, metavar = ("URL", "FILE"), action = "append", default = [], help = "record a file as the response of a URL")
+    args = parser.parse_args()
+
+    for url, path in args.add:
+        with open(path, "rb") as file:
+            add_recording(url, file.read())
+        print("Recorded " + path + " for " + url)
+
+    host_limits = None if args.no_rate_limit else dict(args.rate_limit) if args.rate_limit is not None else fetcher.HOST_LIMITS
+    faults = {"latency": args.latency, "jitter": args.jitter, "bandwidth": args.bandwidth, "failure_rate": args.failure_rate, "drop_rate": args.drop_rate, "retry_after": args.retry_after}
+
+    server = ReplayServer((args.host, args.port), record = args.record)
+    server.configure(faults, host_limits, args.seed)
+    print("Replaying on {}, point the scrapers at it with REPLAY_URL={}, metrics on {}{}metrics".format(server.get_url(), server.get_url(), server.get_url(), CONTROL_PATH))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
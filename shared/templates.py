@@ -0,0 +1,105 @@
+# IMPORTS
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PatchCollection
+
+from shared import assets
+
+# CONSTANTS
+BACKGROUND_COLOR = "#15141b"
+PRIMARY_COLOR = "#ffffff"
+
+FONT_FAMILY = "sans-serif"
+
+LOGO_FILE_PATH = "logo.png"
+LOGO_SIZE = (100, 100)
+
+# Crests are stored at roughly the pixel size they are shown at, so the figure only ever resamples small images
+CREST_SCALE = 0.35
+
+# matplotlib defaults the old plt.plot lines and the circle/arc patches were drawn with
+LINE_WIDTH = 1.5
+PATCH_LINE_WIDTH = 1.0
+
+# Static parts built once per process and reused by every figure
+cache = {}
+
+# FUNCTIONS
+def get_logo():
+    # Decoded and resized once, then read from the memory-mapped asset atlas
+    return assets.load_image(LOGO_FILE_PATH, LOGO_SIZE)
+
+def get_crests(paths, scale = CREST_SCALE):
+    return assets.load_images([(path, None, scale) for path in paths])
+
+def get_arc(centre, radius, theta1, theta2, points = 64):
+    # Arcs as polylines, so they fit into the same collection as the straight lines
+    if (theta2 < theta1):
+        theta2 += 360
+
+    angles = np.radians(np.linspace(theta1, theta2, points))
+
+    return np.column_stack([centre[0] + radius * np.cos(angles), centre[1] + radius * np.sin(angles)])
+
+def get_pitch_lines():
+    if ("pitch_lines" not in cache):
+        straight_lines = [
+            # Pitch outline & Centre line
+            [(0, 0), (0, 90)], [(0, 90), (130, 90)], [(130, 90), (130, 0)], [(130, 0), (0, 0)], [(65, 0), (65, 90)],
+
+            # Left penalty area
+            [(16.5, 65), (16.5, 25)], [(0, 65), (16.5, 65)], [(16.5, 25), (0, 25)],
+
+            # Right penalty area
+            [(130, 65), (113.5, 65)], [(113.5, 65), (113.5, 25)], [(113.5, 25), (130, 25)],
+
+            # Left 6-yard box
+            [(0, 54), (5.5, 54)], [(5.5, 54), (5.5, 36)], [(5.5, 36), (0.5, 36)],
+
+            # Right 6-yard box
+            [(130, 54), (124.5, 54)], [(124.5, 54), (124.5, 36)], [(124.5, 36), (130, 36)],
+        ]
+
+        # Centre circle & penalty arcs
+        curved_lines = [get_arc((65, 45), 9.15, 0, 360), get_arc((11, 45), 9.15, 310, 50), get_arc((119, 45), 9.15, 130, 230)]
+
+        cache["pitch_lines"] = ([np.array(line, dtype = float) for line in straight_lines], curved_lines)
+
+    return cache["pitch_lines"]
+
+def draw_pitch(ax, color = PRIMARY_COLOR):
+    # The whole pitch is three collections, the curves and spots stay below the passes like the old patches did
+    straight_lines, curved_lines = get_pitch_lines()
+
+    ax.add_collection(LineCollection(straight_lines, colors = color, linewidths = LINE_WIDTH, zorder = 2))
+    ax.add_collection(LineCollection(curved_lines, colors = color, linewidths = PATCH_LINE_WIDTH, zorder = 1))
+    ax.add_collection(PatchCollection([plt.Circle((65, 45), 0.8), plt.Circle((11, 45), 0.8), plt.Circle((119, 45), 0.8)], facecolor = color, edgecolor = color, linewidth = PATCH_LINE_WIDTH, zorder = 1))
+
+    ax.update_datalim(np.concatenate(straight_lines))
+    ax.autoscale_view()
+
+    # Tidying axes
+    ax.axis("off")
+
+def create_figure(size, nrows = 1, ncols = 1):
+    # Creating the plot area with the branded background and logo
+    fig, axes = plt.subplots(nrows, ncols)
+
+    fig.set_size_inches(*size)
+    fig.set_facecolor(BACKGROUND_COLOR)
+    fig.set_edgecolor(PRIMARY_COLOR)
+
+    fig.figimage(get_logo(), xo = 17, yo = -1)
+
+    return fig, axes
+
+def add_title(fig, title, ax = None, subtitle = None):
+    fig.suptitle(title, y = 0.969, fontsize = 20, fontweight = "bold", family = FONT_FAMILY, color = PRIMARY_COLOR)
+
+    if (subtitle is not None):
+        ax.text(0.5, 1.055, subtitle, fontsize = 15, transform = ax.transAxes, fontweight = "regular", family = FONT_FAMILY, color = PRIMARY_COLOR, ha = "center", va = "center")
+
+def add_source(ax, source, label_position, source_position, label_ha = "right", rotation = 0):
+    # Adding data source text
+    ax.text(label_position[0], label_position[1], "Source:", transform = ax.transAxes, family = FONT_FAMILY, ha = label_ha, va = "center", color = PRIMARY_COLOR, fontweight = "regular", fontsize = 12, rotation = rotation)
+    ax.text(source_position[0], source_position[1], source, transform = ax.transAxes, family = FONT_FAMILY, ha = "right", va = "center", color = PRIMARY_COLOR, fontweight = "bold", fontsize = 12, rotation = rotation)